@@ -30,6 +30,11 @@ from datetime import datetime
 import shutil
 import urllib3
 import re
+import sys
+
+sys.path.append('../')
+
+from rhombus_federated_token import session_token_fetcher, shared_token_manager
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # MUST REPLACE THESE VALUES
@@ -174,6 +179,24 @@ def get_frame_uri(camera_uuid, timestamp_ms=None):
         log(f"Error retrieving frame URI: {str(e)}", "ERROR")
         return None
 
+def get_token_manager():
+    """Get the federated session token manager shared by every batch of image downloads, so a new token is only generated when the last one is about to expire"""
+
+    def create_fetcher():
+        session = requests.session()
+        session.verify = False
+
+        session.headers.update({
+            "Content-Type": "application/json",
+            "x-auth-scheme": "api-token",
+            "x-auth-apikey": RHOMBUS_API_KEY
+        })
+
+        return session_token_fetcher(session, f"{RHOMBUS_BASE_URL}/org/generateFederatedSessionToken")
+
+    # 2 hours to ensure it doesn't expire
+    return shared_token_manager(RHOMBUS_BASE_URL, create_fetcher, duration_sec=7200)
+
 def download_images_with_shared_token(image_urls):
     """Download images using the federated session token"""
     downloaded_images = {}
@@ -189,18 +212,11 @@ def download_images_with_shared_token(image_urls):
             "x-auth-apikey": RHOMBUS_API_KEY
         })
         
-        token_req_payload = {"durationSec": 7200}  # 2 hours to ensure it doesn't expire
-        token_resp = session.post(
-            f"{RHOMBUS_BASE_URL}/org/generateFederatedSessionToken",
-            json=token_req_payload
-        )
-        
-        if token_resp.status_code != 200:
-            log(f"Failed to retrieve federated session token: {token_resp.content}", "ERROR")
+        try:
+            federated_session_token = get_token_manager().get_token()
+        except Exception as e:
+            log(f"Failed to retrieve federated session token: {str(e)}", "ERROR")
             return downloaded_images
-            
-        federated_session_token = token_resp.json()["federatedSessionToken"]
-        log(f"Successfully generated federated session token")
         
         # Set the cookie for all future requests in this session
         cookie = {"RSESSIONID": f"RFT:{federated_session_token}"}
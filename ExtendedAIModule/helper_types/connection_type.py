@@ -24,9 +24,13 @@ from enum import Enum, auto
 
 
 class ConnectionType(Enum):
-    """Enum to declare whether to use WAN or LAN. 
+    """Enum to declare whether to use WAN, LAN or AUTO, which races the two and uses whichever is faster.
 
 	 NOTE: It is almost always recommended to use LAN over WAN because it will be faster and use less resources however if you are running this node server on a different connection than your camera for whatever reason then you must use WAN
     """
     WAN = auto()
     LAN = auto()
+
+    # AUTO requests the VOD over both the LAN and the WAN connection, starts on whichever answers first and switches to
+    # the other while downloading if it turns out to be faster
+    AUTO = auto()
@@ -21,27 +21,20 @@
 ###################################################################################
 
 # Import type hints
-from threading import Lock
-from typing import List
+from typing import Dict, List, Union
 
 # Import sys and argparse for cmd args
 import sys
 import argparse
 
-# Import requests to create our http client
-import requests
-
-# Import timeit so that we can time execution time
-from timeit import default_timer as timer
-
-# Import time so that we can sleep
-import time
-
 # Import OpenCV to create our client
 import cv2
 
 sys.path.append('../')
 
+# Import the shared media client to create our http client
+from rhombus_media_client import MediaClient
+
 # Import RhombusAPI to create our Api Client
 import RhombusAPI as rapi
 
@@ -57,37 +50,40 @@ from logging_utils.colors import LogColors
 # Import all of our services which will do the heavy lifting
 from rhombus_services.media_uri_fetcher import fetch_media_uris, fetch_federated_token
 from rhombus_services.vod_fetcher import fetch_vod, fetch_alert_vod
-from rhombus_services.frame_generator import generate_frames
-from rhombus_services.classifier import classify_directory
+from rhombus_services.frame_generator import decode_frames
+from rhombus_services.classifier import classify_frame_stream
 from rhombus_services.rhombus_finalizer import rhombus_finalizer
-from rhombus_services.cleanup import cleanup
 from rhombus_services.arg_parser import parse_arguments
+from rhombus_services.clip_pipeline import ClipPipeline, ClipJob, DownloadedClip
+from rhombus_services.poll_scheduler import PollScheduler
 
 
 class Main:
     """Entry point class, which handles all of the execution of requests and processing of object detection
 
     :attribute __api_key: The Api Key that is specified when running the application
-    :attribute __camera_uuid: The Camera UUID that is specified when running the application
+    :attribute __camera_uuids: The Camera UUIDs that are specified when running the application
     :attribute __interval: The interval in seconds of fetching clips from the VOD, by default 10 second clips fetched every 10 seconds
     :attribute __connection_type: The ConnectionType that is specified when running the application
     :attribute __api_client: The RhombusAPI client that will be used throughout the lifetime of our application
     :attribute __http_client: The HTTP Client that will be used for fetching clips throughout the lifetime of our application
-    :attribute __yolo_net: The YOLO classifier neural net that will be used throughout the lifetime of our application
     :attribute __coco_classes: All of the available COCO class names, viewable in yolo/coco.names
-    :attribute __mutex: The mutex lock that controls the YOLO classifier to prevent it from being used at the same time by multiple webhook events.
+    :attribute __batch_size: The number of frames that are classified in one forward pass of the YOLO classifier
+    :attribute __pipeline: The pipeline which downloads and classifies the clips in the background, so that the next clip is downloaded while the last one is classified
+    :attribute __uris: The VOD URIs of every polled camera, which stay the same so they are only fetched once
     """
 
     __api_key: str
     __api_client: rapi.ApiClient
     __connection_type: ConnectionType
-    __camera_uuid: str
+    __camera_uuids: List[str]
     __interval: int = 10
-    __http_client: requests.sessions.Session
-    __yolo_net: cv2.dnn_Net
+    __http_client: MediaClient
     __coco_classes: List[str]
+    __batch_size: int
     __should_poll: bool = False
-    __mutex = Lock()
+    __pipeline: ClipPipeline
+    __uris: Dict[str, Union[str, List[str]]]
 
     def __init__(self, args: argparse.Namespace) -> None:
         """Constructor for the Main class, which will initialize all of the clients and arguments
@@ -98,9 +94,10 @@ class Main:
         # Save the cmd args in our runner
         self.__api_key = args.api_key
         self.__should_poll = args.continuous
+        self.__batch_size = args.batch_size
 
         if self.__should_poll:
-            self.__camera_uuid = args.camera_uuid
+            self.__camera_uuids = args.camera_uuid or []
             self.__interval = args.interval
 
             # By default the connection type is LAN, unless otherwise specified by the user
@@ -112,6 +109,10 @@ class Main:
                 print(
                     LogColors.WARNING + "Running in WAN mode! This is not recommended if it can be avoided." + LogColors.ENDC)
 
+            # If the user specifies -t AUTO, then we race LAN and WAN and use whichever is faster
+            elif args.connection_type == "AUTO":
+                self.__connection_type = ConnectionType.AUTO
+
         # Create an API Client and Configuration which will be used throughout the program
         config: rapi.Configuration = rapi.Configuration()
         config.api_key['x-auth-apikey'] = args.api_key
@@ -119,20 +120,32 @@ class Main:
         # We need to set the additional header of x-auth-scheme, otherwise we will receive 401
         self.__api_client = rapi.ApiClient(configuration=config, header_name="x-auth-scheme", header_value="api-token")
 
-        # Create an HTTP client
-        self.__http_client = requests.sessions.Session()
-
-        # Create our neural net
-        self.__yolo_net = cv2.dnn.readNetFromDarknet('yolo/yolov3.cfg', 'yolo/yolov3.weights')
-        self.__yolo_net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        # Create an HTTP client. This pools and keeps alive our connections to the cameras for every clip we download
+        self.__http_client = MediaClient()
 
         # Load the classes from the coco.names file
         self.__coco_classes = open('yolo/coco.names').read().strip().split('\n')
 
-    def __parse_and_classify(self, clip_path: str, directory_path: str, start_time_sec: int, duration_sec: int,
-                             device_uuid: str) -> None:
+        # Clips are downloaded and classified in the background, every inference worker loads its own neural net
+        # which it uses for the clips of every camera
+        self.__pipeline = ClipPipeline(self.__load_net, self.__process_clip, download_workers=args.download_workers,
+                                       inference_workers=args.inference_workers, queue_size=args.queue_size)
+
+    @staticmethod
+    def __load_net() -> cv2.dnn_Net:
+        """Load a new YOLO neural net.
+
+        :return: Returns the neural net
+        """
+        yolo_net = cv2.dnn.readNetFromDarknet('yolo/yolov3.cfg', 'yolo/yolov3.weights')
+        yolo_net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        return yolo_net
+
+    def __parse_and_classify(self, yolo_net: cv2.dnn_Net, clip_path: str, directory_path: str, start_time_sec: int,
+                             duration_sec: int, device_uuid: str) -> None:
         """Classifies a directory containing a downloaded video clip and sends the bounding box data to Rhombus.
 
+        :param yolo_net: The YOLO neural net to classify with, which must not be used by anything else at the same time.
         :param clip_path: The path to the actual mp4 video clip that was downloaded.
         :param directory_path: The parent directory of the mp4 video clip where we can output things like frames and whatnot.
         :param start_time_sec: The start time in seconds since epoch.
@@ -140,105 +153,108 @@ class Main:
         :param device_uuid: The camera UUID that the clip was downloaded from.
         """
 
-        print("Generating frames...")
-
-        # Generate a bunch of frames from our downloaded mp4, these will be put in vodRes.directoryPath/FRAME.jpg and
-        # the number of them will depend on the FPS, which is set right now to 3
-        generate_frames(clip_path=clip_path, directory_path=directory_path, FPS=3.0)
+        print("Classifying frames...")
 
-        print("Classifying Images...")
-
-        # Classify all of the frames generated in the vodRes.directoryPath
-        boxes = classify_directory(self.__yolo_net, self.__coco_classes, directory_path, start_time_sec,
-                                   duration_sec)
+        # Decode frames from our downloaded mp4 straight into memory, the number of them will depend on the FPS which
+        # is set right now to 3. Each batch of frames is classified as soon as it is decoded, so none of them ever have
+        # to be written to disk as JPEGs and read back in again
+        frames = decode_frames(clip_path=clip_path, FPS=3.0)
+        boxes = classify_frame_stream(yolo_net, self.__coco_classes, frames, start_time_sec, self.__batch_size)
 
         print("Sending the data to Rhombus...")
 
         # Send all of our bounding boxes to rhombus
         rhombus_finalizer(self.__api_client, device_uuid, boxes)
 
-    def __webhook_run(self, data: WebhookEvent) -> None:
-        """Response to webhook events by downloading the associated video clip.
+    def __webhook_run(self, data: WebhookEvent) -> bool:
+        """Response to webhook events by adding the associated video clip to the pipeline. This returns straight away,
+        the clip is downloaded and classified in the background.
 
         :param data: The webhook event data.
+        :return: Returns False if the pipeline is full and the event was turned away.
         """
-        print("Fetching federated token...")
 
-        token = fetch_federated_token(api_client=self.__api_client)
+        def download() -> DownloadedClip:
+            print("Fetching federated token...")
+
+            token = fetch_federated_token(api_client=self.__api_client)
 
-        print("Downloading the VOD...")
+            print("Downloading the VOD...")
 
-        # Download the mp4 of the last [duration] seconds starting from Now - [duration] seconds ago
-        clip_path, directory_path = fetch_alert_vod(api_key=self.__api_key, federated_token=token,
-                                                    http_client=self.__http_client, uri=data.mpd_uri,
-                                                    duration_sec=data.duration_sec, alert_uuid=data.alert_uuid)
+            # Download the mp4 of the alert
+            clip_path, directory_path = fetch_alert_vod(api_key=self.__api_key, federated_token=token,
+                                                        http_client=self.__http_client, uri=data.mpd_uri,
+                                                        duration_sec=data.duration_sec, alert_uuid=data.alert_uuid)
 
-        with self.__mutex:
-            # Parse and classify the newly downloaded video clip.
-            self.__parse_and_classify(clip_path, directory_path, int(data.timestamp_ms / 1000), data.duration_sec,
-                                      data.device_uuid)
+            return DownloadedClip(clip_path, directory_path, int(data.timestamp_ms / 1000), data.duration_sec,
+                                  data.device_uuid)
 
-            print("Cleaning up!")
+        return self.__pipeline.submit(ClipJob("alert " + data.alert_uuid, download))
 
-            # Remove the downloaded files, the mp4 and jpgs
-            cleanup(directory_path)
+    def __process_clip(self, yolo_net: cv2.dnn_Net, clip: DownloadedClip) -> None:
+        """Parse and classify a downloaded video clip from the pipeline. The pipeline removes the downloaded files afterwards.
 
-    def __interval_runner(self) -> None:
-        """Executes the services that will download the clip, classify it, and upload the bounding boxes to Rhombus."""
+        :param yolo_net: The neural net of the inference worker that is processing the clip.
+        :param clip: The downloaded video clip.
+        """
+        self.__parse_and_classify(yolo_net, clip.clip_path, clip.directory_path, clip.start_time_sec, clip.duration_sec,
+                                  clip.device_uuid)
+
+    def __poll_run(self) -> None:
+        """Polls every camera once every interval, staggered across the interval. The clips are downloaded,
+        classified and their bounding boxes uploaded to Rhombus in the pipeline."""
 
         # Check to make sure that the user put in the parameters properly before proceeding.
-        if self.__camera_uuid is None:
+        if len(self.__camera_uuids) == 0:
             print(LogColors.ERROR + "No camera UUID has been specified. When running in poll mode, make sure "
-                                    "you are using the --camera_uuid option to specify which camera to poll "
+                                    "you are using the --camera_uuid option to specify which cameras to poll "
                                     "video clips from. Run this application with --help for more info.")
             return
 
-        # Start a timer to time our execution time
-        start = timer()
-
         print("Fetching URIs...")
 
-        # Get the media URIs from rhombus for our camera, this is done every sequence so that we don't have to worry
-        # about federated tokens. These URIs stay the same, but this method will also create our federated tokens
-        uri, token = fetch_media_uris(api_client=self.__api_client, camera_uuid=self.__camera_uuid, duration=120,
-                                      connection_type=self.__connection_type)
+        # Get the media URIs from rhombus for every camera. These URIs stay the same, so they are only fetched once.
+        # The federated token is shared by every camera and only regenerated when it is about to expire
+        self.__uris = {}
+        for camera_uuid in self.__camera_uuids:
+            self.__uris[camera_uuid], _ = fetch_media_uris(api_client=self.__api_client, camera_uuid=camera_uuid,
+                                                           duration=120, connection_type=self.__connection_type)
 
-        print("Downloading the VOD...")
+        self.__pipeline.start()
 
-        # Download the mp4 of the last [duration] seconds starting from Now - [duration] seconds ago
-        clip_path, directory_path, start_time_sec = fetch_vod(api_key=self.__api_key, federated_token=token,
-                                                              http_client=self.__http_client, uri=uri,
-                                                              connection_type=self.__connection_type,
-                                                              duration=self.__interval)
+        # Poll forever
+        PollScheduler(self.__camera_uuids, self.__interval, self.__poll_camera).run()
 
-        # Parse and classify the newly downloaded VOD.
-        self.__parse_and_classify(clip_path, directory_path, start_time_sec, self.__interval, self.__camera_uuid)
+    def __poll_camera(self, camera_uuid: str, start_time_sec: int) -> None:
+        """Add the clip of a camera for one interval to the pipeline.
 
-        print("Cleaning up!")
+        :param camera_uuid: The camera to fetch the clip from.
+        :param start_time_sec: The start time of the clip in seconds since epoch.
+        """
 
-        # Remove the downloaded files, the mp4 and jpgs
-        cleanup(directory_path)
+        def download() -> DownloadedClip:
+            # Get the shared federated token
+            token = fetch_federated_token(api_client=self.__api_client)
 
-        # End timer
-        end = timer()
+            print("Downloading the VOD...")
 
-        # Get the total execution time
-        total_time = end - start
+            # Download the mp4 of the interval which starts at start_time_sec
+            clip_path, directory_path, _ = fetch_vod(api_key=self.__api_key, federated_token=token,
+                                                     http_client=self.__http_client, uri=self.__uris[camera_uuid],
+                                                     connection_type=self.__connection_type,
+                                                     duration=self.__interval, camera_uuid=camera_uuid,
+                                                     start_time=start_time_sec)
 
-        # If we are underneath our interval, then we will want to sleep. Otherwise if we are over our interval,
-        # then that means we are lagging behind and we need to process the next interval immediately
-        if total_time < self.__interval:
-            # Sleep for remaining time
-            time.sleep(self.__interval - total_time)
+            return DownloadedClip(clip_path, directory_path, start_time_sec, self.__interval, camera_uuid)
 
-        # Run again
-        self.__interval_runner()
+        self.__pipeline.submit(ClipJob("camera " + camera_uuid + " at " + str(start_time_sec), download))
 
     def execute(self):
         """Starts the runner, which will create a scheduled loop of runners."""
         if self.__should_poll:
-            self.__interval_runner()
+            self.__poll_run()
         else:
+            self.__pipeline.start()
             init_webhook(__name__, self.__api_client, self.__webhook_run)
 
 
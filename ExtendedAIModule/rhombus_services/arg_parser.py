@@ -46,23 +46,46 @@ def parse_arguments(argv: List[str]) -> argparse.Namespace:
                              'objects. If specified instead of registering a webhook and classifying through events '
                              'it will loop and classify continuously.')
 
-    # The --camera_uuid or -c param will hold the UUID of the camera which will be processed
-    parser.add_argument('--camera_uuid', '-c', type=str, required=False,
-                        help='Device Id to pull footage from. Required if continuous.')
+    # The --camera_uuid or -c param will hold the UUIDs of the cameras which will be processed
+    parser.add_argument('--camera_uuid', '-c', type=str, required=False, nargs='+',
+                        help='Device Ids to pull footage from, separated by spaces. Required if continuous.')
 
     # The --interval or -i param will hold how often to poll the camera for new footage in seconds, by default 10
     # seconds
     parser.add_argument('--interval', '-i', type=int, required=False,
-                        help='How often to poll the camera for new footage in seconds, by default 10 seconds. Ignored '
-                             'if not continuous.',
+                        help='How often to poll each camera for new footage in seconds, by default 10 seconds. The '
+                             'cameras are polled at different times across the interval. Ignored if not continuous.',
                         default=10)
 
     # The --connection_type or -t param will hold the ConnectionType to the camera. It is not recommended to run in
     # WAN mode unless this python server is running on a separate network from the camera
     parser.add_argument('--connection_type', '-t', type=str, required=False,
-                        help='The connection type to the camera, either LAN or WAN (default LAN). Ignored if not '
+                        help='The connection type to the camera, either LAN, WAN or AUTO to use whichever is faster '
+                             '(default LAN). Ignored if not '
                              'continuous as webhook downloading is always through WAN.',
                         default="LAN")
 
+    # The --batch_size or -b param will hold how many frames are classified in one forward pass of the neural net,
+    # by default 8. Bigger batches are faster but use more memory
+    parser.add_argument('--batch_size', '-b', type=int, required=False, default=8,
+                        help='How many frames to classify in one forward pass of the neural net (default 8). Bigger '
+                             'batches are faster but use more memory.')
+
+    # The --download_workers param will hold how many clips are downloaded at the same time, by default 2
+    parser.add_argument('--download_workers', type=int, required=False, default=2,
+                        help='How many clips to download at the same time (default 2).')
+
+    # The --inference_workers param will hold how many clips are classified at the same time, by default 1.
+    # Every worker loads its own neural net, so every worker uses a few hundred MB of memory
+    parser.add_argument('--inference_workers', type=int, required=False, default=1,
+                        help='How many clips to classify at the same time (default 1). Every worker loads its own '
+                             'neural net.')
+
+    # The --queue_size param will hold how many clips can wait to be downloaded, and how many downloaded clips can wait
+    # to be classified, by default 16. Clips are turned away while the queue is full, webhook events with a 503
+    parser.add_argument('--queue_size', type=int, required=False, default=16,
+                        help='How many clips can wait to be downloaded, and how many downloaded clips can wait to be '
+                             'classified (default 16). Clips are turned away while the queue is full.')
+
     # Return all of our arguments
     return parser.parse_args(argv)
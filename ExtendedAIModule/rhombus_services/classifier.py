@@ -21,16 +21,13 @@
 ###################################################################################
 
 # Import type hints
-from typing import List
+from typing import Iterable, List
 from typing import Tuple
 
 # Import Numpy and OpenCV for neural network processing
 import numpy as np
 import cv2
 
-# Import glob to get all of the frames in the clip directory
-import glob
-
 # Import FootageBoundingBoxType to create our list of bounding boxes
 from RhombusAPI.models.footage_bounding_box_type import FootageBoundingBoxType
 from RhombusAPI.models.activity_enum import ActivityEnum
@@ -67,63 +64,42 @@ class BoundingBox:
         self.timestamp = timestamp
 
 
-def classify_image(yolo_net: cv2.dnn_Net, coco_classes: List[str], layer_names: List[str], file_path: str,
-                   timestamp: int, confidence_threshold: float = 0.7) -> Tuple[List[BoundingBox], Vec2]:
-    """Classify a specific JPEG image from a given file_path
+# The number of frames that are classified in one forward pass of the neural net by default
+DEFAULT_BATCH_SIZE = 8
 
-    :param yolo_net: The YOLO neural network that is loaded at startup
+
+def decode_detections(detections: np.ndarray, coco_classes: List[str], dimensions: Vec2, timestamp: int,
+                      confidence_threshold: float) -> List[BoundingBox]:
+    """Turns the raw detections of the neural net for one image into bounding boxes
+
+    :param detections: The detections of every output layer for the image, one row per detection. Each row is the
+                       center x, center y, width and height of the box relative to the image, the objectness, and then
+                       the score of every class
     :param coco_classes: The COCO class names that is loaded at startup
-    :param layer_names: The list of layer names in the neural net
-    :param file_path: The path of the JPEG image to classify
-    :param timestamp: The timestamp in ms at which this JPEG appears
-    :param confidence_threshold: The minimum threshold at which a bounding box will be added, default is 0.7
-    :return: Returns the list of bounding boxes found in the JPEG and the dimensions (width and height) of the JPEG
+    :param dimensions: The dimensions of the image
+    :param timestamp: The timestamp in ms at which this image appears
+    :param confidence_threshold: The minimum threshold at which a bounding box will be added
+    :return: Returns the list of bounding boxes found in the image
     """
 
-    # Load the image from the file path through OpenCV
-    img = cv2.imread(file_path)
+    # Get the scores, classID, and confidence of every detection at once
+    scores = detections[:, 5:]
+    class_ids = np.argmax(scores, axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
 
-    # Load the blob from our image
-    blob = cv2.dnn.blobFromImage(img, 1 / 255.0, (416, 416), swapRB=True, crop=False)
-
-    # Set this blob as our input into COCO
-    yolo_net.setInput(blob)
+    # We are only going to keep the boxes that pass our confidence_threshold
+    keep = confidences > confidence_threshold
 
-    # Set the output layer using our layer_names
-    outputs = yolo_net.forward(layer_names)
+    # Get our boxes in pixels, with the position being the top left instead of the center
+    box = (detections[keep, :4] * np.array([dimensions.x, dimensions.y, dimensions.x, dimensions.y])).astype("int")
+    center_x, center_y, width, height = box[:, 0], box[:, 1], box[:, 2], box[:, 3]
+    x = (center_x - width / 2).astype("int")
+    y = (center_y - height / 2).astype("int")
 
-    # Get the dimensions of our image
-    dimensions = Vec2(0, 0)
-    dimensions.x, dimensions.y = img.shape[:2]
-
-    # These are the output lists which we will use to construct our bounding boxes
-    _boxes: List[list[int]] = []
-    _confidences: List[float] = []
-    _classIDs = []
-
-    # Loop through all of our outputs
-    for output in outputs:
-        for detection in output:
-            # Get our scores, classID, and confidence
-            scores = detection[5:]
-            classID = np.argmax(scores)
-            confidence = scores[classID]
-
-            # We are only going to add the boxes that pass our confidence_threshold
-            if confidence > confidence_threshold:
-                # Get our box
-                box = detection[:4] * np.array([dimensions.x, dimensions.y, dimensions.x, dimensions.y])
-                (center_x, center_y, width, height) = box.astype("int")
-                x = int(center_x - (width / 2))
-                y = int(center_y - (height / 2))
-
-                # Construct a list of ints to represent our box
-                box = [x, y, int(width), int(height)]
-
-                # Append all of our data to our lists
-                _boxes.append(box)
-                _confidences.append(float(confidence))
-                _classIDs.append(classID)
+    # These are the lists which NMS takes to construct our bounding boxes
+    _boxes: List[List[int]] = np.stack([x, y, width, height], axis=1).tolist()
+    _confidences: List[float] = confidences[keep].tolist()
+    _classIDs: List[int] = class_ids[keep].tolist()
 
     # Gets the indices of our boxes using non maximum suppression. We are just using 0.4 as the threshold for this example, however this is can obviously be configured
     indices = cv2.dnn.NMSBoxes(_boxes, _confidences, confidence_threshold, 0.4)
@@ -133,10 +109,10 @@ def classify_image(yolo_net: cv2.dnn_Net, coco_classes: List[str], layer_names:
 
     # Only process our indices if there actually are any elements
     if (len(indices) == 0):
-        return boxes, dimensions
+        return boxes
 
     # Loop through our indices
-    for i in indices.flatten():
+    for i in np.array(indices).flatten():
         # X and Y position of our box
         (x, y) = (_boxes[i][0], _boxes[i][1])
 
@@ -148,56 +124,69 @@ def classify_image(yolo_net: cv2.dnn_Net, coco_classes: List[str], layer_names:
                           timestamp=timestamp)
         boxes.append(box)
 
-    # Return our data
-    return boxes, dimensions
+    return boxes
 
 
-def classify_directory(yolo_net: cv2.dnn_Net, coco_classes: List[str], directory: str, start_time: int,
-                       duration: int) -> List[FootageBoundingBoxType]:
-    """Classify all frames in the directory. 
+def classify_frames(yolo_net: cv2.dnn_Net, coco_classes: List[str], layer_names: List[str], frames: List[np.ndarray],
+                    timestamps: List[int], confidence_threshold: float = 0.7) -> Tuple[List[BoundingBox], Vec2]:
+    """Classify a batch of frames with one forward pass of the neural net, which is a lot faster than classifying
+    them one by one since the overhead of each pass is shared by the whole batch
 
     :param yolo_net: The YOLO neural network that is loaded at startup
     :param coco_classes: The COCO class names that is loaded at startup
-    :param directory: The directory containing the clip.mp4 and frame JPEGs to process. This is normally "res/<TIMESTAMP_SECONDS>/" 
-    :param start_time: The start time in seconds of our clip.mp4
-    :param duration: The duration in seconds of our clip
-    :return: Returns the list of FootageBoundingBoxType which we can then just send to Rhombus to create the bounding boxes on the console
+    :param layer_names: The list of layer names in the neural net
+    :param frames: The BGR frames to classify
+    :param timestamps: The timestamp in ms at which each frame appears
+    :param confidence_threshold: The minimum threshold at which a bounding box will be added, default is 0.7
+    :return: Returns the list of bounding boxes found in all of the frames and the dimensions (width and height) of the last frame
     """
 
-    # Get the names of the layers in our net
-    layer_names: List[str] = yolo_net.getLayerNames()
-    layer_names = [layer_names[i - 1] for i in yolo_net.getUnconnectedOutLayers()]
+    # Load one blob holding all of our frames
+    blob = cv2.dnn.blobFromImages(frames, 1 / 255.0, (416, 416), swapRB=True, crop=False)
 
-    # Get all of the JPEGs in our directory
-    files: List[str] = glob.glob(directory + "*.jpg")
+    # Set this blob as our input into COCO
+    yolo_net.setInput(blob)
 
-    # Sort these files so that we make sure we are processing frames in order
-    files = sorted(files, key=str.lower)
+    # Set the output layer using our layer_names
+    outputs = yolo_net.forward(layer_names)
+
+    # Each output layer gives back the detections of every frame in the batch, but with only one frame there is no batch dimension
+    outputs = [output.reshape(len(frames), -1, output.shape[-1]) for output in outputs]
 
-    # Create a sort of megalist of Bounding boxes which will hold all of the BoundingBoxes of all of the frames
     boxes: List[BoundingBox] = []
+    dimensions = Vec2(0, 0)
 
-    # The final dimensions of our image
-    dimensions: Vec2 = Vec2(0, 0)
+    for i in range(len(frames)):
+        # Get the dimensions of our frame
+        dimensions = Vec2(0, 0)
+        dimensions.x, dimensions.y = frames[i].shape[:2]
 
-    # Loop through all of our files
-    for i in range(len(files)):
-        # The file path
-        file = files[i]
+        # Put the detections of every output layer for this frame together and turn them into bounding boxes
+        detections = np.concatenate([output[i] for output in outputs])
+        boxes = boxes + decode_detections(detections, coco_classes, dimensions, timestamps[i], confidence_threshold)
 
-        # Get the timestamp of our frame, which will be the start_time in seconds + some offset
-        # The offset will just be the index / the number of files * our duration, that way we can see what fraction of the way we are through our clip just by looking at the index
-        # We also will multiply everything by 1000 since the timestamp has to be in ms, and right now we are in seconds
-        timestamp = (start_time + (i / len(files)) * duration) * 1000
+    # Return our data
+    return boxes, dimensions
 
-        # Classify our JPEG
-        res, dim = classify_image(yolo_net, coco_classes, layer_names, file, int(timestamp))
 
-        # Add those results to our megalist
-        boxes = boxes + res
+def get_output_layer_names(yolo_net: cv2.dnn_Net) -> List[str]:
+    """Get the names of the output layers of the neural net
+
+    :param yolo_net: The YOLO neural network that is loaded at startup
+    :return: Returns the names of the layers whose outputs hold the detections
+    """
+
+    layer_names: List[str] = yolo_net.getLayerNames()
+    return [layer_names[i - 1] for i in yolo_net.getUnconnectedOutLayers()]
 
-        # Update the dimensions of our JPEG just in case
-        dimensions = dim
+
+def to_footage_bounding_boxes(boxes: List[BoundingBox], dimensions: Vec2) -> List[FootageBoundingBoxType]:
+    """Convert our own boxes to FootageBoundingBoxTypes, which can be sent to Rhombus
+
+    :param boxes: The boxes found in the frames
+    :param dimensions: The dimensions of the frames
+    :return: Returns the list of FootageBoundingBoxType which we can then just send to Rhombus to create the bounding boxes on the console
+    """
 
     # Create our final list of boxes
     boundingBoxes: List[FootageBoundingBoxType] = []
@@ -223,3 +212,53 @@ def classify_directory(yolo_net: cv2.dnn_Net, coco_classes: List[str], directory
 
     # Return those boxes
     return boundingBoxes
+
+
+def classify_frame_stream(yolo_net: cv2.dnn_Net, coco_classes: List[str], frames: Iterable[Tuple[int, np.ndarray]],
+                          start_time: int, batch_size: int = DEFAULT_BATCH_SIZE) -> List[FootageBoundingBoxType]:
+    """Classify frames as they are decoded, a batch at a time, without them ever being written to disk
+
+    :param yolo_net: The YOLO neural network that is loaded at startup
+    :param coco_classes: The COCO class names that is loaded at startup
+    :param frames: The offset in ms from the start of the clip and the BGR image of every frame, like `decode_frames` gives
+    :param start_time: The start time in seconds of the clip
+    :param batch_size: The number of frames to classify in one forward pass of the neural net
+    :return: Returns the list of FootageBoundingBoxType which we can then just send to Rhombus to create the bounding boxes on the console
+    """
+
+    # Get the names of the layers in our net
+    layer_names = get_output_layer_names(yolo_net)
+
+    # Create a sort of megalist of Bounding boxes which will hold all of the BoundingBoxes of all of the frames
+    boxes: List[BoundingBox] = []
+
+    # The final dimensions of our frames
+    dimensions: Vec2 = Vec2(0, 0)
+
+    batch: List[np.ndarray] = []
+    timestamps: List[int] = []
+
+    def classify_batch() -> None:
+        nonlocal boxes, dimensions
+
+        res, dimensions = classify_frames(yolo_net, coco_classes, layer_names, batch, timestamps)
+        boxes = boxes + res
+
+        batch.clear()
+        timestamps.clear()
+
+    for offset, frame in frames:
+        # The timestamp of each frame is the start_time plus how far into the clip it is, in ms
+        batch.append(frame)
+        timestamps.append(start_time * 1000 + offset)
+
+        # Classify the frames as soon as we have a full batch, so only one batch of frames is ever held in memory
+        if len(batch) >= batch_size:
+            classify_batch()
+
+    # Classify whatever frames are left over
+    if len(batch) > 0:
+        classify_batch()
+
+    # Convert our boxes so that they can be sent to Rhombus
+    return to_footage_bounding_boxes(boxes, dimensions)
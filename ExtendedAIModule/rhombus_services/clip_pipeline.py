@@ -0,0 +1,259 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+# Import type hints
+from typing import Callable, Dict, List
+
+# Import threading and queue to run the stages of the pipeline at the same time
+import queue
+import threading
+
+# Import traceback so that a failed clip is logged without stopping the pipeline
+import traceback
+
+# Import timeit so that we can time the latency of every stage
+from timeit import default_timer as timer
+
+# Import OpenCV for the neural net type
+import cv2
+
+# Import some logging utilities
+from logging_utils.colors import LogColors
+
+# Import cleanup to remove the downloaded files of every clip once it is done
+from rhombus_services.cleanup import cleanup
+
+
+class DownloadedClip:
+    """A video clip that has been downloaded to disk and is ready to be classified
+
+    :attribute clip_path: The path to the downloaded mp4 video clip
+    :attribute directory_path: The directory of the mp4 video clip, which is removed once the clip is done
+    :attribute start_time_sec: The start time of the clip in seconds since epoch
+    :attribute duration_sec: The duration of the clip in seconds
+    :attribute device_uuid: The UUID of the camera the clip was downloaded from
+    """
+    clip_path: str
+    directory_path: str
+    start_time_sec: int
+    duration_sec: int
+    device_uuid: str
+
+    def __init__(self, clip_path: str, directory_path: str, start_time_sec: int, duration_sec: int,
+                 device_uuid: str) -> None:
+        self.clip_path = clip_path
+        self.directory_path = directory_path
+        self.start_time_sec = start_time_sec
+        self.duration_sec = duration_sec
+        self.device_uuid = device_uuid
+
+
+class ClipJob:
+    """A video clip that is waiting to be downloaded and classified
+
+    :attribute name: The name of the clip, used when logging
+    :attribute download: Downloads the clip to disk, this is called from one of the download threads
+    :attribute times: When the clip entered each stage of the pipeline, by the name of the stage
+    """
+    name: str
+    download: Callable[[], DownloadedClip]
+    times: Dict[str, float]
+
+    def __init__(self, name: str, download: Callable[[], DownloadedClip]) -> None:
+        self.name = name
+        self.download = download
+        self.times = {}
+
+
+class StageMetrics:
+    """The latency of one stage of the pipeline over every clip that has gone through it
+
+    :attribute name: The name of the stage
+    :attribute count: The number of clips that have gone through the stage
+    :attribute total_sec: The total time in seconds that those clips spent in the stage
+    :attribute max_sec: The longest time in seconds that one clip spent in the stage
+    """
+    name: str
+    count: int
+    total_sec: float
+    max_sec: float
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.count = 0
+        self.total_sec = 0.0
+        self.max_sec = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record the time one clip spent in the stage
+
+        :param seconds: The time in seconds
+        """
+        self.count += 1
+        self.total_sec += seconds
+        self.max_sec = max(self.max_sec, seconds)
+
+    def __str__(self) -> str:
+        average = self.total_sec / self.count if self.count > 0 else 0.0
+        return "%s avg %.2fs max %.2fs" % (self.name, average, self.max_sec)
+
+
+# The stages of the pipeline in order. "wait" is the time a clip waits to be downloaded, "download" is the download
+# itself, "queue" is the time a downloaded clip waits for an inference worker and "inference" is the classification
+# and upload of the bounding boxes
+STAGES = ["wait", "download", "queue", "inference"]
+
+
+class ClipPipeline:
+    """Downloads and classifies video clips in the background, so that whoever submits them never has to wait.
+
+    Clips go through a bounded intake queue to a pool of download threads, and from there through a bounded queue of
+    downloaded clips to the inference workers. Every inference worker loads its own neural net, since a net can only
+    run one forward pass at a time. When the inference workers fall behind, the queue of downloaded clips fills up and
+    the download threads block, the intake queue then fills up and `submit` starts turning clips away. This is the
+    backpressure, which stops a burst of clips from piling up on disk and in memory without bound.
+
+    :attribute __load_net: Loads a new neural net, called once by every inference worker
+    :attribute __process: Classifies a downloaded clip with the neural net of the worker and uploads the result
+    :attribute __intake: The clips that are waiting to be downloaded
+    :attribute __ready: The clips that are downloaded and waiting to be classified
+    :attribute __download_workers: The number of download threads
+    :attribute __inference_workers: The number of inference workers
+    :attribute __metrics: The latency of every stage, by the name of the stage
+    :attribute __metrics_lock: The lock that guards the metrics, since every worker records them
+    :attribute __rejected: The number of clips that were turned away because the pipeline was full
+    """
+
+    __load_net: Callable[[], cv2.dnn_Net]
+    __process: Callable[[cv2.dnn_Net, DownloadedClip], None]
+    __intake: queue.Queue
+    __ready: queue.Queue
+    __download_workers: int
+    __inference_workers: int
+    __metrics: Dict[str, StageMetrics]
+    __metrics_lock: threading.Lock
+    __rejected: int
+
+    def __init__(self, load_net: Callable[[], cv2.dnn_Net], process: Callable[[cv2.dnn_Net, DownloadedClip], None],
+                 download_workers: int = 2, inference_workers: int = 1, queue_size: int = 16) -> None:
+        """Constructor for the pipeline, call `start` to start the workers
+
+        :param load_net: Loads a new neural net, called once by every inference worker
+        :param process: Classifies a downloaded clip with the neural net of the worker and uploads the result
+        :param download_workers: The number of clips that are downloaded at the same time
+        :param inference_workers: The number of clips that are classified at the same time, each worker holds its own neural net in memory
+        :param queue_size: The number of clips that can wait to be downloaded, and the number of downloaded clips that can wait to be classified
+        """
+        self.__load_net = load_net
+        self.__process = process
+        self.__intake = queue.Queue(maxsize=queue_size)
+        self.__ready = queue.Queue(maxsize=queue_size)
+        self.__download_workers = download_workers
+        self.__inference_workers = inference_workers
+        self.__metrics = {stage: StageMetrics(stage) for stage in STAGES + ["total"]}
+        self.__metrics_lock = threading.Lock()
+        self.__rejected = 0
+
+    def start(self) -> None:
+        """Start the download threads and the inference workers."""
+        for i in range(self.__download_workers):
+            threading.Thread(target=self.__download_loop, name="download-%d" % i, daemon=True).start()
+
+        # The nets are loaded before the workers start, so that a missing weights file fails straight away
+        for i in range(self.__inference_workers):
+            threading.Thread(target=self.__inference_loop, args=(self.__load_net(),), name="inference-%d" % i,
+                             daemon=True).start()
+
+    def submit(self, job: ClipJob) -> bool:
+        """Add a clip to the pipeline without waiting for it to be processed
+
+        :param job: The clip to download and classify
+        :return: Returns False if the pipeline is full and the clip was turned away, otherwise True
+        """
+        job.times["wait"] = timer()
+        try:
+            self.__intake.put_nowait(job)
+            return True
+        except queue.Full:
+            with self.__metrics_lock:
+                self.__rejected += 1
+            print(LogColors.WARNING + "Pipeline is full, turning away " + job.name + LogColors.ENDC)
+            return False
+
+    def __download_loop(self) -> None:
+        """Download the clips in the intake queue and hand them to the inference workers."""
+        while True:
+            job: ClipJob = self.__intake.get()
+            job.times["download"] = timer()
+            try:
+                clip = job.download()
+            except Exception:
+                print(LogColors.ERROR + "Failed to download " + job.name + LogColors.ENDC)
+                traceback.print_exc()
+                continue
+
+            # This blocks while the inference workers are behind, which is what stops the downloads from running ahead
+            job.times["queue"] = timer()
+            self.__ready.put((job, clip))
+
+    def __inference_loop(self, yolo_net: cv2.dnn_Net) -> None:
+        """Classify the downloaded clips with the neural net of this worker.
+
+        :param yolo_net: The neural net of this worker, which no other worker uses
+        """
+        while True:
+            job, clip = self.__ready.get()
+            job.times["inference"] = timer()
+            try:
+                self.__process(yolo_net, clip)
+            except Exception:
+                print(LogColors.ERROR + "Failed to classify " + job.name + LogColors.ENDC)
+                traceback.print_exc()
+            finally:
+                # Remove the downloaded files whether or not the clip could be classified
+                cleanup(clip.directory_path)
+
+            self.__record(job, timer())
+
+    def __record(self, job: ClipJob, end: float) -> None:
+        """Record and log the latency of every stage of a finished clip.
+
+        :param job: The finished clip
+        :param end: The time at which the clip finished
+        """
+        times = [job.times[stage] for stage in STAGES] + [end]
+        with self.__metrics_lock:
+            for i in range(len(STAGES)):
+                self.__metrics[STAGES[i]].record(times[i + 1] - times[i])
+            self.__metrics["total"].record(end - times[0])
+
+            print(LogColors.OKGREEN + "Finished " + job.name + " in %.2fs" % (end - times[0]) + LogColors.ENDC)
+            print(self.metrics())
+
+    def metrics(self) -> str:
+        """Get a summary of the latency of every stage and of how full the pipeline is
+
+        :return: Returns the summary as one line
+        """
+        stages: List[str] = [str(self.__metrics[stage]) for stage in STAGES + ["total"]]
+        return " | ".join(stages + ["waiting %d, downloaded %d, turned away %d" % (
+            self.__intake.qsize(), self.__ready.qsize(), self.__rejected)])
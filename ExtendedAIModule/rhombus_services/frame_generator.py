@@ -20,21 +20,46 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 
-# Import Subprocess to execute the ffmpeg command
-import subprocess
+# Import type hints
+from typing import Iterator, Tuple
 
+# Import Numpy and OpenCV to decode the frames in memory
+import numpy as np
+import cv2
+
+
+def decode_frames(clip_path: str, FPS: float = 1.0) -> Iterator[Tuple[int, np.ndarray]]:
+    """Decode frames at specified FPS from the downloaded mp4 clip straight into memory, without writing them to disk as JPEGs first
 
-def generate_frames(clip_path: str, directory_path: str, FPS: float = 1.0) -> None:
-    """Generate frames at specified FPS using downloaded mp4 clip in the clip's same directory
-    
     :param clip_path: The path of our clip.mp4 which we will use
-    :param directory_path: The path where the clip.mp4 lies which is normally in res/<current time in seconds>
-    :param FPS: Specifies how many frames to generate for our video, default 1.0
+    :param FPS: Specifies how many frames to decode per second of video, default 1.0
+    :return: Returns a generator of the offset in ms of each frame from the start of the clip, and the frame itself as a BGR image like `cv2.imread` would give
     """
-    # All of the frame JPEGs will follow the naming scheme FRAME<index>.jpg where index starts at 1
-    frame_name = "FRAME%4d.jpg"
+    capture = cv2.VideoCapture(clip_path)
+
+    try:
+        # The time in ms of the first frame, and the number of frames that we have kept so far
+        first_time = None
+        kept = 0
+
+        # grab() only reads the next frame, and retrieve() is only called for the frames that we keep, which skips converting all of the other frames to BGR
+        while capture.grab():
+            time = capture.get(cv2.CAP_PROP_POS_MSEC)
+            if first_time is None:
+                first_time = time
+
+            # Keep the first frame at or after every 1 / FPS seconds, with a bit of leeway for frame times that are rounded to the ms
+            offset = time - first_time
+            if offset < kept * 1000 / FPS - 1:
+                continue
+
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+
+            yield int(round(offset)), frame
 
-    # Run the FFMpeg command, which looks something like ffmpeg -i res/<TIME_IN_SECONDS>/clip.mp4 -r 1.0 res/<TIME_IN_SECONDS>/FRAME%4d.jpg
-    # where 1.0 is the FPS
-    subprocess.run(["ffmpeg", "-i", clip_path, "-r", str(FPS), directory_path + frame_name], stdout=subprocess.DEVNULL,
-                   stderr=subprocess.DEVNULL)
+            # If the video skips ahead, don't keep every frame to make up for it
+            kept = max(kept + 1, int(offset * FPS / 1000) + 1)
+    finally:
+        capture.release()
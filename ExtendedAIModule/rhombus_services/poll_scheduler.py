@@ -0,0 +1,98 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+# Import type hints
+from typing import Callable, List, Tuple
+
+# Import heapq to always know which camera is polled next
+import heapq
+
+# Import math and time to schedule the polls
+import math
+import time
+
+# Import some logging utilities
+from logging_utils.colors import LogColors
+
+
+class PollScheduler:
+    """Polls many cameras, each one once every interval.
+
+    The polls of the cameras are staggered evenly across the interval, so that their clips don't all arrive at the
+    pipeline at the same time. Every poll is scheduled from the time the last poll of that camera was due rather
+    than from when it actually ran, so a late poll doesn't push all of the polls after it back and the clips of each
+    camera follow on from each other without gaps or overlaps.
+
+    :attribute __camera_uuids: The UUIDs of the cameras to poll
+    :attribute __interval: How often in seconds to poll each camera, which is also the duration of every clip
+    :attribute __poll: Called with the camera UUID and the start time in seconds since epoch of the clip to fetch. This should return quickly, usually by adding the clip to a pipeline
+    """
+
+    __camera_uuids: List[str]
+    __interval: int
+    __poll: Callable[[str, int], None]
+
+    def __init__(self, camera_uuids: List[str], interval: int, poll: Callable[[str, int], None]) -> None:
+        """Constructor for the scheduler, call `run` to start polling
+
+        :param camera_uuids: The UUIDs of the cameras to poll
+        :param interval: How often in seconds to poll each camera, which is also the duration of every clip
+        :param poll: Called with the camera UUID and the start time in seconds since epoch of the clip to fetch
+        """
+        self.__camera_uuids = camera_uuids
+        self.__interval = interval
+        self.__poll = poll
+
+    def run(self) -> None:
+        """Poll the cameras forever."""
+
+        # The first poll of every camera is one interval from now, with the cameras spread evenly across that interval
+        start = math.ceil(time.time()) + self.__interval
+        stagger = self.__interval / len(self.__camera_uuids)
+
+        # The next time each camera is due to be polled, soonest first
+        schedule: List[Tuple[float, int, str]] = [(start + i * stagger, i, self.__camera_uuids[i])
+                                                  for i in range(len(self.__camera_uuids))]
+        heapq.heapify(schedule)
+
+        while True:
+            due, i, camera_uuid = schedule[0]
+
+            # Sleep until the next camera is due
+            now = time.time()
+            if due > now:
+                time.sleep(due - now)
+                continue
+
+            # If we have fallen more than an interval behind, the footage we missed is skipped so that we don't
+            # flood the pipeline trying to catch up
+            missed = int((now - due) / self.__interval)
+            if missed > 0:
+                print(LogColors.WARNING + "Fell behind polling " + camera_uuid + ", skipping " + str(missed) +
+                      " intervals" + LogColors.ENDC)
+                due += missed * self.__interval
+
+            # The clip is the interval that ends at the due time, rounded to the second
+            self.__poll(camera_uuid, round(due) - self.__interval)
+
+            # Schedule the next poll from the due time, not from now, so that the delay of this poll doesn't add up
+            heapq.heapreplace(schedule, (due + self.__interval, i, camera_uuid))
@@ -134,13 +134,14 @@ def __run(api_client: rapi.ApiClient) -> None:
     print(response)
 
 
-def init_webhook(name: str, api_client: rapi.ApiClient, cb: Callable[[WebhookEvent], None]) -> None:
+def init_webhook(name: str, api_client: rapi.ApiClient, cb: Callable[[WebhookEvent], bool]) -> None:
     """
     Initializes the webhook for Rhombus.
 
     :param name: The name of the flask application.
     :param api_client: The Rhombus API client.
-    :param cb: The callback that will be called with the Webhook.
+    :param cb: The callback that will be called with the Webhook. This should return straight away, True if the event
+               was accepted and False if it is too busy, in which case Rhombus is told so with a 503.
     """
 
     # Create the Flask app with the name.
@@ -155,7 +156,8 @@ def init_webhook(name: str, api_client: rapi.ApiClient, cb: Callable[[WebhookEve
     @app.route("/", methods=['POST'])
     def root():
         data = WebhookEvent(request.json)
-        cb(data)
+        if not cb(data):
+            return "busy", 503
         return "success"
 
     # Start the Flask server.
@@ -19,6 +19,9 @@ import os
 
 sys.path.append('../')
 
+# Import the shared media client to download our clips
+from rhombus_media_client import MediaClient
+
 # Import RhombusAPI to create our Api Client
 import RhombusAPI as rapi
 
@@ -49,7 +52,8 @@ class Main:
     :attribute __force: The user specified option whether or not to force regeneration of the res/face_enc file ignoring whether it already exists or not. By default this is false.
     :attribute __name: The user specified name to look for in VODs.
     :attribute __api_client: The RhombusAPI client that will be used throughout the lifetime of our application
-    :attribute __http_client: The HTTP Client that will be used for fetching clips throughout the lifetime of our application
+    :attribute __http_client: The HTTP Client that will be used for fetching face images throughout the lifetime of our application
+    :attribute __media_client: The media client that will be used for fetching clips throughout the lifetime of our application
     :attribute __counter: The number of times a user was not found in video footage.
     """
 
@@ -59,6 +63,7 @@ class Main:
     __camera_uuid: str
     __interval: int = 10
     __http_client: requests.sessions.Session
+    __media_client: MediaClient
     __force: bool = False
     __name: str
     __counter: int = 0
@@ -92,9 +97,16 @@ class Main:
             self.__connection_type = ConnectionType.WAN
             print(LogColors.WARNING + "Running in WAN mode! This is not recommended if it can be avoided." + LogColors.ENDC)
 
+        # If the user specifies -t AUTO, then we race LAN and WAN and use whichever is faster
+        elif(args.connection_type == "AUTO"):
+            self.__connection_type = ConnectionType.AUTO
+
         # Create an HTTP client
         self.__http_client = requests.sessions.Session()
 
+        # Create a media client. This pools and keeps alive our connections to the camera for every clip we download
+        self.__media_client = MediaClient()
+
 
     def __runner(self) -> None:
         """Executes the services that will download the clip, classify it, and upload the bounding boxes to Rhombus."""
@@ -102,14 +114,14 @@ class Main:
         # Start a timer to time our execution time
         start = timer()
         
-        # Get the media URIs from rhombus for our camera, this is done every sequence so that we don't have to worry about federated tokens. 
-	    # These URIs stay the same, but this method will also create our federated tokens
+        # Get the media URIs from rhombus for our camera. These URIs stay the same, but this method will also get the federated token,
+        # which is shared between sequences and only regenerated when it is about to expire
         print("Fetching media uris...")
         uri, token = fetch_media_uris(api_client=self.__api_client, camera_uuid=self.__camera_uuid, duration=120, type=self.__connection_type)
 
         # Download the mp4 of the last [duration] seconds starting from Now - [duration] seconds ago
         print("Downloading vod...")
-        clip_path, directory_path, _ = fetch_vod(api_key=self.__api_key,  federated_token=token, http_client=self.__http_client, uri=uri, type=self.__connection_type, duration=self.__interval)
+        clip_path, directory_path, _ = fetch_vod(api_key=self.__api_key,  federated_token=token, http_client=self.__media_client, uri=uri, type=self.__connection_type, duration=self.__interval)
 
         # Generate a bunch of frames from our downloaded mp4, these will be put in vodRes.directoryPath/FRAME.jpg and the number of them will depend on the FPS, which is set right now to 3
         print("Generating frames...")
@@ -26,7 +26,7 @@ def parse_arguments(argv: List[str]) -> argparse.Namespace:
     parser.add_argument('--interval', '-i', type=int, required=False, help='How often to poll the camera for new footage in seconds, by default 60 seconds', default=60)
 
     # The --connection_type or -t param will hold the ConnectionType to the camera. It is not recommended to run in WAN mode unless this python server is running on a separate network from the camera
-    parser.add_argument('--connection_type', '-t', type=str, required=False, help='The connection type to the camera, either LAN or WAN (default LAN)', default="LAN")
+    parser.add_argument('--connection_type', '-t', type=str, required=False, help='The connection type to the camera, either LAN, WAN or AUTO to use whichever is faster (default LAN)', default="LAN")
 
     # The --force or -f param will hold whether to force the regeneration of face encodings by default false
     parser.add_argument('--force', '-f', type=bool, required=False, help='Whether to force the regeneration of face encodings', default=False)
@@ -1,5 +1,5 @@
 # Import type hints
-from typing import Tuple
+from typing import List, Tuple, Union
 
 # Import RhombusAPI to send requests to get the MediaURIs and generate a federated token
 import RhombusAPI as rapi
@@ -7,14 +7,17 @@ import RhombusAPI as rapi
 # Import ConnectionType to get the correct connection URI
 from helper_types.connection_type import ConnectionType
 
-def fetch_media_uris(api_client: rapi.ApiClient, camera_uuid: str, duration: int, type: ConnectionType) -> Tuple[str, str] :
+# Import the shared federated token manager so that every download shares one token
+from rhombus_federated_token import API_CLIENT_TOKEN_MANAGER, api_client_token_fetcher, shared_token_manager
+
+def fetch_media_uris(api_client: rapi.ApiClient, camera_uuid: str, duration: int, type: ConnectionType) -> Tuple[Union[str, List[str]], str] :
     """Get the lan URI of the camera and generate a federatedToken to download the VOD
     
     :param api_client: The API Client for sending requests to Rhombus
     :param camera_uuid: The UUID of the camera to get info for
-    :param duration: How long the federated token should last in seconds
+    :param duration: How long the federated token has to stay valid in seconds
     :param type: Whether to use LAN or WAN for the connection, by default LAN and unless you are on a different connection, you should really just use LAN
-    :return: Returns the lan URI of the vod and the generated federated token
+    :return: Returns the lan URI of the vod and the generated federated token. For the AUTO connection type this returns both the lan and the wan URI in a list
     """
 
     # Create a new instance of the Camera API for us to use
@@ -24,11 +27,12 @@ def fetch_media_uris(api_client: rapi.ApiClient, camera_uuid: str, duration: int
     media_uri_request = rapi.CameraGetMediaUrisWSRequest(camera_uuid=camera_uuid)
     media_uris = cam_api.get_camera_media_uris(body=media_uri_request)
 
-    # Create a new instance of the ORG API to get the federated token
-    org_api = rapi.OrgWebserviceApi(api_client=api_client)
-    # Get the federated session token
-    federated_token_request = rapi.OrgGenerateFederatedSessionTokenRequest(duration_sec=duration)
-    federated_token_response = org_api.generate_federated_session_token(body=federated_token_request)
+    # Get the shared federated token
+    federated_token = shared_token_manager(API_CLIENT_TOKEN_MANAGER, lambda: api_client_token_fetcher(api_client)).get_token(valid_for_sec=duration)
+
+    # With the AUTO connection type the media client gets both URIs and picks whichever is faster
+    if type == ConnectionType.AUTO:
+        return [media_uris.lan_vod_mpd_uris_templates[0], media_uris.wan_vod_mpd_uri_template], federated_token
 
     # Return our data
-    return media_uris.lan_vod_mpd_uris_templates[0] if type == ConnectionType.LAN else media_uris.wan_vod_mpd_uri_template, federated_token_response.federated_session_token 
+    return media_uris.lan_vod_mpd_uris_templates[0] if type == ConnectionType.LAN else media_uris.wan_vod_mpd_uri_template, federated_token
@@ -1,14 +1,9 @@
 # Import type hints
-from typing import Dict
-from typing import Tuple
+from typing import List, Tuple, Union
 
-# Import requests to download the VOD
-import requests
-
-# Import pathlib, OS, and IO to write the VOD to a file
+# Import pathlib and OS to write the VOD to a file
 import pathlib
 import os
-import io
 
 # Import time to get the current time
 import time
@@ -16,33 +11,17 @@ import time
 # Import ConnectionType to specify what connection we should have to the camera when downloading our data
 from helper_types.connection_type import ConnectionType
 
-def save_clip(headers: Dict[str, str], http_client: requests.sessions.Session, file: io.BufferedWriter, uri: str) -> None:
-    """Save an m4v or mp4 url to the specified output file
-
-    :param headers: The HTTP Headers to send with our request. These are required to authenticate
-    :param http_client: The HTTP Client to download the files with which is initialized at startup
-    :param file: The output file to write to
-    :param uri: The media URI to download from
-    """
-
-    # Download the file from the uri
-    buffer = http_client.get(uri, headers=headers)
+# Import the shared media client to download the VOD
+from rhombus_media_client import MediaClient
 
-    # Write the file
-    file.write(buffer.content)
 
-    # Flush our file and buffer
-    file.flush()
-    buffer.close()
-
-
-def fetch_vod(api_key: str, federated_token: str, http_client: requests.sessions.Session, uri: str, type: ConnectionType, duration: int = 20) -> Tuple[str, str, int]:
+def fetch_vod(api_key: str, federated_token: str, http_client: MediaClient, uri: Union[str, List[str]], type: ConnectionType, duration: int = 20) -> Tuple[str, str, int]:
     """Download a vod to disk. It will be saved in res/<current time in seconds>
 
     :param api_key: The API Key specified by the user
     :param federated_token: The federated token which will be used to download the files. Without this we would get a 401 authentication error
     :param http_client: The HTTP Client to download the files with which is initialized at startup
-    :param uri: The VOD uri to download from
+    :param uri: The VOD uri to download from, or a list of the LAN and the WAN VOD uri for the AUTO connection type
     :param type: The ConnectionType to the Camera to download the VOD from
     :param duration: The duration in seconds of the clip to download
     :return: Returns the path of the downloaded vod mp4 and the directory in which that downloaded mp4 is in.
@@ -51,8 +30,10 @@ def fetch_vod(api_key: str, federated_token: str, http_client: requests.sessions
     # Get the starting time in seconds. This will be the current time in seconds since epoch - duration
     start_time = round(time.time()) - duration
 
-    # We need to replace {START_TIME} and {DURATION} with the correct values in order to properly download the file
-    full_uri = uri.replace("{START_TIME}", str(start_time)).replace("{DURATION}", str(duration))
+    # We need to replace {START_TIME} and {DURATION} with the correct values in order to properly download the file.
+    # With the AUTO connection type we get both the LAN and the WAN uri, and the media client uses whichever is faster
+    full_uri = [u.replace("{START_TIME}", str(start_time)).replace("{DURATION}", str(duration))
+                for u in (uri if isinstance(uri, list) else [uri])]
 
     # The directory where we will place our clip is "<PROJECT_ROOT>/res/<startTime>"
     dir = "./res/clips/" + str(start_time) + "/"
@@ -76,23 +57,9 @@ def fetch_vod(api_key: str, federated_token: str, http_client: requests.sessions
             "Content-Type": "application/json" 
     }
 
-    # This will change depend on whether we are using WAN or LAN
-    mpd_name = "clip.mpd" if type == ConnectionType.LAN else "file.mpd"
-
-    # Create an output file. This will be written in bytes.
-    with open(path, "wb") as file:
-        # Because our URI is an mpd, we need to get each of the segments. The seg_init.mp4 is the first of these.
-        # Just replace clip.mpd at the end of the URL with seg_init.mp4
-        save_clip(headers, http_client, file, full_uri.replace(mpd_name, "seg_init.mp4"))
-
-        # Each of the segments is 2 seconds long, so the number of segments is duration/2
-        for i in range(int(duration / 2)):
-		    # The URI of all subsequent segments will replace clip.mpd with seg_<index>.m4v
-		    # These files will need to be appended to our existing clip.mp4 in disk
-            save_clip(headers, http_client, file, full_uri.replace(mpd_name, "seg_" + str(i) + ".m4v"))
+    # Download the MPD, the init segment and all of the video segments into our output clip. The media client keeps
+    # several segment requests in flight at once over pooled keep-alive connections and writes them in order.
+    http_client.download_vod(full_uri, path, duration, headers)
 
-    # Close the output file
-    file.close()
-	
     # Return our data
     return path, dir, start_time
@@ -0,0 +1,187 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+import sys
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+sys.path.append('../')
+
+from rhombus_media_client import AsyncMediaClient, get_segment_uri, get_segment_uri_index
+from rhombus_mpd_info import RhombusMPDInfo
+import rhombus_logging
+from live_prefetcher import LivePrefetcher
+
+# Set up logging.
+LOGGER = rhombus_logging.get_logger("rhombus.CameraStream")
+
+
+class CameraStream:
+    """The live stream of a single camera served by the proxy.
+
+    Every camera has its own pool of upstream connections and its own prefetcher, so a busy or slow camera does not hold
+    up the others.
+
+    :attribute camera_uuid:      The UUID of the camera.
+    :attribute live_uri:         The live MPD URI we are using, either the LAN or the WAN one.
+    :attribute mpd_doc:          The raw MPD document that is served to the viewers.
+    :attribute mpd_info:         The parsed MPD document.
+    :attribute last_request_sec: The last time in seconds since epoch that a viewer asked for anything from this camera.
+    """
+    camera_uuid: str
+    live_uri: str
+    mpd_doc: str
+    mpd_info: RhombusMPDInfo
+    last_request_sec: float
+
+    def __init__(self, camera_uuid: str, live_uri: str, mpd_doc: str, media_client: AsyncMediaClient,
+                 fetch_federated_token: Callable[[bool], Awaitable[None]],
+                 get_media_headers: Callable[[], Dict[str, str]], prefetch_count: int, buffer_count: int):
+        """Create the stream, use `CameraStream.open` instead which also figures out which live URI to use.
+
+        :param camera_uuid:           The UUID of the camera.
+        :param live_uri:              The live MPD URI to use.
+        :param mpd_doc:               The raw MPD document retrieved from `live_uri`.
+        :param media_client:          The client used to make requests to the camera, owned by this stream from now on.
+        :param fetch_federated_token: Refreshes the federated token shared by all cameras if necessary, or always if
+                                      True is passed.
+        :param get_media_headers:     Gets the headers that include the current federated token.
+        :param prefetch_count:        How many live segments to fetch ahead of the viewers.
+        :param buffer_count:          How many live segments to keep in memory.
+        """
+        self.camera_uuid = camera_uuid
+        self.live_uri = live_uri
+        self.mpd_doc = mpd_doc
+        self.mpd_info = RhombusMPDInfo.parse(mpd_doc)
+        self.last_request_sec = time.time()
+        self.__media_client = media_client
+        self.__fetch_federated_token = fetch_federated_token
+        self.__get_media_headers = get_media_headers
+
+        # Start pulling live segments in the background. Every viewer of this camera is served from the prefetcher's
+        # buffer, so each segment only has to be fetched from the camera once however many people are watching.
+        self.__prefetcher = LivePrefetcher(self.__fetch_segment, prefetch_count, buffer_count)
+
+    @staticmethod
+    async def open(camera_uuid: str, media_uris: Dict, connections: int,
+                   fetch_federated_token: Callable[[bool], Awaitable[None]],
+                   get_media_headers: Callable[[], Dict[str, str]], prefetch_count: int,
+                   buffer_count: int) -> 'CameraStream':
+        """Connect to a camera over whichever of the LAN and the WAN connection answers first.
+
+        :param camera_uuid:           The UUID of the camera.
+        :param media_uris:            The response of /api/camera/getMediaUris for the camera.
+        :param connections:           The maximum number of connections to open to the camera.
+        :param fetch_federated_token: Refreshes the federated token shared by all cameras if necessary, or always if
+                                      True is passed.
+        :param get_media_headers:     Gets the headers that include the current federated token.
+        :param prefetch_count:        How many live segments to fetch ahead of the viewers.
+        :param buffer_count:          How many live segments to keep in memory.
+        :return: The camera stream.
+        """
+        # Every camera gets its own connection pool.
+        media_client = AsyncMediaClient(max_connections=connections, max_connections_per_host=connections,
+                                        verify_ssl=False)
+
+        async def refresh_federated_token() -> None:
+            await fetch_federated_token(True)
+
+        try:
+            await fetch_federated_token(False)
+
+            # The MPD document can be retrieved just by GETting the live URI. Rather than waiting for the LAN connection
+            # to time out before falling back to the WAN, ask both at once and use whichever answers first, preferring
+            # the LAN if both answer together.
+            # NOTE: The LAN and WAN streams number their segments differently, so unlike VOD downloads a live stream
+            # stays on the path it started on.
+            mpd_uris = media_uris["lanLiveMpdUris"][:1] + [media_uris["wanLiveMpdUri"]]
+            path = (await media_client.select_path(mpd_uris, get_media_headers,
+                                                   on_unauthorized=refresh_federated_token)).current
+        except BaseException:
+            await media_client.close()
+            raise
+
+        live_uri = path.mpd_uri
+        LOGGER.info("Using live MPD URI %s for camera %s", live_uri, camera_uuid)
+
+        return CameraStream(camera_uuid, live_uri, path.mpd_doc, media_client, fetch_federated_token,
+                            get_media_headers, prefetch_count, buffer_count)
+
+    async def close(self) -> None:
+        """Stop prefetching and close all connections to the camera."""
+        await self.__prefetcher.close()
+        await self.__media_client.close()
+
+    async def __get(self, uri: str) -> bytes:
+        # Update the federated token if necessary
+        await self.__fetch_federated_token(False)
+
+        async def refresh_federated_token() -> None:
+            await self.__fetch_federated_token(True)
+
+        return await self.__media_client.get(uri, self.__get_media_headers, on_unauthorized=refresh_federated_token)
+
+    async def __fetch_segment(self, number: int) -> Optional[bytes]:
+        # The segment number already includes the start index so we remove it here, see get_segment.
+        try:
+            return await self.__get(get_segment_uri_index(self.mpd_info, self.live_uri,
+                                                          number - self.mpd_info.start_index))
+        except ConnectionError as e:
+            # Live segments that the camera has not finished recording yet are not available.
+            LOGGER.debug("Segment %d of camera %s is not available: %s", number, self.camera_uuid, e)
+            return None
+
+    async def get_init_segment(self) -> bytes:
+        """Get the initial segment from the camera.
+
+        :return: The initial segment bytes.
+        """
+        self.last_request_sec = time.time()
+        return await self.__get(get_segment_uri(self.live_uri, self.mpd_info.init_string))
+
+    def get_segment_number(self, segment_name: str) -> Optional[int]:
+        """Get the number of a segment from its name.
+
+        :param segment_name: The name of the segment, for example "seg_200.mp4".
+        :return: The segment number, or None if `segment_name` is not a segment of this stream.
+        """
+        return self.mpd_info.get_segment_number(segment_name)
+
+    async def get_segment(self, number: int, timeout_sec: float) -> bytes:
+        """Get a segment for a viewer.
+
+        NOTE: The dash.js client will automatically add the start_index to the segment number as any MPEG-Dash client
+        should, so `number` already includes it.
+
+        :param number:      The segment number, including the start index.
+        :param timeout_sec: How long to wait for the prefetcher before fetching the segment directly.
+        :return: The segment bytes.
+        """
+        self.last_request_sec = time.time()
+
+        # Get the segment from the prefetcher, it is usually already waiting in the buffer.
+        data = await self.__prefetcher.get(number, timeout_sec)
+        if data is not None:
+            return data
+
+        # If the prefetcher could not get it in time, then try to get it ourselves.
+        return await self.__get(get_segment_uri_index(self.mpd_info, self.live_uri,
+                                                      number - self.mpd_info.start_index))
@@ -0,0 +1,181 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import rhombus_logging
+
+# Set up logging.
+LOGGER = rhombus_logging.get_logger("rhombus.LivePrefetcher")
+
+# Each live segment is 2 seconds of video.
+SEGMENT_DURATION_SEC = 2
+
+# How many times a segment that is not available yet is retried before the prefetcher gives up on it and moves on.
+MAX_SEGMENT_ATTEMPTS = 5
+
+
+class SegmentRingBuffer:
+    """Fixed size in-memory store of the most recent live segments, keyed by segment number.
+
+    Segment `number` lives in slot `number % capacity`, so storing a new segment overwrites the one `capacity` segments
+    before it. The buffer does no locking of its own, callers must hold their own lock around it.
+
+    :attribute capacity: The number of segments the buffer holds.
+    """
+    capacity: int
+
+    def __init__(self, capacity: int):
+        """Create an empty ring buffer.
+
+        :param capacity: The number of segments the buffer holds.
+        """
+        self.capacity = capacity
+        self.__slots: List[Optional[Tuple[int, bytes]]] = [None] * capacity
+
+    def put(self, number: int, data: bytes) -> None:
+        """Store a segment, overwriting the oldest one in its slot.
+
+        :param number: The segment number.
+        :param data:   The segment bytes.
+        """
+        self.__slots[number % self.capacity] = (number, data)
+
+    def get(self, number: int) -> Optional[bytes]:
+        """Get a segment.
+
+        :param number: The segment number.
+        :return: The segment bytes, or None if the segment is not in the buffer.
+        """
+        slot = self.__slots[number % self.capacity]
+        if slot is None or slot[0] != number:
+            return None
+        return slot[1]
+
+
+class LivePrefetcher:
+    """Pulls live segments of one camera ahead of playback into a ring buffer from a background task.
+
+    Every viewer request tells the prefetcher which segment playback is at, and the prefetcher keeps fetching until it
+    is `prefetch_count` segments ahead of the furthest viewer. Viewers of the same camera are all served from the same
+    buffer, so each segment is only fetched from the camera once however many people are watching. Once nobody has
+    asked for a segment in a while the prefetcher stops at `prefetch_count` segments ahead and sits idle.
+
+    The prefetcher must be created from inside a running event loop.
+
+    :attribute prefetch_count: How many segments to fetch ahead of the furthest viewer.
+    """
+    prefetch_count: int
+
+    def __init__(self, fetch_segment: Callable[[int], Awaitable[Optional[bytes]]], prefetch_count: int,
+                 capacity: int):
+        """Create and start the prefetcher.
+
+        :param fetch_segment:  Fetches a segment from the camera given its number, returning None if the segment is
+                               not available yet.
+        :param prefetch_count: How many segments to fetch ahead of the furthest viewer.
+        :param capacity:       How many segments to keep in the ring buffer. This should be larger than
+                               `prefetch_count` so that viewers a little behind the others are still served from it.
+        """
+        self.prefetch_count = prefetch_count
+        self.__fetch_segment = fetch_segment
+        self.__buffer = SegmentRingBuffer(max(capacity, prefetch_count + 1))
+        self.__condition = asyncio.Condition()
+
+        # The next segment number the prefetcher will fetch, and the last one it should fetch.
+        self.__next_number: Optional[int] = None
+        self.__last_number: int = -1
+
+        self.__task = asyncio.create_task(self.__run())
+
+    async def close(self) -> None:
+        """Stop the prefetcher."""
+        self.__task.cancel()
+        await asyncio.gather(self.__task, return_exceptions=True)
+
+    async def get(self, number: int, timeout_sec: float) -> Optional[bytes]:
+        """Get a segment for a viewer, waiting for the prefetcher to fetch it if necessary.
+
+        :param number:      The segment number the viewer asked for.
+        :param timeout_sec: How long to wait for the segment.
+        :return: The segment bytes, or None if the prefetcher could not get it in time.
+        """
+        async with self.__condition:
+            # If this viewer is outside of what the prefetcher is working on, for example the first viewer or one that
+            # seeked, move the prefetcher to it. Otherwise just make sure it keeps going far enough ahead of this viewer.
+            if self.__next_number is None or number > self.__last_number or \
+                    (number < self.__next_number and self.__buffer.get(number) is None):
+                LOGGER.debug("Moving prefetcher to segment %d", number)
+                self.__next_number = number
+                self.__last_number = number + self.prefetch_count
+            else:
+                self.__last_number = max(self.__last_number, number + self.prefetch_count)
+
+            self.__condition.notify_all()
+
+            # Wait until the segment is in the buffer, or the prefetcher gave up on it and moved past it.
+            try:
+                await asyncio.wait_for(self.__condition.wait_for(
+                    lambda: self.__buffer.get(number) is not None or self.__next_number > number), timeout_sec)
+            except asyncio.TimeoutError:
+                return None
+
+            return self.__buffer.get(number)
+
+    async def __run(self) -> None:
+        """Fetch segments until the prefetcher is `prefetch_count` segments ahead of the furthest viewer."""
+        attempts = 0
+
+        while True:
+            async with self.__condition:
+                # Wait for a viewer to need more segments.
+                await self.__condition.wait_for(
+                    lambda: self.__next_number is not None and self.__next_number <= self.__last_number)
+                number = self.__next_number
+
+            try:
+                data = await self.__fetch_segment(number)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOGGER.warning("Failed to prefetch segment %d: %s", number, e)
+                data = None
+
+            async with self.__condition:
+                if data is not None:
+                    self.__buffer.put(number, data)
+                    attempts = 0
+                else:
+                    attempts += 1
+
+                # Only move on if no viewer moved the prefetcher somewhere else while we were fetching.
+                if self.__next_number == number and (data is not None or attempts >= MAX_SEGMENT_ATTEMPTS):
+                    if data is None:
+                        LOGGER.warning("Giving up on segment %d", number)
+                        attempts = 0
+                    self.__next_number = number + 1
+
+                self.__condition.notify_all()
+
+            # Live segments that are not available yet show up within one segment duration.
+            if data is None:
+                await asyncio.sleep(SEGMENT_DURATION_SEC / 2)
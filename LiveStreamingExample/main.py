@@ -20,24 +20,20 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 import argparse
+import asyncio
+import os
 import sys
 import time
-from typing import List
+from typing import Dict, List, Optional
 
-import flask
-import requests as requests
-import urllib3 as urllib3
+import aiohttp
+from aiohttp import web
 
 sys.path.append('../')
 
-from rhombus_mpd_info import RhombusMPDInfo
 import rhombus_logging
-
-from flask import Flask
-from flask import request
-
-# Disable warnings.
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+from rhombus_federated_token import FederatedTokenManager
+from camera_stream import CameraStream
 
 # Set up logging.
 LOGGER = rhombus_logging.get_logger("rhombus.LiveStreaming")
@@ -48,6 +44,15 @@ API_URL = "https://api2.rhombussystems.com"
 # Federated tokens will last 1 hour.
 FEDERATED_TOKEN_DURATION_SEC = 60 * 60
 
+# How long a viewer will wait for the prefetcher to get a segment before we fetch it for them directly.
+PREFETCH_TIMEOUT_SEC = 10
+
+# Cameras that nobody has watched for this long are disconnected, and connected again when the next viewer shows up.
+CAMERA_IDLE_TIMEOUT_SEC = 5 * 60
+
+# The directory holding the web page and the javascript served to the viewers.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
 
 def parse_arguments(argv: List[str]) -> argparse.Namespace:
     """Parse the command line args.
@@ -58,265 +63,251 @@ def parse_arguments(argv: List[str]) -> argparse.Namespace:
 
     # Create our parser
     parser = argparse.ArgumentParser(
-        description='Creates a web-server that serves a Rhombus live stream to a webclient.')
+        description='Creates a web-server that serves the Rhombus live streams of any number of cameras to web '
+                    'clients. The stream of a camera is available at /cam/<camera_uuid>/live.mpd and can be watched '
+                    'at /cam/<camera_uuid>/')
 
     # The --api_key or -a param will hold our API key
     parser.add_argument('--api_key', '-a', type=str, required=True, help='Rhombus API key')
 
-    # The --camera_uuid or -c param will hold the UUID of the camera which will be processed
+    # The --camera_uuid or -c param will hold the UUID of the camera that is shown at /
     parser.add_argument('--camera_uuid', '-c', type=str, required=False,
-                        help='Device Id to pull footage from. Required if continuous.')
+                        help='Device Id of the camera to show at /. Any other camera can still be watched at '
+                             '/cam/<camera_uuid>/')
 
     # The --debug or -d param will tell the program to print out debug information
     parser.add_argument('--debug', '-d', required=False, action='store_true',
                         help='Show debug information')
 
+    # The --host or -o param will tell the program what address to listen on, by default it is localhost
+    parser.add_argument('--host', '-o', type=str, required=False, default='localhost',
+                        help='Address to listen on, use 0.0.0.0 to serve other machines, by default localhost')
+
     # The --port or -p param will tell the program what port to use, by default it is 5000
     parser.add_argument('--port', '-p', type=int, required=False, help='Web-server port in localhost', default=5000)
 
-    # Return all of our arguments
-    return parser.parse_args(argv)
-
+    # The --prefetch or -f param will tell the program how many live segments to fetch ahead of the viewers
+    parser.add_argument('--prefetch', '-f', type=int, required=False, default=3,
+                        help='How many live segments to fetch ahead of playback, by default 3')
 
-def get_segment_uri(mpd_uri: str, segment_name: str) -> str:
-    """Returns the URI of a segment replacing the ending *.mpd string with the `segment_name`.
-    For example: get_segment_uri(https://some_wan_uri/file.mpd, seg_init.mp4) -> https://some_wan_uri/seg_init.mp4
+    # The --buffer or -b param will tell the program how many live segments to keep in memory for viewers
+    parser.add_argument('--buffer', '-b', type=int, required=False, default=30,
+                        help='How many live segments to keep in memory per camera so that viewers that are a little '
+                             'behind are still served without going to the camera, by default 30')
 
-    Depending on if the connection is WAN or LAN, the ending will either be "file.mpd" or "live.mpd" respectively.
-    This method will replace either type of connection.
+    # The --connections or -n param will tell the program how many connections it may open to a single camera
+    parser.add_argument('--connections', '-n', type=int, required=False, default=4,
+                        help='How many connections to keep open to each camera, by default 4')
 
-    This method should really only be used to get the initial segment, to get a segment at a specific index, use
-    `get_segment_uri_index`
-
-    :param mpd_uri:      The live MPD URI to get the segment string for.
-    :param segment_name: The name of the segment.
-    :return: The segment URI.
-    """
-
-    if "file.mpd" in mpd_uri:
-        # If the MPD URI is a WAN connection, it will end in "file.mpd"
-        return mpd_uri.replace("file.mpd", segment_name)
-    elif "live.mpd" in mpd_uri:
-        # If the MPD URI is a LAN connection, it will end in "live.mpd"
-        return mpd_uri.replace("live.mpd", segment_name)
-    else:
-        raise Exception("The mpd_uri {} does not contain a valid ending!".format(mpd_uri))
-
-
-def get_segment_uri_index(rhombus_mpd_info: RhombusMPDInfo, mpd_uri: str, index: int) -> str:
-    """Returns the URI of a segment replacing the ending *.mpd string with the proper segment number adhering to the `rhombus_mpd_info`.
-    For example: get_segment_uri(some_rhombus_mpd_info, https://some_wan_uri/file.mpd, 200) -> https://some_wan_uri/seg_200.mp4
-    assuming that `some_rhombus_mpd_info.
-
-    :param rhombus_mpd_info: The parsed MPD document from `mpd_uri`.
-    :param mpd_uri:          The live MPD URI to get the segment string for.
-    :param index:            The segment index starting at 0.
-                             NOTE: This function already adds the starting index so always start at 0
-    :return: The segment URI.
-    """
-
-    # Get the segment name by replacing the $Number$ pattern with the index.
-    segment_name = rhombus_mpd_info.segment_pattern.replace("$Number$", str(index + rhombus_mpd_info.start_index))
-
-    # Then get the segment URI.
-    return get_segment_uri(mpd_uri, segment_name)
+    # Return all of our arguments
+    return parser.parse_args(argv)
 
 
 class Main:
     """Main entry point of the program.
 
-    :attribute federated_token:      The federated token used to make GET requests to the live URI.
-    :attribute last_token_fetch_sec: The last time in seconds since epoch that the federated token was fetched.
-    :attribute sess:                 The requests session containing the API key headers to make HTTP requests.
-    :attribute app:                  The Flask server app.
-    :attribute port:                 The port that the Flask server is hosted on.
+    Cameras are connected lazily, the first time a viewer asks for their stream, and all of them share one federated
+    token.
+
+    :attribute args:                 The parsed arguments.
+    :attribute federated_token:      The federated token used to make GET requests to the live URIs.
+    :attribute cameras:              The connected cameras by camera UUID.
+    :attribute app:                  The aiohttp server app.
     """
-    # live_uri: str
-    # mpd_doc: str
-    # mpd_info: RhombusMPDInfo
-    federated_token: str
-    last_token_fetch_sec: int = 0
-    sess: requests.session = requests.session()
-    app: Flask
-    port: int
+    args: argparse.Namespace
+    federated_token: Optional[str]
+    cameras: Dict[str, CameraStream]
+    app: web.Application
 
     def __init__(self, args: argparse.Namespace):
         """Initialize the main entry point.
 
         :param args: The parsed arguments.
         """
-        # Set the API key headers.
-        self.sess.headers = {
+        self.args = args
+        self.federated_token = None
+        self.cameras = {}
+
+        # The API session is created when the server starts since it has to be created inside of the event loop.
+        self.__sess: Optional[aiohttp.ClientSession] = None
+        self.__token_manager: Optional[FederatedTokenManager] = None
+        self.__camera_locks: Dict[str, asyncio.Lock] = {}
+        self.__idle_task: Optional[asyncio.Task] = None
+
+        # Create the aiohttp app.
+        self.app = web.Application()
+        self.app.on_startup.append(self.__start)
+        self.app.on_cleanup.append(self.__stop)
+
+        # The / route will show the camera given on the commandline, and the /cam/<camera_uuid>/ route will show any
+        # camera. The web page gets the stream from "live.mpd" relative to itself, so the trailing slash matters.
+        # The /cam/<camera_uuid>/live.mpd route will serve the MPD document of the camera, and the MPD document tells
+        # the client to get the segments from /cam/<camera_uuid>/<segment_name>.
+        self.app.add_routes([
+            web.get("/", self.send_index),
+            web.get("/cam/{camera_uuid}", self.send_webpage),
+            web.get("/cam/{camera_uuid}/", self.send_webpage),
+            web.get("/cam/{camera_uuid}/live.mpd", self.send_mpd),
+            web.get("/cam/{camera_uuid}/{segment_name}", self.send_segment),
+            web.static("/static", STATIC_DIR),
+        ])
+
+    async def __start(self, app: web.Application) -> None:
+        self.__sess = aiohttp.ClientSession(headers={
             "x-auth-scheme": "api-token",
-            "x-auth-apikey": args.api_key,
-        }
-        self.sess.verify = False
-
-        # Set our port.
-        self.port = args.port
-
-        # Get the federated token
-        self.fetch_federated_token()
-
-        LOGGER.debug("Getting media URIs")
-
-        # Get the media URIs
-        r = self.rhombus_post("/api/camera/getMediaUris", payload={"cameraUuid": args.camera_uuid})
-
-        # If this failed, then we need to fail early.
-        if r.status_code != 200:
-            raise Exception("Failed to get media URIs: {}".format(r.status_code))
-
-        # Get the media URIs response JSON.
-        media_uris_response = r.json()
-
-        # Set our live URI to the LAN URI by default.
-        live_uri = media_uris_response["lanLiveMpdUris"][0]
-
-        try:
-            # Try the LAN connection
-            LOGGER.debug("Trying LAN connection...")
-            r = self.sess.get(live_uri)
-
-            # If we successfully reach here, that means that the LAN connection works.
-            LOGGER.debug("LAN connection successful!")
-        except:
-            # If an exception occurs, then that likely means we will need a WAN connection so fall back.
-            LOGGER.debug("LAN connection failed, falling back to WAN!")
-            live_uri = media_uris_response["wanLiveMpdUri"]
-
-        LOGGER.info("Using live MPD URI %s", live_uri)
-
-        # Fetch the MPD document.
-        LOGGER.debug("Getting MPD doc")
-
-        # The MPD document can be retrieved just by GETting the live URI.
-        r = self.sess.get(live_uri, headers=self.get_media_headers())
-
-        # If there was an error we need to fail early.
-        if r.status_code != 200:
-            raise Exception("Failed to get MPD doc: {}".format(r.status_code))
-
-        # Get the actual MPD document string.
-        mpd_doc = str(r.content, 'utf-8')
-
-        # Parse the raw MPD document string.
-        mpd_info = RhombusMPDInfo(mpd_doc)
-
-        LOGGER.info("Using MPD doc %s", mpd_doc)
-
-        # Create the flask app.
-        self.app = Flask(__name__)
-
-        # The / route will just serve the static HTML files.
-        @self.app.route("/")
-        def send_webpage():
-            # We want to render "index.html" but we also want to use variable "g_URL" to tell the client where it can
-            # get the live MPEG-DASH stream we are re-serving with this server.
-            return flask.render_template("index.html", g_URL=request.url_root + "live.mpd")
-
-        # The /live.mpd route will serve the MPD document that we already retrieved from Rhombus.
-        @self.app.route("/live.mpd")
-        def send_mpd():
-            return flask.Response(mpd_doc, 200)
-
-        # Using the parsed MPD document we can figure out what the init string is, and we will create a path for it
-        # so that we can forward the initial segment. This init_string is, for now, always "seg_init.mp4" so the
-        # route will be "/seg_init.mp4" but this should not be hard-coded in case this gets updated in the future.
-        # Instead, this information can be found in the MPD document.
-        @self.app.route("/" + mpd_info.init_string)
-        def seg_init():
-            # Update the federated token if necessary
-            self.fetch_federated_token()
-
-            LOGGER.debug("Getting initial segment!")
-            # Get the init segment.
-            response = self.sess.get(get_segment_uri(live_uri, mpd_info.init_string), headers=self.get_media_headers())
-
-            # If there was an error, then forward that onto the client.
-            if response.status_code != 200:
-                LOGGER.error("Failed to get init segment: %s", response.reason)
-                return flask.Response(response.reason, response.status_code)
-
-            # Otherwise, just forward those bytes to the client.
-            return flask.Response(response.content, 200)
-
-        # Using the parsed MPD document we can figure out what the segment path is, and we will create it, replacing
-        # "$Number$" with the flask-friendly "<number>" to make it a variable. The client will then make a request to
-        # the route "/seg_<number>.mp4", but again this should not be hard-coded in case it gets updated in the future.
-        @self.app.route("/" + mpd_info.segment_pattern.replace("$Number$", "<number>"))
-        def seg_get(number: str):
-            # Update the federated token if necessary
-            self.fetch_federated_token()
-
-            # Get the segment index.
-            # NOTE: For demonstration purposes, we are removing the start index then adding it back because the dash.js
-            # client will automatically add the start_index as any MPEG-Dash client should.
-
-            # Technically, you can and should just ignore the start_index, but it is something to keep in mind in case
-            # your MPEG-Dash client does not automatically add this start_index.
-            segment_index = int(number) - mpd_info.start_index
-
-            LOGGER.info("Getting segment %d", segment_index)
-
-            # Get the segment.
-            response = self.sess.get(get_segment_uri_index(mpd_info, live_uri, segment_index),
-                                     headers=self.get_media_headers())
-
-            # If there was an error, then forward that onto the client.
-            if response.status_code != 200:
-                LOGGER.error("Failed to get segment %d: %s", segment_index, response.reason)
-                return flask.Response(response.reason, response.status_code)
-
-            # Otherwise, just forward those bytes to the client.
-            return flask.Response(response.content, 200)
-
-    def rhombus_post(self, path: str, payload=None, headers=None) -> requests.Response:
+            "x-auth-apikey": self.args.api_key,
+        }, connector=aiohttp.TCPConnector(ssl=False))
+
+        # The token manager generates tokens from its own thread, so it sends the request on our event loop and waits
+        loop = asyncio.get_running_loop()
+
+        def fetch(duration_sec: int) -> str:
+            response = asyncio.run_coroutine_threadsafe(
+                self.rhombus_post("/api/org/generateFederatedSessionToken", payload={"durationSec": duration_sec}),
+                loop).result()
+            return response["federatedSessionToken"]
+
+        self.__token_manager = FederatedTokenManager(fetch, FEDERATED_TOKEN_DURATION_SEC)
+        self.__idle_task = asyncio.create_task(self.__close_idle_cameras())
+
+    async def __stop(self, app: web.Application) -> None:
+        self.__idle_task.cancel()
+        await asyncio.gather(self.__idle_task, return_exceptions=True)
+        for camera in self.cameras.values():
+            await camera.close()
+        self.cameras.clear()
+        await self.__sess.close()
+
+    async def rhombus_post(self, path: str, payload=None) -> Dict:
         """Make a POST API request to Rhombus.
 
         :param path: The API endpoint path.
         :param payload: The JSON payload.
-        :param headers: Any headers, if any, in addition to the base API headers which are added by default.
-        :return: The response
+        :return: The response JSON
         """
-        return self.sess.post(API_URL + path, json=payload, headers=headers)
-
-    def fetch_federated_token(self) -> None:
-        """Fetch a new federated token if necessary."""
-        # Get the current seconds since epoch.
-        current_sec = int(time.time())
-
-        # If the last token fetch plus the token duration minus two minutes of buffer is greater than the current 
-        # seconds since epoch, then we can assume that the federated token is still valid.
-        if self.last_token_fetch_sec + FEDERATED_TOKEN_DURATION_SEC - 120 > current_sec:
-            return
+        async with self.__sess.post(API_URL + path, json=payload) as r:
+            # If something went wrong, then we need to fail early.
+            if r.status != 200:
+                raise ConnectionError("Request to {} failed: {}".format(path, r.status))
+            return await r.json()
 
-        LOGGER.info("Fetching federated token...")
+    async def fetch_federated_token(self, force: bool = False) -> None:
+        """Fetch a new federated token if necessary.
 
-        # Request a federated token.
-        r = self.rhombus_post("/api/org/generateFederatedSessionToken",
-                              payload={"durationSec": FEDERATED_TOKEN_DURATION_SEC})
+        The token manager refreshes the token in the background before it expires, so this usually just picks up the
+        current token without waiting.
 
-        # If something went wrong, then we need to fail early.
-        if r.status_code != 200:
-            raise Exception("Failed to retrieve federated session token, cannot continue: {}".format(r.status_code))
+        :param force: Fetch a new token even if the current one should still be valid, for example because a camera
+                      rejected it. If another request already replaced the rejected token, that one is used instead.
+        """
+        token = await self.__token_manager.get_token_async(
+            stale_token=self.federated_token if force else None)
 
-        # Update our federated token.
-        self.federated_token = r.json()["federatedSessionToken"]
-        # Update our last token fetch.
-        self.last_token_fetch_sec = current_sec
-        LOGGER.info("Received new federated token!")
+        if token != self.federated_token:
+            self.federated_token = token
+            LOGGER.info("Received new federated token!")
 
-    def get_media_headers(self) -> dict[str, str]:
+    def get_media_headers(self) -> Dict[str, str]:
         """Get the headers that need to be attached to a media URI request to include the federated token.
 
         :return: The header dictionary
         """
         return {"Cookie": "RSESSIONID=RFT:" + self.federated_token}
 
+    async def get_camera(self, camera_uuid: str) -> CameraStream:
+        """Get a connected camera, connecting to it if nobody is watching it yet.
+
+        :param camera_uuid: The UUID of the camera.
+        :return: The camera stream.
+        """
+        camera = self.cameras.get(camera_uuid)
+        if camera is not None:
+            return camera
+
+        # Only connect once even if several viewers show up at the same time.
+        lock = self.__camera_locks.setdefault(camera_uuid, asyncio.Lock())
+        async with lock:
+            camera = self.cameras.get(camera_uuid)
+            if camera is not None:
+                return camera
+
+            LOGGER.info("Connecting to camera %s", camera_uuid)
+
+            # Get the media URIs
+            media_uris = await self.rhombus_post("/api/camera/getMediaUris", payload={"cameraUuid": camera_uuid})
+
+            camera = await CameraStream.open(camera_uuid, media_uris, self.args.connections,
+                                             self.fetch_federated_token, self.get_media_headers, self.args.prefetch,
+                                             self.args.buffer)
+            self.cameras[camera_uuid] = camera
+            return camera
+
+    async def __close_idle_cameras(self) -> None:
+        while True:
+            await asyncio.sleep(CAMERA_IDLE_TIMEOUT_SEC / 5)
+
+            for camera_uuid, camera in list(self.cameras.items()):
+                if camera.last_request_sec + CAMERA_IDLE_TIMEOUT_SEC < time.time():
+                    LOGGER.info("Nobody is watching camera %s, disconnecting", camera_uuid)
+                    del self.cameras[camera_uuid]
+                    await camera.close()
+
+    async def send_index(self, request: web.Request) -> web.StreamResponse:
+        """Show the camera given on the commandline."""
+        if self.args.camera_uuid is None:
+            return web.Response(text="Watch a camera at /cam/<camera_uuid>/")
+        raise web.HTTPFound("/cam/" + self.args.camera_uuid + "/")
+
+    async def send_webpage(self, request: web.Request) -> web.StreamResponse:
+        """Serve the web page that plays the stream of a camera."""
+        # The web page gets the stream relative to itself, so make sure the URL ends in a slash.
+        if not request.path.endswith("/"):
+            raise web.HTTPFound(request.path + "/")
+        return web.FileResponse(os.path.join(STATIC_DIR, "index.html"))
+
+    async def send_mpd(self, request: web.Request) -> web.StreamResponse:
+        """Serve the MPD document of a camera, connecting to the camera if necessary."""
+        try:
+            camera = await self.get_camera(request.match_info["camera_uuid"])
+        except (aiohttp.ClientError, ConnectionError, KeyError) as e:
+            LOGGER.error("Failed to connect to camera %s: %s", request.match_info["camera_uuid"], e)
+            raise web.HTTPBadGateway(text=str(e))
+
+        return web.Response(text=camera.mpd_doc, content_type="application/dash+xml")
+
+    async def send_segment(self, request: web.Request) -> web.StreamResponse:
+        """Forward the initial segment or a live segment of a camera to the client."""
+        camera = self.cameras.get(request.match_info["camera_uuid"])
+        segment_name = request.match_info["segment_name"]
+
+        # Segments are only requested after the MPD document, so if we are not connected the camera was disconnected
+        # while idle. Have the client start over by getting the MPD document again.
+        if camera is None:
+            raise web.HTTPNotFound(text="Camera is not connected, get live.mpd first")
+
+        try:
+            # The init string and segment names come from the MPD document and should not be hard-coded in case they
+            # get updated in the future.
+            if segment_name == camera.mpd_info.init_string:
+                LOGGER.debug("Getting initial segment of camera %s!", camera.camera_uuid)
+                data = await camera.get_init_segment()
+            else:
+                number = camera.get_segment_number(segment_name)
+                if number is None:
+                    raise web.HTTPNotFound()
+
+                LOGGER.debug("Getting segment %d of camera %s", number, camera.camera_uuid)
+                data = await camera.get_segment(number, PREFETCH_TIMEOUT_SEC)
+        except (aiohttp.ClientError, ConnectionError) as e:
+            # If there was an error, then forward that onto the client.
+            LOGGER.error("Failed to get %s of camera %s: %s", segment_name, camera.camera_uuid, e)
+            raise web.HTTPBadGateway(text=str(e))
+
+        return web.Response(body=data, content_type="video/mp4")
+
     def execute(self) -> None:
-        """Run the flask web-server."""
-        self.app.run(port=self.port)
+        """Run the aiohttp web-server."""
+        web.run_app(self.app, host=self.args.host, port=self.args.port)
 
 
 def init(argv: List[str]) -> None:
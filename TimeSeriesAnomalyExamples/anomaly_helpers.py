@@ -14,6 +14,9 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.ensemble import IsolationForest
 from docx import Document
 
+# Segment cache shared by every grab_footage() call, so overlapping outlier windows are only downloaded once
+FOOTAGE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'footage_cache')
+
 
 def calc_percent_NAs(df):
     '''
@@ -137,8 +140,8 @@ def grab_footage(api_key, device_id, duration,start_time,outlier_num,column,dire
     # Creates path for copy_footage_to_local_storage.py to output the footage to.
     output_path = directory + f'/output{column}{outlier_num}.mp4'
 
-    # Running copy_footage_to_local_storage.py
-    os.system(f'python3 copy_footage_to_local_storage.py --api_key {api_key} --device_id {device_id} --output {output_path} --start_time {start_time} --duration {duration}')
+    # Running copy_footage_to_local_storage.py. Repeated pulls of overlapping footage are served from the segment cache
+    os.system(f'python3 copy_footage_to_local_storage.py --api_key {api_key} --device_id {device_id} --output {output_path} --start_time {start_time} --duration {duration} --cache_dir {FOOTAGE_CACHE_DIR}')
 
 def footage_call(column_footage_dates,api_key, device_id, duration,column, new_dir_path):
 
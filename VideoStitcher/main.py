@@ -21,15 +21,18 @@
 ###################################################################################
 
 import math
+import time
 
 # Import sys and argparse for cmd args
 import sys
-
-# Import requests to create our http client
-import requests
+import argparse
 
 sys.path.append('../')
 
+# Import the shared media client and segment cache to create our http client
+from rhombus_media_client import MediaClient
+from rhombus_segment_cache import SegmentCache
+
 # Import RhombusAPI to create our Api Client
 import RhombusAPI as rapi
 
@@ -41,12 +44,16 @@ from logging_utils.colors import LogColors
 
 # Import all of our services which will do the heavy lifting
 from rhombus_environment.environment import Environment
+from rhombus_services.arg_parser import parse_arguments
 from rhombus_services.camera_list import get_camera_list
 from rhombus_services.prompt_user import prompt_user
+from rasterization.coverage_index import new_coverage_index
 from pipeline.detection_pipeline import detection_pipeline
 from pipeline.related_events_pipeline import related_events_pipeline
 from pipeline.related_event_isolator_pipeline import related_event_isolator_pipeline
 from pipeline.clip_combiner_pipeline import clip_combiner_pipeline
+from pipeline.streaming_pipeline import Chain, StreamingPipeline
+from rhombus_types.events import FinalizedEvent
 
 
 class Main:
@@ -61,7 +68,7 @@ class Main:
     __api_key: str
     __api_client: rapi.ApiClient
     __connection_type: ConnectionType
-    __http_client: requests.sessions.Session
+    __http_client: MediaClient
 
     def __init__(self) -> None:
         """Constructor for the Main class, which will initialize all of the clients and arguments
@@ -88,14 +95,26 @@ class Main:
             print(
                 LogColors.WARNING + "Running in WAN mode! This is not recommended if it can be avoided." + LogColors.ENDC)
 
-        # Create an HTTP client
-        self.__http_client = requests.sessions.Session()
+        # If the user specifies AUTO, then we race LAN and WAN and use whichever is faster
+        elif Environment.get().connection_type == "AUTO":
+            self.__connection_type = ConnectionType.AUTO
+
+        # Stitched clips often overlap, so if a segment cache is configured segments are only downloaded once
+        segment_cache = None
+        if Environment.get().segment_cache_dir:
+            segment_cache = SegmentCache(Environment.get().segment_cache_dir, Environment.get().segment_cache_max_mb * 1024 * 1024)
+
+        # Create an HTTP client. This pools and keeps alive our connections to the cameras for every clip we download
+        self.__http_client = MediaClient(segment_cache=segment_cache)
 
     def execute(self):
         """Entry Point"""
         # Get a list of available cameras
         cam_list = get_camera_list(self.__api_client)
 
+        # Camera positions never change within a run, so work out each camera's surroundings once and reuse it for every exit event
+        coverage_index = new_coverage_index(cam_list, Environment.get().camera_selection_mode, Environment.get().pixels_per_meter, Environment.get().coverage_index_dir)
+
         # Get the selected event
         selected_event = prompt_user(api_client=self.__api_client, cameras=cam_list)
 
@@ -109,7 +128,7 @@ class Main:
         # If there are more than one exit event found, that means we can continue
         if len(res) > 0:
             # Look for related events
-            events = related_events_pipeline(self.__api_client, res, cam_list)
+            events = related_events_pipeline(self.__api_client, res, cam_list, coverage_index)
 
             # Then isolate those related events
             events = related_event_isolator_pipeline(events)
@@ -123,7 +142,51 @@ class Main:
                     if event.following_event != None:
                         clip_combiner_pipeline(api_key=self.__api_key, http_client=self.__http_client, api_client=self.__api_client, type=self.__connection_type, event=event)
 
+    def stream(self, stitch: bool) -> None:
+        """Entry point for the streaming mode, which follows everyone across all of the cameras as it happens and never returns
+
+        :param stitch: Whether to stitch the footage of every finished chain
+        """
+
+        # Get a list of available cameras
+        cam_list = get_camera_list(self.__api_client)
+
+        coverage_index = new_coverage_index(cam_list, Environment.get().camera_selection_mode, Environment.get().pixels_per_meter, Environment.get().coverage_index_dir)
+
+        def on_chain(chain: Chain, event: FinalizedEvent, finished: bool) -> None:
+            # Print where the person has been so far
+            cameras = list()
+            following = event
+            while following != None:
+                cameras.append(following.data[0].camera.uuid)
+                following = following.following_event
+
+            print(LogColors.OKGREEN + ("Finished" if finished else "Updated") + " chain " + str(chain.id) + ": " + " -> ".join(cameras) + LogColors.ENDC)
+
+            # Only stitch once the chain is finished, since the output directory is only ever written once
+            if finished and stitch:
+                clip_combiner_pipeline(api_key=self.__api_key, http_client=self.__http_client, api_client=self.__api_client, type=self.__connection_type, event=event)
+
+        # Start following people from now, minus the lag that Rhombus needs to have the bounding boxes
+        start_time = math.floor(time.time()) - StreamingPipeline.lag_seconds()
+
+        print("Following people across " + str(len(cam_list)) + " cameras")
+
+        StreamingPipeline(self.__api_client, cam_list, on_chain, start_time, coverage_index).run()
+
 
 if __name__ == "__main__":
+    # Parse the cmd args
+    args: argparse.Namespace = parse_arguments(sys.argv[1:])
+
+    # The cmd args override the .env file
+    if args.api_key:
+        Environment.get().api_key = args.api_key
+    if args.connection_type:
+        Environment.get().connection_type = args.connection_type
+
     # Start the main runner
-    Main().execute()
+    if args.daemon:
+        Main().stream(args.stitch)
+    else:
+        Main().execute()
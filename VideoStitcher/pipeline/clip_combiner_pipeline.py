@@ -22,32 +22,33 @@
 
 import RhombusAPI as rapi
 import math
-import io
 import os
 import pathlib
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from rhombus_media_client import MediaClient
 
 from rhombus_types.events import FinalizedEvent
 from rhombus_services.vod_fetcher import fetch_vod
-from rhombus_services.media_uri_fetcher import fetch_media_uris
+from rhombus_services.media_uri_fetcher import fetch_federated_token, fetch_vod_uri
 from rhombus_environment.environment import Environment
+from rhombus_utils.fmp4 import FMP4Error, concat_fmp4
 
 from rhombus_types.connection_type import ConnectionType
 
 # Import Subprocess to execute the ffmpeg command
 import subprocess
 
-def download_finalized_event_recursive(api_key: str, http_client: requests.sessions.Session, api_client: rapi.ApiClient, type: ConnectionType, event: FinalizedEvent, dir: str, vidlist: io.TextIOBase, index: int = 0) -> None:
-    """Downloads finalized events
+# How long in seconds the federated token should last for each clip of the chain
+FEDERATED_TOKEN_SECONDS_PER_CLIP = 60
 
-    :param api_key: The API key for sending requests to Rhombus
-    :param http_client: The HTTP Client to download the files with which is initialized at startup
-    :param api_client: The API Client for sending requests to Rhombus
-    :param type: Whether to use LAN or WAN for the connection, by default LAN and unless you are on a different connection, you should really just use LAN
-    :param event: The event to download the VOD from
-    :param dir: The directory to output the VOD
-    :param vidlist: The list of videos write buffer
-    :param index: The recursive download index. When this function calls itself it will increase this value, you shouldn't really ever set this manually when calling the function.
+def get_clip_times(event: FinalizedEvent, index: int) -> Tuple[int, int]:
+    """Gets the times in seconds to download the clip of an event in a chain from, with padding
+
+    :param event: The event to download the clip of
+    :param index: The index of the event in the chain
+    :return: Returns the start and end time in seconds of the clip
     """
 
     # We are going to get our start time in seconds (thus divided by 1000) and then we will add a bit of padding to make sure we really download the full clip.
@@ -57,28 +58,50 @@ def download_finalized_event_recursive(api_key: str, http_client: requests.sessi
     # For the end time we will do the same thing. The end time has padding as well.
     end_time = math.ceil(event.end_time / 1000 + (Environment.get().clip_combination_edge_padding_miliseconds / 1000 if event.following_event == None else Environment.get().clip_combination_padding_miliseconds / 1000))
 
-    # Get the camera UUID
-    cam_uuid = event.data[0].camera.uuid
+    return start_time, end_time
+
+def download_finalized_event(api_key: str, http_client: MediaClient, api_client: rapi.ApiClient, type: ConnectionType, event: FinalizedEvent, dir: str) -> List[str]:
+    """Downloads the clips of every event in a finalized event chain at the same time
+
+    :param api_key: The API key for sending requests to Rhombus
+    :param http_client: The HTTP Client to download the files with which is initialized at startup
+    :param api_client: The API Client for sending requests to Rhombus
+    :param type: Whether to use LAN or WAN for the connection, by default LAN and unless you are on a different connection, you should really just use LAN
+    :param event: The first event of the chain to download the VODs of
+    :param dir: The directory to output the VODs
+    :return: Returns the file names of the downloaded clips in the order of the chain. They will be stored as "<dir>/<index>.mp4"
+    """
+
+    # Flatten the chain so that every clip can be downloaded at once
+    events: List[FinalizedEvent] = list()
+    while event != None:
+        events.append(event)
+        event = event.following_event
+
+    # One federated token works for every camera, so only one is generated for the whole chain.
+    # It lasts as long as all of the clips would take if they were downloaded one after another
+    federated_token = fetch_federated_token(api_client, FEDERATED_TOKEN_SECONDS_PER_CLIP * len(events))
+
+    def download(index: int) -> str:
+        start_time, end_time = get_clip_times(events[index], index)
 
-    # Fetch the media URIs using our type
-    uri, federated_token = fetch_media_uris(api_client, cam_uuid, 60, type)
-    
-    # Download the VOD. It will be stored in a file "<dir>/<index>.mp4"
-    fetch_vod(api_key, http_client, federated_token, uri, type, dir, str(index) + ".mp4", start_time, end_time)
+        # Get the camera UUID
+        cam_uuid = events[index].data[0].camera.uuid
 
-    # The mp4 VOD that we download will need to be added to the vidlist.txt
-    data = "file ''" + str(index) + ".mp4'\n";
-    
-    # Write to the vidlist
-    vidlist.write(data);
+        # Fetch the VOD URI using our type
+        uri = fetch_vod_uri(api_client, cam_uuid, type)
 
-    if event.following_event != None:
-        # We will increase our index by 1 when calling this method and pass in our event.followingEvent as the event
-        return download_finalized_event_recursive(api_key, http_client, api_client, type, event.following_event, dir, vidlist, index + 1)
+        # Download the VOD. It will be stored in a file "<dir>/<index>.mp4"
+        file_name = str(index) + ".mp4"
+        fetch_vod(api_key, http_client, federated_token, uri, type, dir, file_name, start_time, end_time, cam_uuid)
 
+        return file_name
 
+    # The media client runs every download on its own event loop, so these threads only wait for it while the segments of every clip download at the same time
+    with ThreadPoolExecutor(max_workers=max(1, min(Environment.get().clip_download_concurrency, len(events))), thread_name_prefix="clip-download") as executor:
+        return list(executor.map(download, range(len(events))))
 
-def clip_combiner_pipeline(api_key: str, http_client: requests.sessions.Session, api_client: rapi.ApiClient, type: ConnectionType, event: FinalizedEvent) -> None:
+def clip_combiner_pipeline(api_key: str, http_client: MediaClient, api_client: rapi.ApiClient, type: ConnectionType, event: FinalizedEvent) -> None:
     """Downloads a finalized event chain and then combines the downloaded clips into one stitched video
 
     :param api_key: The API key for sending requests to Rhombus
@@ -99,16 +122,21 @@ def clip_combiner_pipeline(api_key: str, http_client: requests.sessions.Session,
     # Make the directory (since we already check to make sure it doesn't already exist, we can just do this)
     pathlib.Path(dir).mkdir(parents=True, exist_ok=True)
 
-    # Open the vidlist file so that we can write to it
-    with open(dir + "vidlist.txt", "w") as vidlist:
+    # Download the VODs
+    file_names = download_finalized_event(api_key=api_key, http_client=http_client, api_client=api_client, type=type, event=event, dir=dir)
 
-        # Download the VOD
-        download_finalized_event_recursive(api_key=api_key, http_client=http_client, api_client=api_client, type=type, event=event, dir=dir, vidlist=vidlist)
+    try:
+        # The downloaded clips are fragmented mp4s, so as long as the cameras use the same codec parameters their fragments can just be copied one after another
+        concat_fmp4([dir + file_name for file_name in file_names], dir + "output.mp4")
+    except FMP4Error as e:
+        print("Could not combine the clips directly (" + str(e) + "), combining them with ffmpeg instead")
 
-        # Close the vidlist file since we are done with it now
-        vidlist.close()
+        # Write the list of clips for ffmpeg
+        with open(dir + "vidlist.txt", "w") as vidlist:
+            for file_name in file_names:
+                vidlist.write("file '" + file_name + "'\n")
 
-    # Run the FFMpeg command to combine the downloaded mp4s based on the vidlist.txt
-    subprocess.run(["ffmpeg", "-f", "concat", "-safe", "0", "-i", dir + "vidlist.txt", "-c", "copy", dir+ "output.mp4"], stdout=subprocess.DEVNULL)
+        # Run the FFMpeg command to combine the downloaded mp4s based on the vidlist.txt
+        subprocess.run(["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", dir + "vidlist.txt", "-c", "copy", dir + "output.mp4"], stdout=subprocess.DEVNULL)
 
     print("Output stitched video in directory " + dir)
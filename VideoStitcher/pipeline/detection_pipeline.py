@@ -84,8 +84,8 @@ def detection_pipeline(api_client: rapi.ApiClient, camera: Camera, object_id: in
 
     print(str(len(exit_events)) + " were found from velocity")
 
-    # Convert our raw map of objectID to HumanEvent[] to an array of ExitEvents
-    events =  exit_events_from_map(exit_events)
+    # Convert our tracks to an array of ExitEvents
+    events =  exit_events_from_map(exit_events.to_map())
 
     # Only include exit events that actually contain our object ID
     filter(lambda event: filter_human_events_by_object_id(event, object_id), events)
@@ -20,208 +20,142 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 
-from typing import Dict, List
+from typing import Tuple
 
-from rhombus_types.human_event import HumanEvent
+from rhombus_types.track_store import TrackStore
 from rhombus_types.events import EdgeEventsType
-from rhombus_utils.velocity import normalize_velocity, normalize_position, get_velocity
-from rhombus_types.vector import Vec2, vec2_compare
 import numpy as np
-import math
 
-def isolate_velocities(events: Dict[int, List[HumanEvent]], type: EdgeEventsType) -> Dict[int, List[HumanEvent]]:
-    """Isolates events and only returns events that pass a certain minimum velocity and have a direction that matches the edge location of the event
+# The minimum speed in permyriad / milisecond for a track to count as moving
+MINIMUM_VELOCITY = 0.015 / 1000
 
-    :param events: A map of objectID to human event list    
-    :param type: Whether or not we are isolating based on enter or exit events
-    :return: Returns only events that pass a certain minimum velocity and have a direction that matches the edge location of the event
-    """
+# How close to the edge (from 0-1) the last event of an exit event has to be to count as being on that edge
+END_EDGE_THRESHOLD = 0.4
 
-    # Loop through all of the events
-    for id in list(events.keys()):
-        es = events[id]
+# How close to the edge (from 0-1) the first event of an enter event has to be to count as being on that edge
+BEGIN_EDGE_THRESHOLD = 0.5
 
-        # Declare our velocity
-        velocity: np.ndarray 
+# The maximum number of velocities between consecutive events we look at for each track
+MAXIMUM_VELOCITY_COUNT = 3
 
-        # Get our beginning and final events
-        begin_event = es[0]
-        final_event = es[len(es) - 1]
+def _sign(values: np.ndarray) -> np.ndarray:
+    """Normalizes values so that they are either -1, 0, or 1 and nothing in between, see `normalize_velocity`.
+
+    :param values: The values to normalize
+    :return: Returns 1 where the value is positive, -1 where it is negative and 0 otherwise
+    """
 
-        # We will get the velocities between the human events and store them here.
-        # These will later be ranked and we will come out with a final average velocity.
-        velocities: List[np.ndarray] = list()
+    return (values > 0).astype(np.int64) - (values < 0).astype(np.int64)
 
-        if type == EdgeEventsType.Begin:
-            # If we are looking for begin events, start from the beginning and get all of the velocities up to 4 elements or until we run out of human events to get velocities for
-            for i in range(1, min(4, len(es))):
-                # We will get the previous event
-                previous_event = es[i - 1]
+def _normalize_position(values: np.ndarray, threshold: float) -> np.ndarray:
+    """Normalizes positions so that they are either -1, 0, or 1 and nothing in between, see `normalize_position`.
 
-                # And the current event
-                current_event = es[i]
+    :param values: The positions to normalize
+    :param threshold: The threshold at which a position can be considered non 0
+    :return: Returns 1 where the position is past `1 - threshold`, -1 where it is before `threshold` and 0 otherwise
+    """
 
-                # And get the velocity between these two human events
-                velocity = get_velocity(previous_event, current_event)
+    return (values > 1 - threshold).astype(np.int64) - (values < threshold).astype(np.int64)
 
-                # Then add the velocity to the array
-                velocities.append(velocity)
+def _average_velocity(velocities: np.ndarray, valid: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Gets the average velocity of each track on one axis, only counting the velocities that go in the most common direction.
 
-        elif type == EdgeEventsType.End:
-            # If we are looking for begin events, start from the end and get all of the velocities up to 4 elements or until we run out of human events to get velocities for
-            for i in range(len(es) - 2, max(len(es) - 5, -1), -1):
-                # We will get the following event
-                following_event = es[i + 1]
+    :param velocities: The velocities on one axis, with a row for each track and a column for each of the velocities
+    :param valid: Which of the velocities should be counted
+    :return: Returns the average velocity of each track, and whether there was a tie between the two directions (in which case there is no average)
+    """
 
-                # And the current event
-                current_event = es[i]
+    # Normalize the velocities and tally the number of positive and negative velocities for ranking
+    signs = np.where(valid, _sign(velocities), 0)
+    pos_count = np.count_nonzero(signs > 0, axis=1)
+    neg_count = np.count_nonzero(signs < 0, axis=1)
 
-                # And get the velocity between the two
-                velocity = get_velocity(current_event, following_event)
+    # Figure out the winner, and use that as our check
+    check = np.where(pos_count > neg_count, 1, -1)
+    tie = pos_count == neg_count
 
-                # Then add the velocity to the array
-                velocities.append(velocity)
+    # We don't want to take the average of velocities that are going in the opposite direction.
+    # We only want to worry about the velocities that match the most common direction and use that as the average.
+    matching = np.where(signs == check[:, np.newaxis], velocities, 0.0)
 
-        # If we have an even number of velocities, remove the last one so that we can properly rank
-        if len(velocities) % 2 == 0:
-            velocities.pop()
+    # Add them up one column at a time so the result is exactly the same as adding them up one by one
+    total = np.zeros(len(velocities))
+    for column in range(velocities.shape[1]):
+        total = total + matching[:, column]
 
-        # Next we are going to tally the number of positive and negative X direction velocities, see which one wins, then get the average X velocity based on that
+    # Avoid division by 0, ties are thrown out by the caller anyways
+    return total / np.maximum(np.maximum(pos_count, neg_count), 1), tie
 
-        # We are going to count the number of negative and positive velocities for ranking
-        neg_count = 0
-        pos_count = 0
+def isolate_velocities(events: TrackStore, type: EdgeEventsType) -> TrackStore:
+    """Isolates events and only returns events that pass a certain minimum velocity and have a direction that matches the edge location of the event.
+    Every track is done at once with numpy.
 
-        # Loop through all of the velocities
-        for i in range(0, len(velocities)):
-            # Normalize the velocities
-            normalized_velocity = normalize_velocity(velocities[i])
-
-            if normalized_velocity[0] > 0:
-                # If the normalized velocity is 1, increase the positive tally
-                pos_count += 1
-
-            elif normalized_velocity[0] < 0:
-                # If the normalized velocity is -1, increase the negative tally
-                neg_count += 1
-
-            # If the normalized velocity is 0 then we won't worry about it.
-            # This will almost never happen because there will almost certainly be differences in the bounding box position, even if small.
-            # Since our threshold is just 0, there just needs to be any change in position AT ALL to consider it.
-
-        # Figure out the winner, and use that as our check
-        check = 1 if pos_count > neg_count else -1
-
-        # Avoid division by 0
-        if pos_count == neg_count: 
-            continue
-
-        # Here we will accumulate our total velocity in the X axis
-        total_velocity_x: float = 0
-
-        # Loop through all of the velocities
-        for velocity in velocities: 
-            # Normalize the velocity
-            normalized_velocity = normalize_velocity(velocity)
-
-            # If the normalized velocity is the same as our check, that means that we will add it to our total velocity. 
-            # For example if the check is 1 (meaning right) if the normalized velocity is also 1, then this velocity is also going right and we should consider it
-            # We don't want to take the average of velocities that are going in the opposite direction. 
-            # We only want to worry about the velocities that match the most common direction and use that as the average.
-            if normalized_velocity[0] == check:
-                total_velocity_x += velocity[0]
-
-        # Finally here is our average velocity
-        avg_velocity_x = total_velocity_x / max(pos_count, neg_count)
-
-        # Reset the tally, and do the same thing on the Y axis
-        neg_count = 0
-        pos_count = 0
-
-        # Loop through all of the velocities
-        for i in range(0, len(velocities)):
-            # Normalize the velocities
-            normalized_velocity = normalize_velocity(velocities[i])
-
-            if normalized_velocity[1] > 0:
-                # If the normalized velocity is 1, increase the positive tally
-                pos_count += 1
-            elif normalized_velocity[1] < 0:
-                # If the normalized velocity is -1, increase the negative tally
-                neg_count += 1
-
-            # If the normalized velocity is 0 then we won't worry about it.
-            # This will almost never happen because there will almost certainly be differences in the bounding box position, even if small.
-            # Since our threshold is just 0, there just needs to be any change in position AT ALL to consider it.
-
-        # Figure out the winner, and use that as our check
-        check = 1 if pos_count > neg_count else -1
-
-        # Avoid division by 0
-        if pos_count == neg_count: 
-            continue
-
-        # Here we will accumulate our total velocity in the Y axis
-        total_velocity_y: float = 0
-
-        # Loop through all of the velocities
-        for velocity in velocities:
-            # Normalize the velocity
-            normalized_velocity = normalize_velocity(velocity)
-
-            # If the normalized velocity is the same as our check, that means that we will add it to our total velocity. 
-            # For example if the check is 1 (meaning down) if the normalized velocity is also 1, then this velocity is also going down and we should consider it
-            # We don't want to take the average of velocities that are going in the opposite direction. 
-            # We only want to worry about the velocities that match the most common direction and use that as the average.
-            if normalized_velocity[1] == check:
-                total_velocity_y += velocity[1]
-
-        # Finally here is our average velocity
-        avg_velocity_y = total_velocity_y / max(pos_count, neg_count)
-
-        # Our velocity is the two average velocities
-        velocity = Vec2(avg_velocity_x, avg_velocity_y)
-
-        # Next we will check to make sure that the magnitude abolute value of the velocity is greater than the threshold.
-        if vec2_compare(np.absolute(velocity), 0.015 / 1000) == 1:
-            # If the velocity doesn't meet the threshold then we will delete the event
-            del events[final_event.id]
-
-        else:
-            # Get the normalized velocity
-            normalized_velocity = normalize_velocity(velocity)
-
-            # Next we need to make sure that the position of the human is on the edge of the screen is matches the velocity. If they are moving right, we want to make sure that 
-            #
-            # Because normalization will only give us a value of -1, 1, or 0, we can simply subtract the normalized position from the normalized velocity
-            # to make sure that they velocity is in the same direction as the position on the edge.
-            # 
-            # For example, if our normalized position on the x axis is 1, that means that the person is near the right of the screen. 
-            # We want to make sure that our velocity is going in the right direction. 
-            # For a type of EdgeEventsType.End, this means that the normalized velocity is also going right, or 1.
-            # For a type of EdgeEventsType.Begin, this means that the normalized velocity is going left, or -1.
-            #
-            # Based on these normalized values, we can simply subtract the normalized position from the normalized velocity to see that if it is an exit event it should be 0
-            # and if it is an enter event it should NOT be 0
-            #
-            #
-            # TLDR: Subtract the normalized position from the normalized velocity to make sure that it is going in the correct direction
-            if type == EdgeEventsType.End:
-                # If we are isolating based on exit events then we will normalize the position of the final event
-                normalized_position = normalize_position(final_event.position, Vec2(0.4, 0.4))
-
-                # Then we will compare the normalized position to the normalized velocity. Since this is an exit event we want these to match and thus be 0
-                if normalized_velocity[0] - normalized_position[0] != 0 and normalized_velocity[1] - normalized_position[1] != 0:
-                    del events[final_event.id]
-
-            elif type == EdgeEventsType.Begin:
-                # If we are isolating based on exit events then we will normalize the position of the final event
-                normalized_position = normalize_position(begin_event.position, Vec2(0.5, 0.5))
-
-                # Then we will compare the normalized position to the normalized velocity. Since this is an enter event we want these to match and thus NOT be 0
-                if  normalized_velocity[0] - normalized_position[0] == 0 or normalized_velocity[1] - normalized_position[1] == 0:
-                    del events[begin_event.id]
+    :param events: The tracks of human events
+    :param type: Whether or not we are isolating based on enter or exit events
+    :return: Returns only tracks that pass a certain minimum velocity and have a direction that matches the edge location of the event
+    """
 
+    lengths = events.lengths
+    first = events.first_indices
+    last = events.last_indices
+
+    # We will get up to 3 velocities between consecutive human events for each track.
+    # These will later be ranked and we will come out with a final average velocity.
+    # If we have an even number of velocities, we drop the last one so that we can properly rank, which means each track either gets 1 or 3 velocities.
+    velocity_count = np.minimum(MAXIMUM_VELOCITY_COUNT, np.maximum(lengths - 1, 0))
+    velocity_count = velocity_count - (velocity_count % 2 == 0) * (velocity_count > 0)
+
+    # Column `j` of these is the `j`th velocity of each track
+    column = np.arange(MAXIMUM_VELOCITY_COUNT)
+    valid = column[np.newaxis, :] < velocity_count[:, np.newaxis]
+
+    if type == EdgeEventsType.Begin:
+        # If we are looking for begin events, start from the beginning of each track and move forwards
+        current = first[:, np.newaxis] + column
+        following = current + 1
+    else:
+        # If we are looking for end events, start from the end of each track and move backwards
+        following = last[:, np.newaxis] - column
+        current = following - 1
+
+    # Velocities we aren't counting might point outside of their track (or the arrays), so just point them at the first event of their track
+    current = np.where(valid, current, first[:, np.newaxis])
+    following = np.where(valid, following, first[:, np.newaxis])
+
+    # Get the velocities between the human events in permyriad / milisecond, the same as `get_velocity`
+    elapsed = (events.timestamps[following] - events.timestamps[current]).astype(np.float64)
+    moving = valid & (elapsed != 0)
+    velocity_x = np.divide(events.x[following] - events.x[current], elapsed, out=np.zeros(elapsed.shape), where=moving)
+    velocity_y = np.divide(events.y[following] - events.y[current], elapsed, out=np.zeros(elapsed.shape), where=moving)
+
+    # Get the average velocity of each track on each axis
+    average_x, tie_x = _average_velocity(velocity_x, valid)
+    average_y, tie_y = _average_velocity(velocity_y, valid)
+
+    # Next we will check to make sure that the magnitude of the velocity is greater than the threshold.
+    too_slow = np.sqrt(np.square(average_x) + np.square(average_y)) < MINIMUM_VELOCITY
+
+    # Get the normalized velocity
+    normalized_x = _sign(average_x)
+    normalized_y = _sign(average_y)
+
+    # Next we need to make sure that the position of the human is on the edge of the screen is matches the velocity.
+    # Because normalization will only give us a value of -1, 1, or 0, we can simply subtract the normalized position from the normalized velocity
+    # to make sure that they velocity is in the same direction as the position on the edge.
+    if type == EdgeEventsType.End:
+        # For exit events we look at the position of the final event, and we want these to match and thus be 0
+        position_x = _normalize_position(events.x[last], END_EDGE_THRESHOLD)
+        position_y = _normalize_position(events.y[last], END_EDGE_THRESHOLD)
+        wrong_direction = (normalized_x - position_x != 0) & (normalized_y - position_y != 0)
+    else:
+        # For enter events we look at the position of the first event, and we want these to NOT be 0
+        position_x = _normalize_position(events.x[first], BEGIN_EDGE_THRESHOLD)
+        position_y = _normalize_position(events.y[first], BEGIN_EDGE_THRESHOLD)
+        wrong_direction = (normalized_x - position_x == 0) | (normalized_y - position_y == 0)
+
+    # If there is a tie between the directions on either axis, there is nothing to go off of so we keep the track.
+    # Otherwise the track has to be fast enough and going in the right direction.
+    keep = tie_x | tie_y | ~(too_slow | wrong_direction)
 
     # Return the events that made it
-    return events
+    return events.select(keep)
@@ -20,31 +20,45 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 
-from typing import List
+from typing import List, Optional, Tuple, Union
 
 import RhombusAPI as rapi
 import math
 
 from rhombus_types.events import ExitEvent, EdgeEventsType, enter_events_from_map
 from rhombus_types.camera import Camera
-from rhombus_services.human_event_service import get_human_events
+from rhombus_services.human_event_service import get_human_events_concurrently
 from rhombus_environment.environment import Environment
 from pipeline.isolators.velocity_isolator import isolate_velocities
 from pipeline.isolators.event_length_isolator import isolate_events_from_length
-from rasterization.rasterizer import get_valid_cameras
+from rasterization.coverage_index import CoverageIndex, new_coverage_index
+from rasterization.analytic import AnalyticCoverageIndex
 
-def related_events_pipeline(api_client: rapi.ApiClient, exit_events: List[ExitEvent], cameras: List[Camera]) -> List[ExitEvent]: 
+def related_events_pipeline(api_client: rapi.ApiClient, exit_events: List[ExitEvent], cameras: List[Camera], coverage_index: Optional[Union[CoverageIndex, AnalyticCoverageIndex]] = None) -> List[ExitEvent]: 
     """Looks through human events that could be related to our exit event to find a suitable match
 
     :param api_client: The API Client for sending requests to Rhombus
     :param camera: The Camera to look for human events
     :param object_id: The object ID to look for
     :param timestamp: The timestamp at which to look for human events 
+    :param coverage_index: The coverage index of `cameras` to reuse. If None, one is created just for these exit events.
     :return: Returns an array of exit events that match the object ID
     """
+
+    # Rasterizing the cameras is the same for every exit event on the same camera, so the coverage index makes sure it is only done once
+    if coverage_index is None:
+        coverage_index = new_coverage_index(cameras, Environment.get().camera_selection_mode, Environment.get().pixels_per_meter, Environment.get().coverage_index_dir)
+
+    # Get the duration in seconds of how far in the future to look for related human events
+    detection_duration = Environment.get().related_event_detection_duration_seconds
+
+    # First work out every camera we need to look at for every exit event, so that all of the requests can be sent at once
+    lookups: List[Tuple[ExitEvent, Camera]] = list()
+    requests: List[Tuple[Camera, int, int]] = list()
+
     for event in exit_events:    
         # Get a list of valid cameras based on the position of the exit event
-        _cameras: List[Camera] = get_valid_cameras(cameras, event, Environment.get().pixels_per_meter, Environment.get().capture_radius_meters)
+        _cameras: List[Camera] = coverage_index.get_valid_cameras(event, Environment.get().capture_radius_meters)
 
         print("Looking through cameras")
 
@@ -57,24 +71,26 @@ def related_events_pipeline(api_client: rapi.ApiClient, exit_events: List[ExitEv
         # Get the startTime
         start_time = math.floor(events[len(events) - 1].timestamp / 1000)
 
-        # Get the duration in seconds of how far in the future to look for related human events
-        detection_duration = Environment.get().related_event_detection_duration_seconds
-
         # Loop through all of the cameras that are valid
         for other_cam in _cameras:
-            # Get the human events and isolate them from length
-            other_human_events = get_human_events(api_client, other_cam, start_time, detection_duration)
+            lookups.append((event, other_cam))
+            requests.append((other_cam, start_time, detection_duration))
+
+    # Get the human events for all of the cameras in parallel, since otherwise stitching would get slower with every nearby camera
+    results = get_human_events_concurrently(api_client, requests, Environment.get().human_event_concurrency)
 
-            # Collate the events and isolate them from length
-            collated_events = isolate_events_from_length(other_human_events)
+    # Then go through the results in the same order as before
+    for (event, other_cam), other_human_events in zip(lookups, results):
+        # Collate the events and isolate them from length
+        collated_events = isolate_events_from_length(other_human_events)
 
-            # Isolate the events based on their velocities
-            velocity_events = isolate_velocities(collated_events, EdgeEventsType.Begin)
+        # Isolate the events based on their velocities
+        velocity_events = isolate_velocities(collated_events, EdgeEventsType.Begin)
 
-            print("Found " + str(len(velocity_events)) + " related events for camera " + other_cam.uuid)
+        print("Found " + str(len(velocity_events)) + " related events for camera " + other_cam.uuid)
 
-            # Add the related enter events to the exit event
-            event.related_events = event.related_events + enter_events_from_map(velocity_events)
+        # Add the related enter events to the exit event
+        event.related_events = event.related_events + enter_events_from_map(velocity_events.to_map())
 
     # Return the exit events
     return exit_events
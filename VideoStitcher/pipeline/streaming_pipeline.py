@@ -0,0 +1,334 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Callable, Dict, List, Optional, Set, Union
+import math
+import time
+
+import RhombusAPI as rapi
+
+from rhombus_types.camera import Camera
+from rhombus_types.events import EnterEvent, ExitEvent, FinalizedEvent, EdgeEventsType, enter_events_from_map, exit_events_from_map
+from rhombus_types.human_event import HumanEvent
+from rhombus_types.track_store import TrackStore, track_store_from_events
+from rhombus_services.human_event_service import get_human_events_concurrently
+from rhombus_services.bounding_box_store import SETTLE_SECONDS
+from rhombus_environment.environment import Environment
+from pipeline.isolators.edge_event_isolator import isolate_edge_events
+from pipeline.isolators.velocity_isolator import isolate_velocities
+from pipeline.isolators.event_length_isolator import isolate_events_from_length
+from pipeline.pipeline_services.event_collator import can_collate_events, do_collate_enter_and_exit
+from rasterization.coverage_index import CoverageIndex, new_coverage_index
+from rasterization.analytic import AnalyticCoverageIndex
+
+class Chain:
+    """A chain of events following one person from camera to camera while the streaming pipeline is running.
+    Links alternate between the camera the person was seen leaving (an ExitEvent) and the camera they were next seen entering (an EnterEvent).
+
+    :attribute id: A number which identifies this chain, so that updates for the same chain can be told apart from new ones.
+    :attribute links: The events of the chain in order. The first link is always an ExitEvent.
+    :attribute deadline: The time in miliseconds after which, if nothing more has happened, this chain is finished.
+    :attribute valid_cameras: If the last link is an exit, the UUIDs of the cameras the person could show up on next.
+    """
+
+    id: int
+    links: List[EnterEvent]
+    deadline: int
+    valid_cameras: Set[str]
+
+    def __init__(self, id: int, exit_event: ExitEvent):
+        """Constructor for a chain
+
+        :param id: A number which identifies this chain.
+        :param exit_event: The exit event that starts the chain.
+        """
+
+        self.id = id
+        self.links = [exit_event]
+        self.deadline = 0
+        self.valid_cameras = set()
+
+    @property
+    def last(self) -> EnterEvent:
+        """The last link of the chain"""
+
+        return self.links[len(self.links) - 1]
+
+    @property
+    def waiting_for_enter(self) -> bool:
+        """Whether the last link is an exit, so we are waiting to see which camera the person walks into next"""
+
+        return isinstance(self.last, ExitEvent)
+
+    def finalize(self) -> FinalizedEvent:
+        """Converts the chain to finalized events, the same as `related_event_isolator_pipeline` does for the one-shot pipeline.
+
+        :return: Returns the finalized event of the first link, with the rest of the chain following it.
+        """
+
+        following: Optional[FinalizedEvent] = None
+        for link in reversed(self.links):
+            following = FinalizedEvent(id=link.id, data=link.events, following_event=following, start_time=link.events[0].timestamp,
+                                       end_time=link.events[len(link.events) - 1].timestamp)
+
+        return following
+
+class StreamingPipeline:
+    """Follows people across all cameras in near real time, instead of looking at one 10 minute window when the user picks an event.
+
+    Every step only fetches the bounding boxes that are new since the last step and adds them to the tracks that are still open.
+    A track is closed once its object hasn't been seen for a few seconds, and only then is it run through the isolators, once, to see if it is an exit or an enter event.
+    Exits are then matched with enters on the cameras the person could have walked to, the same way `related_events_pipeline` does, and each match extends a chain.
+    Chains are reported as soon as a hand-off happens and once more when they are finished.
+
+    :attribute cameras: The list of cameras to follow people on.
+    :attribute fetched_until: The time in seconds up to which bounding boxes have been fetched.
+    """
+
+    cameras: List[Camera]
+    fetched_until: int
+
+    __api_client: rapi.ApiClient
+    __coverage_index: Union[CoverageIndex, AnalyticCoverageIndex]
+    __on_chain: Callable[[Chain, FinalizedEvent, bool], None]
+    __open_tracks: Dict[str, Dict[int, List[HumanEvent]]]
+    __recent_enters: Dict[str, List[EnterEvent]]
+    __chains: List[Chain]
+    __next_chain_id: int
+
+    def __init__(self, api_client: rapi.ApiClient, cameras: List[Camera], on_chain: Callable[[Chain, FinalizedEvent, bool], None], start_time: int,
+                 coverage_index: Optional[Union[CoverageIndex, AnalyticCoverageIndex]] = None):
+        """Constructor for the streaming pipeline
+
+        :param api_client: The API Client for sending requests to Rhombus
+        :param cameras: The list of cameras to follow people on
+        :param on_chain: Called with the chain, its finalized events, and whether the chain is finished, every time a hand-off happens and when a chain is finished
+        :param start_time: The time in seconds to start following people from
+        :param coverage_index: The coverage index of `cameras` to reuse. If None, one is created.
+        """
+
+        self.cameras = cameras
+        self.fetched_until = start_time
+        self.__api_client = api_client
+        self.__on_chain = on_chain
+
+        if coverage_index is None:
+            coverage_index = new_coverage_index(cameras, Environment.get().camera_selection_mode, Environment.get().pixels_per_meter, Environment.get().coverage_index_dir)
+        self.__coverage_index = coverage_index
+
+        self.__open_tracks = {camera.uuid: dict() for camera in cameras}
+        self.__recent_enters = {camera.uuid: list() for camera in cameras}
+        self.__chains = list()
+        self.__next_chain_id = 0
+
+    @staticmethod
+    def lag_seconds() -> int:
+        """Gets how far behind real time the pipeline stays. Rhombus keeps adding bounding boxes for `SETTLE_SECONDS` after they happen,
+        and every slice is only fetched once, so this is never less than that or the boxes that show up late would be missed.
+
+        :return: Returns the lag in seconds.
+        """
+
+        return max(Environment.get().stream_lag_seconds, SETTLE_SECONDS)
+
+    def run(self) -> None:
+        """Runs the pipeline forever, stepping every `stream_poll_seconds` and staying `lag_seconds()` behind real time, since Rhombus takes a little while to have the bounding boxes."""
+
+        while True:
+            target = math.floor(time.time()) - StreamingPipeline.lag_seconds()
+            if target > self.fetched_until:
+                self.step(target)
+
+            time.sleep(Environment.get().stream_poll_seconds)
+
+    def step(self, until: int) -> None:
+        """Fetches the bounding boxes from `fetched_until` up to `until` and processes them.
+
+        :param until: The time in seconds to fetch bounding boxes up to.
+        """
+
+        # Fetch only the new slice of time from every camera at once
+        duration = until - self.fetched_until
+        slices = get_human_events_concurrently(self.__api_client, [(camera, self.fetched_until, duration) for camera in self.cameras], Environment.get().human_event_concurrency)
+        self.fetched_until = until
+
+        # Time in miliseconds that everything up to has been seen
+        now = until * 1000
+
+        exit_events: List[ExitEvent] = list()
+        for camera, tracks in zip(self.cameras, slices):
+            self.__add_boxes(camera, tracks)
+            exit_events = exit_events + self.__close_tracks(camera, now)
+
+        # Go through the exit events in order, matching the enter events before each one, since a person often walks in and out of a camera as one track,
+        # and then the exit event has to continue the chain that the enter event was added to. This also has to work when the person walked through several cameras since the last step.
+        for exit_event in sorted(exit_events, key=lambda event: event.events[0].timestamp):
+            self.__match()
+            self.__add_exit(exit_event)
+
+        # The new exit events might already have their enter event, if it was closed before
+        self.__match()
+
+        self.__expire(now)
+
+    def __add_boxes(self, camera: Camera, tracks: TrackStore) -> None:
+        """Adds newly fetched human events to the open tracks of a camera.
+
+        :param camera: The camera the human events are from.
+        :param tracks: The new human events.
+        """
+
+        open_tracks = self.__open_tracks[camera.uuid]
+        for track in range(len(tracks)):
+            object_id = int(tracks.object_ids[track])
+            open_tracks.setdefault(object_id, list()).extend(tracks.events(track))
+
+    def __close_tracks(self, camera: Camera, now: int) -> List[ExitEvent]:
+        """Closes every track of a camera whose object hasn't been seen for `stream_track_close_seconds`, and works out whether the closed tracks are exit or enter events.
+        The enter events are kept to be matched later.
+
+        :param camera: The camera to close tracks on.
+        :param now: The time in miliseconds that everything up to has been seen.
+        :return: Returns the exit events of the closed tracks.
+        """
+
+        open_tracks = self.__open_tracks[camera.uuid]
+        close_before = now - Environment.get().stream_track_close_seconds * 1000
+
+        closed: Dict[int, List[HumanEvent]] = dict()
+        for object_id in list(open_tracks.keys()):
+            events = open_tracks[object_id]
+            if events[len(events) - 1].timestamp < close_before:
+                closed[object_id] = open_tracks.pop(object_id)
+
+        if len(closed) == 0:
+            return list()
+
+        tracks = isolate_events_from_length(track_store_from_events(camera, closed))
+
+        # Exit events are isolated the same way as in `detection_pipeline`
+        exit_events = exit_events_from_map(isolate_velocities(isolate_events_from_length(isolate_edge_events(tracks)), EdgeEventsType.End).to_map())
+
+        # And enter events the same way as in `related_events_pipeline`
+        enter_events = enter_events_from_map(isolate_velocities(tracks, EdgeEventsType.Begin).to_map())
+
+        self.__recent_enters[camera.uuid].extend(enter_events)
+
+        return exit_events
+
+    def __add_exit(self, exit_event: ExitEvent) -> None:
+        """Adds an exit event, either continuing the chain of the person who walked into this camera or starting a new chain.
+
+        :param exit_event: The exit event to add.
+        """
+
+        camera_uuid = exit_event.events[0].camera.uuid
+
+        chain: Optional[Chain] = None
+        for other in self.__chains:
+            if other.waiting_for_enter or other.last.events[0].camera.uuid != camera_uuid:
+                continue
+
+            enter_event = other.last
+            if enter_event.id == exit_event.id and exit_event.events[0].timestamp <= enter_event.events[len(enter_event.events) - 1].timestamp:
+                # The person walked in and out as the same track, so the exit event just replaces the enter event
+                other.links[len(other.links) - 1] = exit_event
+                chain = other
+                break
+
+            if can_collate_events(enter_event, exit_event):
+                # The object ID changed in between, but it looks like the same person so combine them, the same as `related_event_isolator_pipeline`
+                other.links[len(other.links) - 1] = do_collate_enter_and_exit(enter_event, exit_event)
+                chain = other
+                break
+
+        if chain is None:
+            chain = Chain(self.__next_chain_id, exit_event)
+            self.__next_chain_id += 1
+            self.__chains.append(chain)
+
+        # Work out which cameras the person could walk into next, and how long we will wait for them to show up
+        last = chain.last
+        chain.valid_cameras = set(camera.uuid for camera in self.__coverage_index.get_valid_cameras(last, Environment.get().capture_radius_meters))
+        chain.deadline = self.__related_window_start(last) + Environment.get().related_event_detection_duration_seconds * 1000
+
+    def __related_window_start(self, exit_event: EnterEvent) -> int:
+        """Gets the start of the window in miliseconds in which related enter events are looked for, the same as `related_events_pipeline`.
+
+        :param exit_event: The exit event.
+        :return: Returns the start of the window in miliseconds.
+        """
+
+        return math.floor(exit_event.events[len(exit_event.events) - 1].timestamp / 1000) * 1000
+
+    def __match(self) -> None:
+        """Matches chains waiting for an enter event with the earliest enter event on one of the cameras the person could have walked to."""
+
+        for chain in sorted(self.__chains, key=lambda chain: chain.deadline):
+            if not chain.waiting_for_enter:
+                continue
+
+            window_start = self.__related_window_start(chain.last)
+
+            best: Optional[EnterEvent] = None
+            for camera_uuid in chain.valid_cameras:
+                for enter_event in self.__recent_enters.get(camera_uuid, list()):
+                    start = enter_event.events[0].timestamp
+                    if start < window_start or start >= chain.deadline:
+                        continue
+                    if best is None or start < best.events[0].timestamp:
+                        best = enter_event
+
+            if best is None:
+                continue
+
+            # The hand-off is complete, so the person now has to leave this new camera before the chain can continue.
+            # The enter event can only be part of one chain, so it is no longer a candidate for any other.
+            self.__recent_enters[best.events[0].camera.uuid].remove(best)
+            chain.links.append(best)
+            chain.deadline = best.events[len(best.events) - 1].timestamp + Environment.get().related_event_detection_duration_seconds * 1000
+
+            self.__on_chain(chain, chain.finalize(), False)
+
+    def __expire(self, now: int) -> None:
+        """Finishes every chain whose deadline has passed, and forgets enter events that are too old to be matched.
+
+        :param now: The time in miliseconds that everything up to has been seen.
+        """
+
+        # Enter events are only known once their track closes, so give them that long to show up before giving up
+        close_delay = Environment.get().stream_track_close_seconds * 1000
+
+        for chain in list(self.__chains):
+            if chain.deadline + close_delay >= now:
+                continue
+
+            self.__chains.remove(chain)
+
+            # An exit that nobody was seen walking out of is not interesting by itself
+            if len(chain.links) > 1:
+                self.__on_chain(chain, chain.finalize(), True)
+
+        # Keep enter events around for as long as an exit event could still match them
+        forget_before = now - (Environment.get().related_event_detection_duration_seconds * 1000 + close_delay) * 2
+        for camera_uuid, enter_events in self.__recent_enters.items():
+            self.__recent_enters[camera_uuid] = [enter_event for enter_event in enter_events if enter_event.events[0].timestamp >= forget_before]
@@ -0,0 +1,131 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Dict, List, Tuple
+
+from rhombus_types.camera import Camera
+from rhombus_types.events import ExitEvent
+from rhombus_services.graph_service import get_camera_plot
+from rhombus_utils.velocity import normalize_velocity
+from rasterization.canvas_size import get_canvas_size
+from rasterization.trapezoid import new_capture_net, rotate_capture_net_from_velocity
+from rasterization.polygon import Point, polygon_bounds, polygon_is_finite, convex_polygons_overlap
+from rasterization.rtree import RTree
+
+class AnalyticScene:
+    """The FOV triangles of every camera around one origin camera, without rasterizing them.
+    Everything is in the origin camera's space, where the origin camera is at (0, 0) facing up, so there is no screen offset.
+
+    :attribute meter_span: The canvas size in meters of all of the cameras. This is still needed because it is the length of the capture net.
+    :attribute triangles: The FOV triangle of each camera (counter clockwise) along with the camera.
+    :attribute tree: An R-tree of the bounding boxes of `triangles`, holding the index into `triangles`.
+    """
+
+    meter_span: float
+    triangles: List[Tuple[Tuple[Point, Point, Point], Camera]]
+    tree: RTree[int]
+
+    def __init__(self, cameras: List[Camera], origin: Camera):
+        """Constructor for an analytic scene
+
+        :param cameras: The list of cameras that exist.
+        :param origin: The camera that will be at the center of the scene and facing up.
+        """
+
+        # Only include cameras that don't match the origin UUID, since we will never "switch" to the same camera UUID.
+        cameras = list(filter(lambda cam: cam.uuid != origin.uuid, cameras))
+
+        # Get the canvas size in meters, the same as when rasterizing
+        self.meter_span = float(get_canvas_size(cameras, origin)[0])
+
+        self.triangles = list()
+        for camera in cameras:
+            plot = get_camera_plot(camera, origin)
+            triangle = tuple((float(plot.x[i]), float(plot.y[i])) for i in range(3))
+
+            # Cameras that aren't on the map have NaN vertices, and would never be hit when rasterizing either
+            if not polygon_is_finite(triangle):
+                continue
+
+            self.triangles.append((triangle, camera))
+
+        self.tree = RTree([(polygon_bounds(triangle), index) for index, (triangle, _) in enumerate(self.triangles)])
+
+class AnalyticCoverageIndex:
+    """The analytic version of `CoverageIndex`. Instead of rasterizing the cameras, the capture net trapezoid is intersected exactly with each camera's FOV triangle.
+    This uses no memory for pixels and scales with the number of cameras instead of the floor area, which matters for sites with hundreds of cameras.
+
+    NOTE: The cameras this returns are a superset of what `CoverageIndex` returns, not always the same. The raster backend only catches a camera when the center of some pixel
+    is inside both the capture net and the camera's FOV, so a camera that only just touches the edge of the capture net can fall between the pixel centers and be missed.
+    The analytic backend catches those too, so it can return a few extra edge-touching cameras. tests/test_coverage_index.py checks this against the raster backend.
+
+    :attribute cameras: The list of cameras that exist.
+    """
+
+    cameras: List[Camera]
+    __scenes: Dict[str, AnalyticScene]
+
+    def __init__(self, cameras: List[Camera]):
+        """Constructor for an analytic coverage index
+
+        :param cameras: The list of cameras that exist.
+        """
+
+        self.cameras = cameras
+        self.__scenes = dict()
+
+    def get_scene(self, origin: Camera) -> AnalyticScene:
+        """Gets the scene of all of the other cameras around an origin camera, building it only the first time.
+
+        :param origin: The camera that will be at the center of the scene.
+        :return: Returns the scene.
+        """
+
+        scene = self.__scenes.get(origin.uuid)
+        if scene is None:
+            scene = AnalyticScene(self.cameras, origin)
+            self.__scenes[origin.uuid] = scene
+        return scene
+
+    def get_valid_cameras(self, exit_event: ExitEvent, capture_radius: float) -> List[Camera]:
+        """Gets a list of valid cameras based on an exit event's velocity and the location of the cameras.
+
+        :param exit_event: The exit event to look for cameras for.
+        :param capture_radius: The capture radius of the net in meters.
+        :return: Returns an array of valid cameras whose FOV shares some area with the capture net.
+        """
+
+        scene = self.get_scene(exit_event.events[0].camera)
+
+        # Create the capture net the same way as the rasterizer, except there is no need to offset it into screen space
+        velocity = normalize_velocity(exit_event.velocity)
+        net = rotate_capture_net_from_velocity(new_capture_net(capture_radius, scene.meter_span), velocity)
+        trapezoid = tuple((float(point[0]), float(point[1])) for point in (net.p0, net.p1, net.p2, net.p3))
+
+        # Use the R-tree to skip every camera whose FOV isn't even near the capture net, and then do the exact test on the rest
+        valid_cameras: List[Camera] = list()
+        for index in scene.tree.query(polygon_bounds(trapezoid)):
+            triangle, camera = scene.triangles[index]
+            if convex_polygons_overlap(trapezoid, triangle):
+                valid_cameras.append(camera)
+
+        return valid_cameras
@@ -0,0 +1,198 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Dict, List, Optional, Union
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from rhombus_types.camera import Camera
+from rhombus_types.events import ExitEvent
+from rasterization.rasterizer import Screen, rasterize_origin, get_valid_cameras_from_screen
+from rasterization.analytic import AnalyticCoverageIndex
+
+# Bump this whenever the way screens are rasterized changes, so that old files on disk are not reused.
+COVERAGE_INDEX_VERSION = 1
+
+def camera_config_key(camera: Camera) -> str:
+    """Gets a string which describes everything about a camera that affects how it is rasterized.
+
+    :param camera: The camera to describe.
+    :return: Returns the description of the camera. Two cameras with the same key will rasterize exactly the same.
+    """
+
+    # repr gives back the shortest string which round trips to the exact same float, so no precision is lost here.
+    return "|".join([camera.uuid, repr(float(camera.rotation_radians)), repr(float(camera.location[0])), repr(float(camera.location[1])),
+                     repr(float(camera.FOV)), repr(float(camera.view_distance))])
+
+def camera_config_hash(cameras: List[Camera], pixels_per_meter: float) -> str:
+    """Hashes a list of cameras and the pixel density they are rasterized at.
+
+    :param cameras: The list of cameras that exist.
+    :param pixels_per_meter: The number of pixels that should be rendered for each meter.
+    :return: Returns a hex digest which changes whenever any camera is added, removed, moved or rotated, or the pixel density changes.
+    """
+
+    sha = hashlib.sha1()
+    sha.update(("v" + str(COVERAGE_INDEX_VERSION) + "|" + repr(float(pixels_per_meter))).encode())
+
+    # Sort the cameras so that the order the API returns them in doesn't matter.
+    for key in sorted(camera_config_key(camera) for camera in cameras):
+        sha.update(b"\n" + key.encode())
+
+    return sha.hexdigest()
+
+class CoverageIndex:
+    """A coverage index holds the rasterized screen of every camera around each origin camera.
+    Camera positions and FOVs never change within a run, so each origin only ever needs to be rasterized once no matter how many exit events there are on it.
+    If a directory is given, the screens are also saved to disk keyed by the camera config hash, so later runs over the same floor plan don't rasterize it again.
+
+    :attribute cameras: The list of cameras that exist.
+    :attribute pixels_per_meter: The number of pixels that should be rendered for each meter.
+    :attribute config_hash: The hash of `cameras` and `pixels_per_meter`, see `camera_config_hash`.
+    :attribute directory: The directory where screens are saved for this config, or None if screens are only kept in memory.
+    """
+
+    cameras: List[Camera]
+    pixels_per_meter: float
+    config_hash: str
+    directory: Optional[str]
+    __screens: Dict[str, Screen]
+
+    def __init__(self, cameras: List[Camera], pixels_per_meter: float, directory: Optional[str] = None):
+        """Constructor for a coverage index
+
+        :param cameras: The list of cameras that exist.
+        :param pixels_per_meter: The number of pixels that should be rendered for each meter.
+        :param directory: The root directory to save screens in. If None, screens are only kept in memory.
+        """
+
+        self.cameras = cameras
+        self.pixels_per_meter = pixels_per_meter
+        self.config_hash = camera_config_hash(cameras, pixels_per_meter)
+        self.directory = os.path.join(directory, self.config_hash) if directory else None
+        self.__screens = dict()
+
+    def get_screen(self, origin: Camera) -> Screen:
+        """Gets the rasterized screen of all of the other cameras around an origin camera, rasterizing it only if it isn't in memory or on disk already.
+
+        :param origin: The camera that will be at the center of the screen.
+        :return: Returns the rasterized screen.
+        """
+
+        # The origin is part of the key too, in case an exit event carries a camera which isn't exactly the one in our list.
+        key = hashlib.sha1(camera_config_key(origin).encode()).hexdigest()
+
+        screen = self.__screens.get(key)
+        if screen is not None:
+            return screen
+
+        path = os.path.join(self.directory, key + ".npz") if self.directory else None
+
+        # Try to load the screen from disk first
+        if path is not None and os.path.exists(path):
+            try:
+                screen = load_screen(path)
+            except (OSError, ValueError, KeyError):
+                # A broken file is just treated as a miss and will be overwritten below.
+                screen = None
+
+        # Otherwise we will actually have to rasterize it
+        if screen is None:
+            screen = rasterize_origin(self.cameras, origin, self.pixels_per_meter)
+
+            if path is not None:
+                save_screen(path, screen)
+
+        self.__screens[key] = screen
+        return screen
+
+    def get_valid_cameras(self, exit_event: ExitEvent, capture_radius: float) -> List[Camera]:
+        """Gets a list of valid cameras based on an exit event's velocity and the location of the cameras. This is the same as `rasterizer.get_valid_cameras` but reuses the screens.
+
+        :param exit_event: The exit event to look for cameras for.
+        :param capture_radius: The capture radius of the net in meters.
+        :return: Returns an array of valid cameras based on location of the cameras and the velocity of the exit event.
+        """
+
+        screen = self.get_screen(exit_event.events[0].camera)
+        return get_valid_cameras_from_screen(self.cameras, exit_event, capture_radius, screen)
+
+def save_screen(path: str, screen: Screen) -> None:
+    """Saves a screen to disk as an npz file.
+
+    :param path: The path of the file to save.
+    :param screen: The screen to save.
+    """
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file and then rename it, so that another process never reads half of a file.
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f,
+                     coverage=screen.coverage,
+                     camera_uuids=np.array(screen.camera_uuids, dtype=str),
+                     meter_span=screen.meter_span,
+                     screen_size=screen.screen_size,
+                     pixel_size=screen.pixel_size,
+                     offset=screen.offset)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def load_screen(path: str) -> Screen:
+    """Loads a screen saved by `save_screen`.
+
+    :param path: The path of the file to load.
+    :return: Returns the loaded screen.
+    """
+
+    with np.load(path, allow_pickle=False) as data:
+        return Screen(coverage=data["coverage"],
+                      camera_uuids=data["camera_uuids"].tolist(),
+                      meter_span=float(data["meter_span"]),
+                      screen_size=int(data["screen_size"]),
+                      pixel_size=float(data["pixel_size"]),
+                      offset=float(data["offset"]))
+
+def new_coverage_index(cameras: List[Camera], mode: str, pixels_per_meter: float, directory: Optional[str] = None) -> Union[CoverageIndex, AnalyticCoverageIndex]:
+    """Creates the coverage index for the selected camera selection mode.
+
+    :param cameras: The list of cameras that exist.
+    :param mode: Either "RASTER" to rasterize the cameras, or "ANALYTIC" to intersect the capture net with each camera's FOV exactly.
+    :param pixels_per_meter: The number of pixels that should be rendered for each meter. Only used when rasterizing.
+    :param directory: The root directory to save rasterized screens in. Only used when rasterizing.
+    :return: Returns the coverage index. Both kinds have the same `get_valid_cameras(exit_event, capture_radius)` method.
+    :raises ValueError: If `mode` is not one of the camera selection modes, so that a typo in `CAMERA_SELECTION_MODE` isn't silently ignored.
+    """
+
+    if mode == "ANALYTIC":
+        return AnalyticCoverageIndex(cameras)
+    if mode == "RASTER":
+        return CoverageIndex(cameras, pixels_per_meter, directory)
+
+    raise ValueError("Unknown camera selection mode " + mode + ", expected RASTER or ANALYTIC")
@@ -0,0 +1,102 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Sequence, Tuple
+import math
+
+# A point as a plain (x, y) tuple. The analytic camera selection uses tuples instead of numpy Vec2s, because for a handful of vertices
+# plain floats are many times faster than creating and indexing small numpy arrays.
+Point = Tuple[float, float]
+
+# A bounding box as (min x, min y, max x, max y).
+Bounds = Tuple[float, float, float, float]
+
+def polygon_bounds(polygon: Sequence[Point]) -> Bounds:
+    """Gets the axis aligned bounding box of a polygon.
+
+    :param polygon: The vertices of the polygon.
+    :return: Returns the bounding box of the polygon.
+    """
+
+    xs = [point[0] for point in polygon]
+    ys = [point[1] for point in polygon]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def bounds_overlap(a: Bounds, b: Bounds) -> bool:
+    """Tests whether two bounding boxes overlap. Boxes that only touch still count as overlapping, since this is only used as a quick filter.
+
+    :param a: The first bounding box.
+    :param b: The second bounding box.
+    :return: Returns true if the bounding boxes overlap.
+    """
+
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def polygon_is_finite(polygon: Sequence[Point]) -> bool:
+    """Tests whether all of the vertices of a polygon are finite numbers. Cameras that aren't on the map end up with NaN vertices.
+
+    :param polygon: The vertices of the polygon.
+    :return: Returns true if none of the vertices are NaN or infinite.
+    """
+
+    return all(math.isfinite(point[0]) and math.isfinite(point[1]) for point in polygon)
+
+def _separated_on_edges(a: Sequence[Point], b: Sequence[Point]) -> bool:
+    """Tests whether any edge normal of polygon `a` is a separating axis between `a` and `b`.
+
+    :param a: The polygon whose edges to test.
+    :param b: The other polygon.
+    :return: Returns true if the polygons are separated along one of `a`'s edge normals.
+    """
+
+    count = len(a)
+    for i in range(count):
+        x0, y0 = a[i]
+        x1, y1 = a[(i + 1) % count]
+
+        # The normal of the edge. It doesn't matter which way it points since we only compare the ranges of the projections.
+        nx = y0 - y1
+        ny = x1 - x0
+
+        # Project both polygons onto the normal
+        a_projections = [nx * x + ny * y for x, y in a]
+        b_projections = [nx * x + ny * y for x, y in b]
+
+        # If the ranges don't overlap with some actual length, then there is a gap (or just a touching edge) between the polygons.
+        if max(min(a_projections), min(b_projections)) >= min(max(a_projections), max(b_projections)):
+            return True
+
+    return False
+
+def convex_polygons_overlap(a: Sequence[Point], b: Sequence[Point]) -> bool:
+    """Tests whether two convex polygons overlap using the separating axis theorem.
+    Two convex polygons do NOT overlap exactly when there is a line between them, and if there is such a line then one of the polygon's edges is parallel to it.
+    So we only need to test the normals of every edge of both polygons.
+
+    NOTE: Polygons that only touch at an edge or a corner do not count as overlapping, the same as the rasterizer which only counts points strictly inside.
+
+    :param a: The vertices of the first convex polygon, in order.
+    :param b: The vertices of the second convex polygon, in order.
+    :return: Returns true if the polygons share some area.
+    """
+
+    return not (_separated_on_edges(a, b) or _separated_on_edges(b, a))
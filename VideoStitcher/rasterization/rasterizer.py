@@ -20,52 +20,47 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 
-from typing import List, Set, Tuple, Union
+from typing import List, Optional, Set, Tuple
 import math
 
-from rhombus_types.vector import Vec2
+import numpy as np
+
 from rhombus_types.camera import Camera
 from rhombus_services.graph_service import get_camera_plot, CameraPlot
 from rhombus_types.events import ExitEvent
 from rhombus_utils.velocity import normalize_velocity
-from rasterization.triangle import Triangle, triangle_from_camera_plot, point_inside_triangle
+from rasterization.triangle import triangle_from_camera_plot, triangle_mask
 from rasterization.canvas_size import get_canvas_size
-from rasterization.trapezoid import new_capture_net, offset_capture_net, rotate_capture_net_from_velocity, point_inside_trapezoid
-
-class Pixel:
-    """A pixel is basically just an array of camera UUIDs which intersect with a pixel when rasterized. 
-
-    :attribute cameras: The array of camera UUIDs which intersect with this pixel when rasterized.
-    We store an array of camera UUIDs because we need to basically "alpha blend" the different cameras, to make sure that when camera's FOV's intersect, they will not be overwritten when rasterizing.
-    This is why we can't store booleans, because we wouldn't have the necessary info of which cameras are where and values would get overwritten.
-    """
-    cameras: List[str]
+from rasterization.trapezoid import new_capture_net, offset_capture_net, rotate_capture_net_from_velocity, trapezoid_mask
 
-    def __init__(self):
-        """Constructor for a pixel"""
-
-        self.cameras = list()
+# The number of camera bits that fit into a single coverage word.
+COVERAGE_WORD_BITS = 64
 
 class Screen:
-    """A screen is the result of rasterizing a list of cameras. It stores a 2D array of pixels so we know where each of the camera's viewports can see.
+    """A screen is the result of rasterizing a list of cameras. It stores a 2D array of coverage bitmasks so we know where each of the camera's viewports can see.
 
-    :attribute pixels: 2D array of pixels which for this screen.
+    :attribute coverage: 2D array (rows x columns x words) of uint64 bitmasks for this screen. Bit `i` of a pixel is set when the camera `camera_uuids[i]` intersects with that pixel when rasterized.
+    We store a bitmask instead of a single value because we need to basically "alpha blend" the different cameras, to make sure that when camera's FOV's intersect, they will not be overwritten when rasterizing.
+    Every 64 cameras take up one more word in the last axis, so any number of cameras can be stored.
+    :attribute camera_uuids: The camera UUIDs in bit order, used to convert a bitmask back into cameras.
     :attribute meter_span: The canvas size in meters of all of the cameras.
     :attribute screen_size: The size in pixels of the square. This is determined from the `meterSpan` and the `pixelSize`.
     :attribute pixel_size: The size in meters of each of the pixels. This will be determined from the provided pixelsPerMeter value. If the pixelsPerMeter value is 10, then `pixelSize` is 1/10 of a meter.
     :attribute offset: The offset in meters that each of the camera's positions are. The Screen has an origin of the top left as (0, 0), whereas previously the origin was the originCamera.
     So in order to convert the camera space to screen space we need to offset all of the cameras by some amount in meters.
     """
-    pixels: List[List[Pixel]]
+    coverage: np.ndarray
+    camera_uuids: List[str]
     meter_span: float
     screen_size: int
     pixel_size: float
     offset: float
 
-    def __init__(self, pixels: List[List[Pixel]], meter_span: float, screen_size: int, pixel_size: float, offset: float):
+    def __init__(self, coverage: np.ndarray, camera_uuids: List[str], meter_span: float, screen_size: int, pixel_size: float, offset: float):
         """Constructor for a screen
 
-        :param pixels: 2D array of pixels which for this screen.
+        :param coverage: 2D array (rows x columns x words) of uint64 bitmasks for this screen. Bit `i` of a pixel is set when the camera `camera_uuids[i]` intersects with that pixel.
+        :param camera_uuids: The camera UUIDs in bit order, used to convert a bitmask back into cameras.
         :param meter_span: The canvas size in meters of all of the cameras.
         :param screen_size: The size in pixels of the square. This is determined from the `meterSpan` and the `pixelSize`.
         :param pixel_size: The size in meters of each of the pixels. This will be determined from the provided pixelsPerMeter value. If the pixelsPerMeter value is 10, then `pixelSize` is 1/10 of a meter.
@@ -73,12 +68,39 @@ class Screen:
         So in order to convert the camera space to screen space we need to offset all of the cameras by some amount in meters.
         """
 
-        self.pixels = pixels
+        self.coverage = coverage
+        self.camera_uuids = camera_uuids
         self.meter_span = meter_span
         self.screen_size = screen_size
         self.pixel_size = pixel_size
         self.offset = offset
 
+    def cameras_from_mask(self, mask: np.ndarray) -> List[str]:
+        """Converts a coverage bitmask (one uint64 per word) back into the list of camera UUIDs whose bits are set.
+
+        :param mask: The bitmask to convert, for example `coverage[row, column]` or several pixels OR'd together.
+        :return: Returns the camera UUIDs whose bits are set in `mask`.
+        """
+
+        cameras: List[str] = list()
+        for word_index, word in enumerate(mask.tolist()):
+            # Walk the set bits of this word. `word & -word` isolates the lowest set bit.
+            while word:
+                bit = (word & -word).bit_length() - 1
+                cameras.append(self.camera_uuids[word_index * COVERAGE_WORD_BITS + bit])
+                word &= word - 1
+        return cameras
+
+    def cameras_at(self, row: int, column: int) -> List[str]:
+        """Gets the camera UUIDs which intersect with a single pixel.
+
+        :param row: The row of the pixel.
+        :param column: The column of the pixel.
+        :return: Returns the camera UUIDs which intersect with this pixel.
+        """
+
+        return self.cameras_from_mask(self.coverage[row, column])
+
 class CaptureNetScreen:
     """This is a screen just for the capture net trapezoid which is a projection of a velocity. This is used to see which cameras are most likely to catch the person walking into the camera.
 
@@ -129,47 +151,48 @@ def rasterize_cameras(cameras: List[CameraPlot], pixels_per_meter: float, meter_
     # Get the offset by dividing the meter span by 2. This converts the origin (the center of the cameras) to the screen space origin (the top left of the screen).
     offset = meter_span / 2
 
-    # Create our array of pixels.
-    pixels: List[List[Pixel]] = list()
+    # Get the position of every pixel in world space.
+    # We will simply multiply the x and y screen position by the pixel size in meters to get the position in world space.
+    # `xs` is a single row and `ys` is a single column, numpy will broadcast them against each other into the full grid so we never have to store it.
+    xs, ys = pixel_grid(screen_size, pixel_size)
+
+    # Create our array of coverage bitmasks, with one 64 bit word for every 64 cameras.
+    word_count = max(1, math.ceil(len(cameras) / COVERAGE_WORD_BITS))
+    coverage = np.zeros((screen_size, screen_size, word_count), dtype=np.uint64)
 
     # Loop through each of the cameras to rasterize each of them.
-    for camera in cameras: 
+    for index, camera in enumerate(cameras):
         # We are going to create a triangle for the camera.
         triangle = triangle_from_camera_plot(camera, offset)
 
-        # Loop through each of the pixels.
-        for row in range (0, screen_size):
-            for column in range(0, screen_size):
-                # If the pixel row hasn't been initialized yet, then we will do that here.
-                if row >= len(pixels):
-                    pixels.append(list())
+        # Now we will test every pixel against the triangle at once.
+        inside = triangle_mask(triangle, xs, ys)
 
-                    # And we're just going to push empty pixels to this new array.
-                    for _ in range(0, screen_size):
-                        pixels[row].append(Pixel())
+        # Then we will set this camera's bit on every pixel that is inside.
+        word_index, bit = divmod(index, COVERAGE_WORD_BITS)
+        coverage[inside, word_index] |= np.uint64(1 << bit)
 
-                # Next we are going to get the position of this pixel in world space.
-                # We will simply multiply the x and y screen position by the pixel size in meters to get the position in world space.
-                position = Vec2(column * pixel_size, row * pixel_size)
+    return Screen(coverage=coverage, camera_uuids=[camera.uuid for camera in cameras], meter_span=meter_span, pixel_size=pixel_size, screen_size=screen_size, offset=offset)
 
-                # Now we will test whether the pixel is inside the triangle.
-                inside = point_inside_triangle(triangle, position)
-
-                # If it is inside...
-                if inside:
-                    # Then we will add whatever camera we are rendering to the pixel.
-                    pixels[row][column].cameras.append(camera.uuid)
+def pixel_grid(screen_size: int, pixel_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Gets the world space position of every pixel on a screen.
 
+    :param screen_size: The size in pixels of the square screen.
+    :param pixel_size: The size in meters of each of the pixels.
+    :return: Returns the X positions as a (1, screen_size) row and the Y positions as a (screen_size, 1) column, which broadcast against each other into the full grid.
+    """
 
-    return Screen(pixels=pixels, meter_span=meter_span, pixel_size=pixel_size, screen_size=screen_size, offset=offset)
+    positions = np.arange(screen_size, dtype=np.float64) * pixel_size
+    return positions.reshape(1, screen_size), positions.reshape(screen_size, 1)
 
-def rasterize_velocity(exit_event: ExitEvent, capture_radius: float, screen: Screen) -> Tuple[CaptureNetScreen, Set[str]]:
+def rasterize_velocity(exit_event: ExitEvent, capture_radius: float, screen: Screen, debug: bool = False) -> Tuple[Optional[CaptureNetScreen], Set[str]]:
     """Rasterizes a velocity capture net and determines which cameras were caught by this capture net.
 
     :param exit_event: The exit event to rasterize the velocity of.
     :param capture_radius: The capture radius of the net in meters.
     :param screen: The screen from rasterized cameras.
-    :return: Returns the rasterized velocity screen for debugging purposes and a set of cameras.
+    :param debug: If true, the boolean capture net screen will be built and returned for debugging purposes. Otherwise None is returned in its place, since building it is the slowest part.
+    :return: Returns the rasterized velocity screen (only if `debug` is set) and a set of cameras.
     """
 
     # We are going to normalize the velocity of the exit event to prepare for rasterization.
@@ -184,56 +207,38 @@ def rasterize_velocity(exit_event: ExitEvent, capture_radius: float, screen: Scr
     # Then translate the capture net by the screen offset in meters to transform the world space to screen space.
     net = offset_capture_net(rotated_capture_net, screen.offset)
 
-    # Create our set of valid camera UUIDs
-    valid_cameras: Set[str] = set()
-
-    # Create the array of pixels for our capture net rasterization. We only need booleans for this since we are only really rasterizing one trapezoid and as such there is no "alpha blending".
-    pixels: List[List[bool]] = list()
+    # Get the position of every pixel in world space, the same way the cameras were rasterized.
+    xs, ys = pixel_grid(screen.screen_size, screen.pixel_size)
 
-    # Loop through all fo the screen pixels
-    for row in range(0, screen.screen_size):
-        for column in range(0, screen.screen_size):
-            # If the pixel row hasn't been initialized yet, then we will do that here.
-            if row >= len(pixels):
-                pixels.append(list())
+    # Now we will test every pixel against the trapezoid at once.
+    # We only need booleans for this since we are only really rasterizing one trapezoid and as such there is no "alpha blending".
+    inside = trapezoid_mask(net, xs, ys)
 
-                # And we're just going to push false pixels to this new array.
-                for _ in range(0, screen.screen_size):
-                    pixels[row].append(False)
+    # OR together the coverage bitmasks of every pixel inside the net, so we end up with one bitmask of every camera the net touches.
+    # If no pixels are inside, the reduction gives back all zeros which means no cameras.
+    caught = np.bitwise_or.reduce(screen.coverage[inside], axis=0)
 
-            # Next we are going to get the position of this pixel in world space.
-            # We will simply multiply the x and y screen position by the pixel size in meters to get the position in world space.
-            position = Vec2(column * screen.pixel_size, row * screen.pixel_size)
+    # And then convert that bitmask into our set of `validCameras`.
+    valid_cameras: Set[str] = set(screen.cameras_from_mask(caught))
 
-            # Now we will test whether the pixel is inside the triangle.
-            inside = point_inside_trapezoid(net, position)
-
-            # If it is inside...
-            if inside:
-                # Then we will set the pixel to true.
-                pixels[row][column] = inside
-
-                # And then add whatever cameras there are in the `screen` to our set of `validCameras`.
-                for cam in screen.pixels[row][column].cameras:
-                    valid_cameras.add(cam)
+    # Building the list of lists of booleans is only needed when someone wants to look at the capture net.
+    capture_net_screen: Optional[CaptureNetScreen] = None
+    if debug:
+        capture_net_screen = CaptureNetScreen(pixels=inside.tolist(), meter_span=screen.meter_span, screen_size=screen.screen_size, pixel_size=screen.pixel_size)
 
     # Then return our screen and valid cameras.
-    return CaptureNetScreen(pixels=pixels, meter_span=screen.meter_span, screen_size=screen.screen_size, pixel_size=screen.pixel_size), valid_cameras
+    return capture_net_screen, valid_cameras
 
 
-def get_valid_cameras(cameras: List[Camera], exit_event: ExitEvent, pixels_per_meter: float, capture_radius: float) -> List[Camera]:
-    """Gets a list of valid cameras based on an exit event's velocity and the location of the cameras.
-    
+def rasterize_origin(cameras: List[Camera], origin: Camera, pixels_per_meter: float) -> Screen:
+    """Rasterizes every camera except for `origin` around the origin camera. The result only depends on the cameras and the origin, not the exit event, so it can be reused for every exit event on `origin`.
+
     :param cameras: The list of cameras that exist.
-    :param exit_event: The exit event to look for cameras for.
+    :param origin: The camera that will be at the center of the screen and facing up.
     :param pixels_per_meter: The number of pixels that should be rendered for each meter. This is essentially the density of pixels.
-    :param capture_radius: The capture radius of the net in meters.
-    :return: Returns an array of valid cameras based on location of the cameras and the velocity of the exit event.
+    :return: Returns the rasterized screen of all of the other cameras.
     """
 
-    # Get the camera attached to the exit event
-    origin = exit_event.events[0].camera
-
     # Only include cameras that don't match the origin UUID, since we will never "switch" to the same camera UUID.
     cameras = list(filter(lambda cam: cam.uuid != origin.uuid, cameras))
 
@@ -244,9 +249,19 @@ def get_valid_cameras(cameras: List[Camera], exit_event: ExitEvent, pixels_per_m
     camera_plots = list(map(lambda cam: get_camera_plot(cam, origin), cameras))
 
     # Then we will rasterize the cameras.
-    camera_screen = rasterize_cameras(camera_plots, pixels_per_meter, canvas_size[0])
+    return rasterize_cameras(camera_plots, pixels_per_meter, canvas_size[0])
+
+def get_valid_cameras_from_screen(cameras: List[Camera], exit_event: ExitEvent, capture_radius: float, camera_screen: Screen) -> List[Camera]:
+    """Gets a list of valid cameras based on an exit event's velocity and an already rasterized screen of the cameras around the exit event's camera.
 
-    # And the velocity.
+    :param cameras: The list of cameras that exist.
+    :param exit_event: The exit event to look for cameras for.
+    :param capture_radius: The capture radius of the net in meters.
+    :param camera_screen: The screen from `rasterize_origin` for the camera of `exit_event`.
+    :return: Returns an array of valid cameras based on location of the cameras and the velocity of the exit event.
+    """
+
+    # Rasterize the velocity.
     _, result_cameras = rasterize_velocity(exit_event, capture_radius, camera_screen)
 
     # Create our array of valid cameras.
@@ -260,3 +275,23 @@ def get_valid_cameras(cameras: List[Camera], exit_event: ExitEvent, pixels_per_m
 
     # Return our cameras.
     return valid_cameras
+
+def get_valid_cameras(cameras: List[Camera], exit_event: ExitEvent, pixels_per_meter: float, capture_radius: float) -> List[Camera]:
+    """Gets a list of valid cameras based on an exit event's velocity and the location of the cameras.
+    NOTE: This rasterizes all of the cameras every time, when looking at many exit events use a `CoverageIndex` instead.
+    
+    :param cameras: The list of cameras that exist.
+    :param exit_event: The exit event to look for cameras for.
+    :param pixels_per_meter: The number of pixels that should be rendered for each meter. This is essentially the density of pixels.
+    :param capture_radius: The capture radius of the net in meters.
+    :return: Returns an array of valid cameras based on location of the cameras and the velocity of the exit event.
+    """
+
+    # Get the camera attached to the exit event
+    origin = exit_event.events[0].camera
+
+    # Rasterize all of the other cameras around it
+    camera_screen = rasterize_origin(cameras, origin, pixels_per_meter)
+
+    # And then test the velocity against them
+    return get_valid_cameras_from_screen(cameras, exit_event, capture_radius, camera_screen)
@@ -56,3 +56,20 @@ def left_of_line(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> bool:
     validate_vec2(c)
 
     return ((b[0] - a[0]) * (c[1] - a[1]) - (b[1] - a[1]) * (c[0] - a[0])) > 0
+
+def left_of_line_grid(a: np.ndarray, b: np.ndarray, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Vectorized version of `left_of_line` which tests a whole grid of points against the line ab at once.
+
+    :param a: The first point of the line (starting from the "bottom" of the line).
+    :param b: The second point of the line (starting from the "bottom" of the line).
+    :param xs: The X positions of the points to test. Must broadcast against `ys`.
+    :param ys: The Y positions of the points to test. Must broadcast against `xs`.
+    :return: Returns a boolean array which is true wherever the point is to the left of the line ab
+    """
+
+    validate_vec2(a)
+    validate_vec2(b)
+
+    # This is the exact same edge function as `left_of_line`, just evaluated with numpy over every point.
+    # The operations are done in the same order so that pixels which land right on an edge give the same result as the scalar version.
+    return ((b[0] - a[0]) * (ys - a[1]) - (b[1] - a[1]) * (xs - a[0])) > 0
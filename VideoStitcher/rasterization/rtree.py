@@ -0,0 +1,144 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Generic, List, Optional, Sequence, Tuple, TypeVar
+import math
+
+from rasterization.polygon import Bounds, bounds_overlap
+
+T = TypeVar("T")
+
+# The maximum number of children of every node in the tree.
+RTREE_NODE_CAPACITY = 8
+
+class RTreeNode(Generic[T]):
+    """A node in the R-tree. Leaf nodes hold the items, every other node holds more nodes.
+
+    :attribute bounds: The bounding box around everything under this node.
+    :attribute children: The child nodes, or an empty list if this is a leaf.
+    :attribute items: The items and their bounding boxes if this is a leaf, or an empty list otherwise.
+    """
+
+    bounds: Bounds
+    children: List["RTreeNode[T]"]
+    items: List[Tuple[Bounds, T]]
+
+    def __init__(self, bounds: Bounds, children: List["RTreeNode[T]"], items: List[Tuple[Bounds, T]]):
+        """Constructor for an R-tree node
+
+        :param bounds: The bounding box around everything under this node.
+        :param children: The child nodes, or an empty list if this is a leaf.
+        :param items: The items and their bounding boxes if this is a leaf, or an empty list otherwise.
+        """
+
+        self.bounds = bounds
+        self.children = children
+        self.items = items
+
+def _union_bounds(bounds: Sequence[Bounds]) -> Bounds:
+    """Gets the bounding box around a list of bounding boxes.
+
+    :param bounds: The bounding boxes.
+    :return: Returns the bounding box around all of them.
+    """
+
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+def _sort_tile(entries: List[Tuple[Bounds, T]]) -> List[List[Tuple[Bounds, T]]]:
+    """Groups entries into runs of at most `RTREE_NODE_CAPACITY` that are close to each other, using Sort-Tile-Recursive packing.
+    The entries are sorted by X and cut into vertical slices, then each slice is sorted by Y and cut into groups.
+
+    :param entries: The bounding boxes to group, along with whatever they belong to.
+    :return: Returns the groups.
+    """
+
+    group_count = math.ceil(len(entries) / RTREE_NODE_CAPACITY)
+    slice_count = math.ceil(math.sqrt(group_count))
+    slice_size = slice_count * RTREE_NODE_CAPACITY
+
+    # Sort by the center X of each box
+    entries = sorted(entries, key=lambda entry: entry[0][0] + entry[0][2])
+
+    groups: List[List[Tuple[Bounds, T]]] = list()
+    for start in range(0, len(entries), slice_size):
+        # Then sort each vertical slice by the center Y of each box
+        vertical_slice = sorted(entries[start:start + slice_size], key=lambda entry: entry[0][1] + entry[0][3])
+        for group_start in range(0, len(vertical_slice), RTREE_NODE_CAPACITY):
+            groups.append(vertical_slice[group_start:group_start + RTREE_NODE_CAPACITY])
+
+    return groups
+
+class RTree(Generic[T]):
+    """A static R-tree of bounding boxes. It is bulk loaded once using Sort-Tile-Recursive packing and then only queried.
+    This lets us find which camera FOVs could touch a capture net without testing every camera.
+
+    :attribute root: The root node, or None if the tree is empty.
+    """
+
+    root: Optional[RTreeNode[T]]
+
+    def __init__(self, items: Sequence[Tuple[Bounds, T]]):
+        """Constructor for an R-tree
+
+        :param items: The items to put in the tree along with their bounding boxes.
+        """
+
+        self.root = None
+
+        if len(items) == 0:
+            return
+
+        # First pack the items into leaves
+        nodes: List[RTreeNode[T]] = [RTreeNode(_union_bounds([bounds for bounds, _ in group]), list(), group) for group in _sort_tile(list(items))]
+
+        # Then keep packing the nodes into parents until there is only one left
+        while len(nodes) > 1:
+            groups = _sort_tile([(node.bounds, node) for node in nodes])
+            nodes = [RTreeNode(_union_bounds([bounds for bounds, _ in group]), [node for _, node in group], list()) for group in groups]
+
+        self.root = nodes[0]
+
+    def query(self, bounds: Bounds) -> List[T]:
+        """Gets every item whose bounding box overlaps with `bounds`.
+
+        :param bounds: The bounding box to search.
+        :return: Returns the items whose bounding box overlaps.
+        """
+
+        result: List[T] = list()
+
+        if self.root is None:
+            return result
+
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+
+            if not bounds_overlap(node.bounds, bounds):
+                continue
+
+            if len(node.children) > 0:
+                stack.extend(node.children)
+            else:
+                result.extend(item for item_bounds, item in node.items if bounds_overlap(item_bounds, bounds))
+
+        return result
@@ -24,7 +24,7 @@ import numpy as np
 import math
 from rhombus_types.vector import Vec2
 from rhombus_types.matrix import rotate
-from rasterization.rasterizer_utils.left_of_line import left_of_line
+from rasterization.rasterizer_utils.left_of_line import left_of_line, left_of_line_grid
 from logging_utils.error import NonNormalizedVectorError
 
 class CaptureNetTrapezoid:
@@ -159,3 +159,20 @@ def point_inside_trapezoid(trapezoid: CaptureNetTrapezoid, point: np.ndarray) ->
     l4 = left_of_line(trapezoid.p3, trapezoid.p0, point)
 
     return l1 and l2 and l3 and l4
+
+def trapezoid_mask(trapezoid: CaptureNetTrapezoid, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Tests a whole grid of X Y positions against a trapezoid at once. This is the vectorized version of `point_inside_trapezoid`.
+
+    :param trapezoid: The trapezoid to test the points inside.
+    :param xs: The X positions of the points we are testing. Must broadcast against `ys`.
+    :param ys: The Y positions of the points we are testing. Must broadcast against `xs`.
+    :return: Returns a boolean array which is true wherever the point is inside of the trapezoid.
+    """
+
+    # Same as `point_inside_trapezoid`, a point is inside if it is to the left of all four counter clockwise edges.
+    l1 = left_of_line_grid(trapezoid.p0, trapezoid.p1, xs, ys)
+    l2 = left_of_line_grid(trapezoid.p1, trapezoid.p2, xs, ys)
+    l3 = left_of_line_grid(trapezoid.p2, trapezoid.p3, xs, ys)
+    l4 = left_of_line_grid(trapezoid.p3, trapezoid.p0, xs, ys)
+
+    return l1 & l2 & l3 & l4
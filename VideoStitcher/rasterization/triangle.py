@@ -23,7 +23,7 @@
 import numpy as np
 from rhombus_types.vector import Vec2, validate_vec2
 from rhombus_services.graph_service import CameraPlot
-from rasterization.rasterizer_utils.left_of_line import left_of_line
+from rasterization.rasterizer_utils.left_of_line import left_of_line, left_of_line_grid
 
 class Triangle:
     """A triangle is used during rasterization as a simple primitive. NOTE: The points p0, p1, and p2 must be set counter clockwise, otherwise linetests will be wrong.
@@ -82,3 +82,18 @@ def point_inside_triangle(triangle: Triangle, point: np.ndarray) -> bool:
     l2 = left_of_line(triangle.p1, triangle.p2, point)
     l3 = left_of_line(triangle.p2, triangle.p0, point)
     return l1 and l2 and l3
+
+def triangle_mask(triangle: Triangle, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    """Tests a whole grid of X Y positions against a triangle at once. This is the vectorized version of `point_inside_triangle`.
+
+    :param triangle: The triangle to test the points inside.
+    :param xs: The X positions of the points we are testing. Must broadcast against `ys`.
+    :param ys: The Y positions of the points we are testing. Must broadcast against `xs`.
+    :return: Returns a boolean array which is true wherever the point is inside of the triangle.
+    """
+
+    # Same as `point_inside_triangle`, a point is inside if it is to the left of all three counter clockwise edges.
+    l1 = left_of_line_grid(triangle.p0, triangle.p1, xs, ys)
+    l2 = left_of_line_grid(triangle.p1, triangle.p2, xs, ys)
+    l3 = left_of_line_grid(triangle.p2, triangle.p0, xs, ys)
+    return l1 & l2 & l3
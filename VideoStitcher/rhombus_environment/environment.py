@@ -22,6 +22,7 @@
 
 from dotenv import load_dotenv
 import os
+from typing import Optional
 from rhombus_utils.singleton import Singleton
 
 @Singleton
@@ -37,12 +38,26 @@ class Environment:
     :attribute exit_event_detection_duration_seconds: How long from the starting time to look for exit events in seconds
     :attribute exit_event_detection_offset_seconds: How long before the start time should the exit event detector start looking. It is recommended that this be greater than 0 so that events don't accidentally get missed
     :attribute related_event_detection_duration_seconds: How long from the end of a one exit event should the related event detector look for other events
+    :attribute human_event_concurrency: The maximum number of human event requests that will be sent to Rhombus at the same time when looking for related events on nearby cameras.
     :attribute pixels_per_meter: The density of pixels to render per meter when rasterizing the cameras. A higher value will require more rasterization and thus processing power but will be more accurate. 
                                  However this doesn't really matter so it is recommended that this value be pretty low because the accuracy really doesn't matter.
     :attribute clip_combination_edge_padding_miliseconds: How much time in miliseconds should be added before the start of the first exit event when combining clips. This will allow some padding time. 
                                                           For example if the padding is 4 seconds, then 4 seconds of footage before the detected exit event should be added.
                                                           This is important in case someone might be like walking around in place before he leaves the camera's view, this might not be caught without the padding.
     :attribute clip_combination_padding_miliseconds: How much padding between each camera switch should be added in miliseconds.
+    :attribute clip_download_concurrency: The maximum number of clips of a chain that will be downloaded at the same time.
+    :attribute segment_cache_dir: The directory of the on-disk segment cache, so that overlapping clips are only downloaded from the camera once. If not set, no cache is used.
+    :attribute segment_cache_max_mb: The size cap of the segment cache in MB.
+    :attribute bounding_box_store_path: The SQLite file where human bounding boxes from Rhombus are kept, so that windows of time which were already looked at are not downloaded again in later runs. If not set, they are only kept in memory for the run.
+    :attribute bounding_box_store_max_entries: The maximum number of bounding boxes (plus windows of time) to keep before the least recently used windows are evicted.
+    :attribute camera_selection_mode: How cameras are selected for an exit event. RASTER rasterizes the cameras and the capture net into pixels, 
+                                      ANALYTIC intersects the capture net with each camera's FOV exactly, which is faster and uses far less memory for sites with a lot of cameras.
+                                      ANALYTIC can return a few extra cameras that only touch the edge of the capture net, which RASTER misses when they fall between the pixels.
+    :attribute coverage_index_dir: The directory where rasterized camera coverage is saved, keyed by a hash of the camera config, so the same floor plan is only rasterized once across runs. If not set, coverage is only kept in memory for the run.
+    :attribute stream_poll_seconds: How often in seconds the streaming mode (`python3 main.py --daemon`) fetches new human events from every camera.
+    :attribute stream_lag_seconds: How far behind the current time in seconds the streaming mode stays, since Rhombus takes a little while to have the bounding boxes of the latest footage.
+                                  It is never less than `SETTLE_SECONDS` of the bounding box store, since boxes that show up after a slice was fetched would be missed.
+    :attribute stream_track_close_seconds: How long in seconds an object has to not be seen in the streaming mode before its track is considered finished and checked for exit and enter events.
     """
     api_key: str
     connection_type: str
@@ -53,9 +68,20 @@ class Environment:
     exit_event_detection_duration_seconds: int
     exit_event_detection_offset_seconds: int
     related_event_detection_duration_seconds: int
+    human_event_concurrency: int
     pixels_per_meter: int
     clip_combination_edge_padding_miliseconds: int
     clip_combination_padding_miliseconds: int
+    clip_download_concurrency: int
+    segment_cache_dir: Optional[str]
+    segment_cache_max_mb: int
+    bounding_box_store_path: Optional[str]
+    bounding_box_store_max_entries: int
+    camera_selection_mode: str
+    coverage_index_dir: Optional[str]
+    stream_poll_seconds: int
+    stream_lag_seconds: int
+    stream_track_close_seconds: int
 
     def __init__(self):
         """Constructor for environment"""
@@ -72,7 +98,18 @@ class Environment:
         self.exit_event_detection_duration_seconds = int(os.getenv('EXIT_EVENT_DETECTION_DURATION_SECONDS') or 10 * 60)
         self.exit_event_detection_offset_seconds = int(os.getenv('EXIT_EVENT_DETECTION_OFFSET_SECONDS') or 0.5 * 60)
         self.related_event_detection_duration_seconds = int(os.getenv('RELATED_EVENT_DETECTION_DURATION_SECONDS') or 30)
+        self.human_event_concurrency = int(os.getenv('HUMAN_EVENT_CONCURRENCY') or 8)
         self.pixels_per_meter = int(os.getenv('PIXELS_PER_METER') or 3)
         self.clip_combination_edge_padding_miliseconds = int(os.getenv('CLIP_COMBINATION_EDGE_PADDING_MILISECONDS') or 4000)
         self.clip_combination_padding_miliseconds = int(os.getenv('CLIP_COMBINATION_PADDING_MILISECONDS ') or 1500)
+        self.clip_download_concurrency = int(os.getenv('CLIP_DOWNLOAD_CONCURRENCY') or 4)
+        self.segment_cache_dir = os.getenv('SEGMENT_CACHE_DIR')
+        self.segment_cache_max_mb = int(os.getenv('SEGMENT_CACHE_MAX_MB') or 1024)
+        self.bounding_box_store_path = os.getenv('BOUNDING_BOX_STORE_PATH')
+        self.bounding_box_store_max_entries = int(os.getenv('BOUNDING_BOX_STORE_MAX_ENTRIES') or 500000)
+        self.camera_selection_mode = str(os.getenv('CAMERA_SELECTION_MODE') or "RASTER").upper()
+        self.coverage_index_dir = os.getenv('COVERAGE_INDEX_DIR')
+        self.stream_poll_seconds = int(os.getenv('STREAM_POLL_SECONDS') or 5)
+        self.stream_lag_seconds = int(os.getenv('STREAM_LAG_SECONDS') or 60)
+        self.stream_track_close_seconds = int(os.getenv('STREAM_TRACK_CLOSE_SECONDS') or 5)
 
@@ -34,14 +34,20 @@ def parse_arguments(argv: List[str]) -> argparse.Namespace:
     """
 
     # Create our parser
-    parser = argparse.ArgumentParser(description='Pulls footage from a camera on LAN and stores it to the filesystem.')
+    parser = argparse.ArgumentParser(description='Follows a person across cameras and stitches the footage of them into one video.')
 
-    # The --api_key or -a param will hold our API key
-    parser.add_argument('--api_key', '-a', type=str, required=True, help='Rhombus API key')
+    # The --api_key or -a param will hold our API key. If not specified, the one in the .env file is used
+    parser.add_argument('--api_key', '-a', type=str, required=False, help='Rhombus API key (default API_KEY in .env)')
 
     # The --connection_type or -t param will hold the ConnectionType to the camera. It is not recommended to run in WAN mode unless this python server is running on a separate network from the camera
     parser.add_argument('--connection_type', '-t', type=str, required=False,
-                        help='The connection type to the camera, either LAN or WAN (default LAN)', default="LAN")
+                        help='The connection type to the camera, either LAN, WAN or AUTO to use whichever is faster (default CONNECTION_TYPE in .env, otherwise LAN)')
+
+    # The --daemon or -d flag will follow everyone across all cameras as it happens, instead of asking the user for one event
+    parser.add_argument('--daemon', '-d', action='store_true', help='Follow people across all cameras in near real time instead of prompting for an event')
+
+    # The --stitch or -s flag will download and stitch the footage of every finished chain when running as a daemon
+    parser.add_argument('--stitch', '-s', action='store_true', help='When running with --daemon, stitch the footage of every finished chain into res/')
 
     # Return all of our arguments
     return parser.parse_args(argv)
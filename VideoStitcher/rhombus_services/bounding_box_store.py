@@ -0,0 +1,210 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Callable, List, NamedTuple, Optional, Tuple
+import sqlite3
+import threading
+import time
+
+from rhombus_environment.environment import Environment
+
+# Rhombus keeps adding bounding boxes for a little while after they happen, so windows which end less than this many seconds ago are fetched but never stored.
+SETTLE_SECONDS = 60
+
+class HumanBoundingBox(NamedTuple):
+    """A single human bounding box, with the same field names as `rapi.FootageBoundingBoxType`.
+
+    :attribute ts: The timestamp in miliseconds of this bounding box.
+    :attribute object_id: The object ID of the human this bounding box is for.
+    :attribute l: The left side permyriad of the bounding box.
+    :attribute r: The right side permyriad of the bounding box.
+    :attribute t: The top side permyriad of the bounding box.
+    :attribute b: The bottom side permyriad of the bounding box.
+    """
+
+    ts: int
+    object_id: int
+    l: float
+    r: float
+    t: float
+    b: float
+
+class BoundingBoxStore:
+    """A store of human bounding boxes for each camera, indexed by timestamp.
+    The pipelines keep asking Rhombus for overlapping windows of time on the same cameras, so the store remembers which windows of each camera it already has,
+    only asks Rhombus for the parts of a window it doesn't have yet, and answers the rest from SQLite.
+
+    The windows are kept in SQLite, either in memory or in a file so that they are kept between runs.
+    When there are more than `max_entries` boxes and windows in the store, the least recently used windows and their boxes are evicted.
+
+    :attribute path: The path of the SQLite file, or ":memory:" if the store is only kept in memory.
+    :attribute max_entries: The maximum number of boxes plus windows to keep.
+    """
+
+    path: str
+    max_entries: int
+
+    def __init__(self, path: Optional[str], max_entries: int):
+        """Constructor for a bounding box store
+
+        :param path: The path of the SQLite file. If None, the store is only kept in memory.
+        :param max_entries: The maximum number of boxes plus windows to keep.
+        """
+
+        self.path = path or ":memory:"
+        self.max_entries = max_entries
+
+        # The store is used from the human event thread pool, so every use of the connection happens under the lock
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(self.path, check_same_thread=False)
+
+        with self.__db:
+            self.__db.execute("CREATE TABLE IF NOT EXISTS windows (camera_uuid TEXT NOT NULL, start INTEGER NOT NULL, end INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (camera_uuid, start))")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS windows_by_last_used ON windows (last_used)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS boxes (camera_uuid TEXT NOT NULL, ts INTEGER NOT NULL, object_id INTEGER, l REAL, r REAL, t REAL, b REAL)")
+            self.__db.execute("CREATE INDEX IF NOT EXISTS boxes_by_time ON boxes (camera_uuid, ts)")
+
+        self.__entries = self.__db.execute("SELECT (SELECT COUNT(*) FROM windows) + (SELECT COUNT(*) FROM boxes)").fetchone()[0]
+
+    def get_boxes(self, camera_uuid: str, start_time: int, duration: int, fetch: Callable[[int, int], List[HumanBoundingBox]]) -> List[HumanBoundingBox]:
+        """Gets the human bounding boxes of a camera within a window of time, only fetching the parts of the window that aren't in the store.
+
+        :param camera_uuid: The UUID of the camera to get the bounding boxes for.
+        :param start_time: The start time in seconds of the window.
+        :param duration: The duration in seconds of the window.
+        :param fetch: Called with (start time, duration) in seconds for each part of the window that isn't in the store, and returns the human bounding boxes from Rhombus.
+        :return: Returns the human bounding boxes with a timestamp inside of the window, sorted by timestamp.
+        """
+
+        end_time = start_time + duration
+
+        # Work out which parts of the window we are missing and get everything else from the store
+        with self.__lock:
+            gaps, boxes = self.__lookup(camera_uuid, start_time, end_time)
+
+        # Then fetch the missing parts from Rhombus. This happens outside of the lock so other cameras aren't held up.
+        fetched: List[Tuple[int, int, List[HumanBoundingBox]]] = list()
+        for gap_start, gap_end in gaps:
+            gap_boxes = [box for box in fetch(gap_start, gap_end - gap_start) if gap_start * 1000 <= box.ts < gap_end * 1000]
+            fetched.append((gap_start, gap_end, gap_boxes))
+            boxes.extend(gap_boxes)
+
+        if len(fetched) > 0:
+            with self.__lock:
+                self.__insert(camera_uuid, fetched)
+
+        boxes.sort(key=lambda box: box.ts)
+        return boxes
+
+    def __lookup(self, camera_uuid: str, start_time: int, end_time: int) -> Tuple[List[Tuple[int, int]], List[HumanBoundingBox]]:
+        """Finds the parts of a window that aren't in the store and gets the boxes of all of the parts that are.
+
+        :param camera_uuid: The UUID of the camera.
+        :param start_time: The start time in seconds of the window.
+        :param end_time: The end time in seconds of the window.
+        :return: Returns the missing (start, end) parts of the window and the stored boxes in the window.
+        """
+
+        windows = self.__db.execute("SELECT start, end FROM windows WHERE camera_uuid = ? AND end > ? AND start < ? ORDER BY start",
+                                    (camera_uuid, start_time, end_time)).fetchall()
+
+        # Walk through the stored windows in order, anything between them is missing
+        gaps: List[Tuple[int, int]] = list()
+        position = start_time
+        for window_start, window_end in windows:
+            if window_start > position:
+                gaps.append((position, window_start))
+            position = max(position, window_end)
+        if position < end_time:
+            gaps.append((position, end_time))
+
+        boxes: List[HumanBoundingBox] = list()
+        if len(windows) > 0:
+            with self.__db:
+                self.__db.execute("UPDATE windows SET last_used = ? WHERE camera_uuid = ? AND end > ? AND start < ?", (time.time(), camera_uuid, start_time, end_time))
+
+            rows = self.__db.execute("SELECT ts, object_id, l, r, t, b FROM boxes WHERE camera_uuid = ? AND ts >= ? AND ts < ?",
+                                     (camera_uuid, start_time * 1000, end_time * 1000))
+            boxes = [HumanBoundingBox(*row) for row in rows]
+
+        return gaps, boxes
+
+    def __insert(self, camera_uuid: str, fetched: List[Tuple[int, int, List[HumanBoundingBox]]]) -> None:
+        """Adds newly fetched windows to the store and then evicts old windows if there are too many entries.
+
+        :param camera_uuid: The UUID of the camera.
+        :param fetched: The (start, end, boxes) of each window that was fetched.
+        """
+
+        settled_time = time.time() - SETTLE_SECONDS
+
+        with self.__db:
+            for start, end, boxes in fetched:
+                # Recent windows might still get more boxes, so they have to be fetched again next time
+                if end > settled_time:
+                    continue
+
+                # Another thread might have fetched an overlapping window in the meantime, in which case we keep theirs
+                overlapping = self.__db.execute("SELECT 1 FROM windows WHERE camera_uuid = ? AND end > ? AND start < ? LIMIT 1", (camera_uuid, start, end)).fetchone()
+                if overlapping is not None:
+                    continue
+
+                self.__db.execute("INSERT INTO windows VALUES (?, ?, ?, ?)", (camera_uuid, start, end, time.time()))
+                self.__db.executemany("INSERT INTO boxes VALUES (?, ?, ?, ?, ?, ?, ?)", [(camera_uuid, *box) for box in boxes])
+                self.__entries += 1 + len(boxes)
+
+            self.__evict()
+
+    def __evict(self) -> None:
+        """Removes the least recently used windows and their boxes until there are at most `max_entries` entries."""
+
+        while self.__entries > self.max_entries:
+            window = self.__db.execute("SELECT camera_uuid, start, end FROM windows ORDER BY last_used LIMIT 1").fetchone()
+            if window is None:
+                break
+
+            camera_uuid, start, end = window
+            removed = self.__db.execute("DELETE FROM boxes WHERE camera_uuid = ? AND ts >= ? AND ts < ?", (camera_uuid, start * 1000, end * 1000)).rowcount
+            self.__db.execute("DELETE FROM windows WHERE camera_uuid = ? AND start = ?", (camera_uuid, start))
+            self.__entries -= 1 + removed
+
+    def close(self) -> None:
+        """Closes the SQLite connection."""
+
+        with self.__lock:
+            self.__db.close()
+
+_store_lock = threading.Lock()
+_store: Optional[BoundingBoxStore] = None
+
+def get_bounding_box_store() -> BoundingBoxStore:
+    """Gets the bounding box store shared by the whole program, creating it from the environment the first time.
+
+    :return: Returns the shared bounding box store.
+    """
+
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = BoundingBoxStore(Environment.get().bounding_box_store_path, Environment.get().bounding_box_store_max_entries)
+        return _store
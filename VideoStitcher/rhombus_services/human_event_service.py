@@ -20,75 +20,61 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 
-from typing import List, Dict
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 
 import RhombusAPI as rapi
 
-from rhombus_types.human_event import HumanEvent
-from rhombus_types.vector import Vec2
 from rhombus_types.camera import Camera
+from rhombus_types.track_store import TrackStore, empty_track_store, track_store_from_boxes
+from rhombus_services.bounding_box_store import HumanBoundingBox, get_bounding_box_store
 
-def get_human_events(api_client: rapi.ApiClient, camera: Camera, start_time: int, duration: int) -> Dict[int, List[HumanEvent]]:
+def get_human_events(api_client: rapi.ApiClient, camera: Camera, start_time: int, duration: int) -> TrackStore:
     """Get human events from a camera
     
     :param api_client: The API Client for sending requests to Rhombus
     :param camera: The camera to get the human events for
     :param start_time: The start time in seconds to start getting human events
     :param duration: The duration in seconds of time since the start time to look for events
-    :return: Returns a map of object ID to HumanEvent array 
+    :return: Returns the human events grouped into a track for each object ID
     """
 
     # Create the api
     api = rapi.CameraWebserviceApi(api_client=api_client)
 
-    # Create a map of ID to bounding box to hold the result
-    ids: Dict[int, List[rapi.FootageBoundingBoxType]] = dict()
+    def fetch(fetch_start_time: int, fetch_duration: int) -> List[HumanBoundingBox]:
+        # Send the request to Rhombus to get the bounding boxes
+        get_footage_bounding_box_request = rapi.CameraGetFootageBoundingBoxesWSRequest(camera_uuid=camera.uuid, start_time=fetch_start_time, duration=fetch_duration)
+        res = api.get_footage_bounding_boxes(body=get_footage_bounding_box_request)
 
-    # Send the request to Rhombus to get the bounding boxes
-    get_footage_bounding_box_request = rapi.CameraGetFootageBoundingBoxesWSRequest(camera_uuid=camera.uuid, start_time=start_time, duration=duration)
-    res = api.get_footage_bounding_boxes(body=get_footage_bounding_box_request)
+        # Filter the resulting bounding boxes so that we only get human events
+        return [HumanBoundingBox(ts=event.ts, object_id=event.object_id, l=event.l, r=event.r, t=event.t, b=event.b)
+                for event in res.footage_bounding_boxes if event.a == rapi.ActivityEnum.MOTION_HUMAN]
 
-    # Filter the resulting bounding boxes so that we only get human events
-    raw_events: List[rapi.FootageBoundingBoxType] = filter(lambda event: event.a == rapi.ActivityEnum.MOTION_HUMAN, res.footage_bounding_boxes)
+    # The store only sends requests for the parts of this window we haven't already asked Rhombus for.
+    # It also only gives back boxes inside of the window, since sometimes the API sends back some bounding boxes before the start time.
+    raw_events = get_bounding_box_store().get_boxes(camera.uuid, start_time, duration, fetch)
 
-    # Loop through all of the raw events
-    for event in raw_events:
-        # If for whatever reason the timestamp is before our start time, then don't include it.
-        # This really shouldn't be necessary, but it seems sometimes the API gets confused and sends back some bounding boxes before the start time.
-        # Either that or I'm doing something wrong, probably the latter tbh
-        if event.ts < start_time * 1000: 
-            continue
+    # Split the bounding boxes into columns and build the tracks straight from them, without creating an object for every bounding box
+    if len(raw_events) == 0:
+        return empty_track_store(camera)
 
-        if event.object_id not in ids:
-            ids[event.object_id] = [event]
-        else:
-            ids[event.object_id].append(event)
-    
-    events: Dict[int, List[HumanEvent]] = dict()
-
-    for object_id in ids:
-        boxes = ids[object_id]
-
-        for box in boxes:
-
-            if box.r - box.l < 0.02:
-                continue
-            if box.b - box.t < 0.02:
-                continue
+    ts, object_ids, l, r, t, b = zip(*raw_events)
+    return track_store_from_boxes(camera, object_ids=object_ids, timestamps=ts, l=l, r=r, t=t, b=b)
 
-            dimensions = Vec2((box.r - box.l) / 10000, (box.b - box.t) / 10000)
+def get_human_events_concurrently(api_client: rapi.ApiClient, requests: List[Tuple[Camera, int, int]], max_concurrency: int) -> List[TrackStore]:
+    """Get human events for many cameras and time windows at once. Each request is a blocking HTTP request, so they are sent in parallel from a thread pool.
 
-            position = Vec2((box.r + box.l) / 2 / 10000, (box.b + box.t) / 2 / 10000)
-
-            event = HumanEvent(id=box.object_id, position=position, dimensions=dimensions, timestamp=box.ts, camera=camera)
-
-            if box.object_id not in events:
-                events[box.object_id] = [event]
-            else:
-                events[box.object_id].append(event)
-                
+    :param api_client: The API Client for sending requests to Rhombus
+    :param requests: The list of (camera, start time in seconds, duration in seconds) to get the human events for, see `get_human_events`
+    :param max_concurrency: The maximum number of requests that will be sent to Rhombus at the same time
+    :return: Returns the tracks for each of the requests, in the same order as `requests`
+    """
 
-    for boxes in events.values():
-        boxes.sort(key=lambda human_event: human_event.timestamp)
+    # Don't bother creating any threads if there is only one thing to do
+    if len(requests) <= 1 or max_concurrency <= 1:
+        return [get_human_events(api_client, camera, start_time, duration) for camera, start_time, duration in requests]
 
-    return events
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(requests)), thread_name_prefix="human-events") as executor:
+        # `map` gives back the results in the same order as the requests, and raises the first error if any of the requests failed
+        return list(executor.map(lambda request: get_human_events(api_client, *request), requests))
@@ -21,7 +21,7 @@
 ###################################################################################
 
 # Import type hints
-from typing import Tuple
+from typing import List, Tuple, Union
 
 # Import RhombusAPI to send requests to get the MediaURIs and generate a federated token
 import RhombusAPI as rapi
@@ -29,16 +29,28 @@ import RhombusAPI as rapi
 # Import ConnectionType to get the correct connection URI
 from rhombus_types.connection_type import ConnectionType
 
+# Import the shared federated token manager so that every download shares one token
+from rhombus_federated_token import API_CLIENT_TOKEN_MANAGER, api_client_token_fetcher, shared_token_manager
+
+
+def fetch_federated_token(api_client: rapi.ApiClient, duration: int) -> str:
+    """Get a federatedToken to download VODs. One token can be used to download VODs from any camera, so the same token is shared until it is about to expire.
+
+    :param api_client: The API Client for sending requests to Rhombus
+    :param duration: How long the federated token has to stay valid in seconds
+    :return: Returns the federated token
+    """
+
+    return shared_token_manager(API_CLIENT_TOKEN_MANAGER, lambda: api_client_token_fetcher(api_client)).get_token(valid_for_sec=duration)
+
+
+def fetch_vod_uri(api_client: rapi.ApiClient, camera_uuid: str, connection_type: ConnectionType) -> Union[str, List[str]]:
+    """Get the VOD URI of the camera
 
-def fetch_media_uris(api_client: rapi.ApiClient, camera_uuid: str, duration: int, connection_type: ConnectionType) -> \
-Tuple[str, str]:
-    """Get the lan URI of the camera and generate a federatedToken to download the VOD
-    
     :param api_client: The API Client for sending requests to Rhombus
     :param camera_uuid: The UUID of the camera to get info for
-    :param duration: How long the federated token should last in seconds
     :param connection_type: Whether to use LAN or WAN for the connection, by default LAN and unless you are on a different connection, you should really just use LAN
-    :return: Returns the lan URI of the vod and the generated federated token
+    :return: Returns the lan URI of the vod. For the AUTO connection type this returns both the lan and the wan URI in a list
     """
 
     # Create a new instance of the Camera API for us to use
@@ -48,12 +60,23 @@ Tuple[str, str]:
     media_uri_request = rapi.CameraGetMediaUrisWSRequest(camera_uuid=camera_uuid)
     media_uris = cam_api.get_camera_media_uris(body=media_uri_request)
 
-    # Create a new instance of the ORG API to get the federated token
-    org_api = rapi.OrgWebserviceApi(api_client=api_client)
-    # Get the federated session token
-    federated_token_request = rapi.OrgGenerateFederatedSessionTokenRequest(duration_sec=duration)
-    federated_token_response = org_api.generate_federated_session_token(body=federated_token_request)
+    # With the AUTO connection type the media client gets both URIs and picks whichever is faster
+    if connection_type == ConnectionType.AUTO:
+        return [media_uris.lan_vod_mpd_uris_templates[0], media_uris.wan_vod_mpd_uri_template]
 
     # Return our data
-    return media_uris.lan_vod_mpd_uris_templates[
-               0] if connection_type == ConnectionType.LAN else media_uris.wan_vod_mpd_uri_template, federated_token_response.federated_session_token
+    return media_uris.lan_vod_mpd_uris_templates[0] if connection_type == ConnectionType.LAN else media_uris.wan_vod_mpd_uri_template
+
+
+def fetch_media_uris(api_client: rapi.ApiClient, camera_uuid: str, duration: int, connection_type: ConnectionType) -> \
+Tuple[Union[str, List[str]], str]:
+    """Get the lan URI of the camera and generate a federatedToken to download the VOD
+    
+    :param api_client: The API Client for sending requests to Rhombus
+    :param camera_uuid: The UUID of the camera to get info for
+    :param duration: How long the federated token has to stay valid in seconds
+    :param connection_type: Whether to use LAN or WAN for the connection, by default LAN and unless you are on a different connection, you should really just use LAN
+    :return: Returns the lan URI of the vod and the generated federated token. For the AUTO connection type this returns both the lan and the wan URI in a list
+    """
+
+    return fetch_vod_uri(api_client, camera_uuid, connection_type), fetch_federated_token(api_client, duration)
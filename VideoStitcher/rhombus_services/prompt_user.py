@@ -122,13 +122,11 @@ def prompt_user(api_client: rapi.ApiClient, cameras: List[Camera]) -> Union[Rece
         # Collate and isolate the events from length
         collated_events = isolate_events_from_length(human_events);
 
-        # Loop through each of the collated events
-        for es in collated_events.values():
-            # We only really care about the first of those human event arrays
-            event = es[0]
-
+        # Loop through each of the collated tracks
+        for track, first in enumerate(collated_events.first_indices):
+            # We only really care about the first event of each track
             # Add the recent human event to our array
-            recent_human_events.append(RecentHumanEventInfo(timestamp=event.timestamp, object_id=event.id, camera=event.camera))
+            recent_human_events.append(RecentHumanEventInfo(timestamp=int(collated_events.timestamps[first]), object_id=int(collated_events.object_ids[track]), camera=collated_events.camera))
 
     # Now we are going to print that information to the user
     print_recent_human_events(api_client, recent_human_events, cameras)
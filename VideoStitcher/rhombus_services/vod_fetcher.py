@@ -21,90 +21,41 @@
 ###################################################################################
 
 # Import type hints
-from typing import Dict
+from typing import List, Union
 
-# Import requests to download the VOD
-import requests
-
-# Import pathlib, OS, and IO to write the VOD to a file
+# Import pathlib and OS to write the VOD to a file
 import pathlib
 import os
-import io
 
 # Import ConnectionType to specify what connection we should have to the camera when downloading our data
 from rhombus_types.connection_type import ConnectionType
-from rhombus_types.rhombus_mpd_info import RhombusMPDInfo
-
-# The possible MPD URI endings
-URI_FILE_ENDINGS = ["clip.mpd", "file.mpd"]
-
-
-def get_segment_uri(mpd_uri, segment_name) -> str:
-    """Gets the URI of a segment with a given segment name.
-
-    :param mpd_uri: The original MPD URI
-    :param segment_name: The replacement name, for example "seg_init.mp4"
-    :return: The new URI
-    """
-    for ending in URI_FILE_ENDINGS:
-        if ending in mpd_uri:
-            return mpd_uri.replace(ending, segment_name)
-
-    return None
-
-
-def get_segment_uri_index(rhombus_mpd_info, mpd_uri, index) -> str:
-    """Gets the URI of a segment with a given index
-
-    :param rhombus_mpd_info: The Rhombus MPD info
-    :param mpd_uri: The original MPD URI
-    :param index: The index starting from 0
-    :return: The new URI
-    """
-    segment_name = rhombus_mpd_info.segment_pattern.replace("$Number$", str(index + rhombus_mpd_info.start_index))
-    return get_segment_uri(mpd_uri, segment_name)
-
 
-def save_clip(headers: Dict[str, str], http_client: requests.sessions.Session, file: io.BufferedWriter,
-              uri: str) -> None:
-    """Save an m4v or mp4 url to the specified output file
-
-    :param headers: The HTTP Headers to send with our request. These are required to authenticate
-    :param http_client: The HTTP Client to download the files with which is initialized at startup
-    :param file: The output file to write to
-    :param uri: The media URI to download from
-    """
-    print("Saving clip " + uri)
-
-    # Download the file from the uri
-    buffer = http_client.get(uri, headers=headers)
-
-    # Write the file
-    file.write(buffer.content)
-
-    # Flush our file and buffer
-    file.flush()
-    buffer.close()
+# Import the shared media client to download the VOD
+from rhombus_media_client import MediaClient
 
 
-def fetch_vod(api_key: str, http_client: requests.sessions.Session, federated_token: str, uri: str,
-              connection_type: ConnectionType, dir: str, file_name: str, start_time: int, end_time: int) -> None:
+def fetch_vod(api_key: str, http_client: MediaClient, federated_token: str, uri: Union[str, List[str]],
+              connection_type: ConnectionType, dir: str, file_name: str, start_time: int, end_time: int,
+              camera_uuid: str = None) -> None:
     """Download a vod to disk. It will be saved in res/<current time in seconds>
 
     :param api_key: The API Key specified by the user
     :param http_client: The HTTP Client to download the files with which is initialized at startup
     :param federated_token: The federated token which will be used to download the files. Without this we would get a 401 authentication error
-    :param uri: The VOD uri to download from
+    :param uri: The VOD uri to download from, or a list of the LAN and the WAN VOD uri for the AUTO connection type
     :param connection_type: The ConnectionType to the Camera to download the VOD from
     :param dir: The directory where the output clip will be placed
     :param file_name: The name of the file to output
     :param start_time: The start timestamp in miliseconds in the VOD to start downloading at
     :param end_time: The end timestamp in miliseconds in the VOD to stop downloading at
+    :param camera_uuid: The UUID of the camera the VOD is from. If given, the segment cache of the http client is used
     """
     duration = end_time - start_time + 1
 
-    # We need to replace {START_TIME} and {DURATION} with the correct values in order to properly download the file
-    full_uri = uri.replace("{START_TIME}", str(start_time)).replace("{DURATION}", str(duration))
+    # We need to replace {START_TIME} and {DURATION} with the correct values in order to properly download the file.
+    # With the AUTO connection type we get both the LAN and the WAN uri, and the media client uses whichever is faster
+    full_uri = [u.replace("{START_TIME}", str(start_time)).replace("{DURATION}", str(duration))
+                for u in (uri if isinstance(uri, list) else [uri])]
 
     # If the directory does not already exist, then we need to create it
     if (not os.path.exists(dir)):
@@ -125,30 +76,7 @@ def fetch_vod(api_key: str, http_client: requests.sessions.Session, federated_to
         "Content-Type": "application/json"
     }
 
-    # Get the MPD info from the base URI.
-    mpd_response = http_client.get(uri, headers=headers)
-
-    # If the response failed, then there is nothing we can do
-    if mpd_response.status_code != 200:
-        raise ConnectionError()
-
-    # Get the MPD info
-    rhombus_mpd_info = RhombusMPDInfo(str(mpd_response.content, 'utf-8'))
-
-    # Create an output file. This will be written in bytes.
-    with open(path, "wb") as file:
-        # Because our URI is an mpd, we need to get each of the segments. The seg_init.mp4 is the first of these.
-        # Just replace clip.mpd at the end of the URL with seg_init.mp4
-        save_clip(headers, http_client, file, get_segment_uri(full_uri, rhombus_mpd_info.init_string))
-
-        # Each of the segments is 2 seconds long, so the number of segments is duration/2
-        for i in range(int(duration / 2)):
-            # The URI of all subsequent segments will replace clip.mpd with seg_<index>.m4v
-            # These files will need to be appended to our existing clip.mp4 in disk
-            save_clip(headers, http_client, file, get_segment_uri_index(rhombus_mpd_info, full_uri, i))
-
-        # Close the output file
-        file.close()
-
-    # Close the output file
-    file.close()
+    # Download the MPD, the init segment and all of the video segments into our output clip. The media client keeps
+    # several segment requests in flight at once over pooled keep-alive connections and writes them in order.
+    # Segments that are already in the segment cache are copied from disk instead.
+    http_client.download_vod(full_uri, path, duration, headers, camera_uuid=camera_uuid, start_time=start_time)
@@ -0,0 +1,228 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+from rhombus_types.camera import Camera
+from rhombus_types.human_event import HumanEvent
+from rhombus_types.vector import Vec2
+
+class TrackStore:
+    """A columnar store of the human events (bounding boxes) of one camera, grouped into tracks by object ID.
+    Instead of a `HumanEvent` object with two small numpy arrays for every bounding box, all of the bounding boxes are kept in a handful of contiguous arrays.
+    The events of track `i` are the rows `offsets[i]` to `offsets[i + 1]` of the event arrays, sorted by timestamp.
+
+    :attribute camera: The camera all of these human events are from.
+    :attribute object_ids: The object ID of each track.
+    :attribute offsets: The index of the first event of each track, followed by the total number of events. This has one more element than `object_ids`.
+    :attribute timestamps: The timestamp in miliseconds of each event.
+    :attribute x: The X position permyriad of the center of the bounding box of each event.
+    :attribute y: The Y position permyriad of the center of the bounding box of each event.
+    :attribute w: The width permyriad of the bounding box of each event.
+    :attribute h: The height permyriad of the bounding box of each event.
+    """
+
+    camera: Camera
+    object_ids: np.ndarray
+    offsets: np.ndarray
+    timestamps: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    w: np.ndarray
+    h: np.ndarray
+
+    def __init__(self, camera: Camera, object_ids: np.ndarray, offsets: np.ndarray, timestamps: np.ndarray, x: np.ndarray, y: np.ndarray, w: np.ndarray, h: np.ndarray):
+        """Constructor for a track store
+
+        :param camera: The camera all of these human events are from.
+        :param object_ids: The object ID of each track.
+        :param offsets: The index of the first event of each track, followed by the total number of events.
+        :param timestamps: The timestamp in miliseconds of each event.
+        :param x: The X position permyriad of the center of the bounding box of each event.
+        :param y: The Y position permyriad of the center of the bounding box of each event.
+        :param w: The width permyriad of the bounding box of each event.
+        :param h: The height permyriad of the bounding box of each event.
+        """
+
+        self.camera = camera
+        self.object_ids = object_ids
+        self.offsets = offsets
+        self.timestamps = timestamps
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+
+    def __len__(self) -> int:
+        """Gets the number of tracks
+
+        :return: Returns the number of tracks (not events) in the store
+        """
+
+        return len(self.object_ids)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """The number of events in each track"""
+
+        return np.diff(self.offsets)
+
+    @property
+    def first_indices(self) -> np.ndarray:
+        """The index of the first event of each track"""
+
+        return self.offsets[:-1]
+
+    @property
+    def last_indices(self) -> np.ndarray:
+        """The index of the last event of each track"""
+
+        return self.offsets[1:] - 1
+
+    def select(self, tracks: np.ndarray) -> 'TrackStore':
+        """Creates a new track store with only some of the tracks.
+
+        :param tracks: Either a boolean mask with one element per track, or an array of track indices to keep in order.
+        :return: Returns the new track store.
+        """
+
+        tracks = np.asarray(tracks)
+        if tracks.dtype == bool:
+            tracks = np.flatnonzero(tracks)
+
+        lengths = self.lengths[tracks]
+        offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        # Each new event index maps back to the old one by shifting it by how far its track moved
+        rows = np.repeat(self.offsets[:-1][tracks] - offsets[:-1], lengths) + np.arange(offsets[-1], dtype=np.int64)
+
+        return TrackStore(camera=self.camera, object_ids=self.object_ids[tracks], offsets=offsets, timestamps=self.timestamps[rows],
+                          x=self.x[rows], y=self.y[rows], w=self.w[rows], h=self.h[rows])
+
+    def events(self, track: int, start: int = 0, stop: Optional[int] = None) -> List[HumanEvent]:
+        """Creates `HumanEvent` objects for the events of a track. `start` and `stop` work like a slice of the track's events, so only the events which are needed are created.
+
+        :param track: The index of the track.
+        :param start: The first event of the track to include.
+        :param stop: The event of the track to stop before, or None to include everything up to the end.
+        :return: Returns the human events.
+        """
+
+        first = int(self.offsets[track])
+        rows = range(first, int(self.offsets[track + 1]))[start:stop]
+        object_id = int(self.object_ids[track])
+
+        return [HumanEvent(id=object_id, position=Vec2(self.x[row], self.y[row]), dimensions=Vec2(self.w[row], self.h[row]), timestamp=int(self.timestamps[row]), camera=self.camera)
+                for row in rows]
+
+    def to_map(self) -> Dict[int, List[HumanEvent]]:
+        """Converts the store into the map of object ID to human events that the event types use.
+
+        :return: Returns a map of object ID to HumanEvent array
+        """
+
+        return {int(self.object_ids[track]): self.events(track) for track in range(len(self))}
+
+def empty_track_store(camera: Camera) -> TrackStore:
+    """Creates a track store without any tracks.
+
+    :param camera: The camera of the track store.
+    :return: Returns the empty track store.
+    """
+
+    return TrackStore(camera=camera, object_ids=np.zeros(0, dtype=np.int64), offsets=np.zeros(1, dtype=np.int64), timestamps=np.zeros(0, dtype=np.int64),
+                      x=np.zeros(0), y=np.zeros(0), w=np.zeros(0), h=np.zeros(0))
+
+def track_store_from_boxes(camera: Camera, object_ids: Sequence[int], timestamps: Sequence[int], l: Sequence[Union[int, float]], r: Sequence[Union[int, float]],
+                           t: Sequence[Union[int, float]], b: Sequence[Union[int, float]]) -> TrackStore:
+    """Creates a track store from the columns of raw Rhombus bounding boxes.
+    Tracks are in the order that their object ID first shows up in, and the events of each track are sorted by timestamp (keeping the original order for equal timestamps).
+
+    :param camera: The camera the bounding boxes are from.
+    :param object_ids: The object ID of each bounding box.
+    :param timestamps: The timestamp in miliseconds of each bounding box.
+    :param l: The left side permyriad of each bounding box.
+    :param r: The right side permyriad of each bounding box.
+    :param t: The top side permyriad of each bounding box.
+    :param b: The bottom side permyriad of each bounding box.
+    :return: Returns the track store.
+    """
+
+    if len(object_ids) == 0:
+        return empty_track_store(camera)
+
+    object_ids = np.asarray(object_ids, dtype=np.int64)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    l = np.asarray(l, dtype=np.float64)
+    r = np.asarray(r, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+
+    # Number the object IDs by the order they first show up in
+    unique_ids, first_seen, inverse = np.unique(object_ids, return_index=True, return_inverse=True)
+    rank = np.argsort(np.argsort(first_seen, kind="stable"), kind="stable")[inverse]
+
+    # Skip tiny bounding boxes, they are almost always noise
+    keep = np.flatnonzero(~((r - l < 0.02) | (b - t < 0.02)))
+
+    # Group the events by object ID and sort each group by timestamp. lexsort is stable, so ties keep their original order.
+    rows = keep[np.lexsort((timestamps[keep], rank[keep]))]
+
+    # Every object ID which still has events is a track
+    track_rank, starts = np.unique(rank[rows], return_index=True)
+    offsets = np.append(starts, len(rows)).astype(np.int64)
+
+    return TrackStore(camera=camera,
+                      object_ids=unique_ids[np.argsort(first_seen, kind="stable")][track_rank],
+                      offsets=offsets,
+                      timestamps=timestamps[rows],
+                      x=(r[rows] + l[rows]) / 2 / 10000,
+                      y=(b[rows] + t[rows]) / 2 / 10000,
+                      w=(r[rows] - l[rows]) / 10000,
+                      h=(b[rows] - t[rows]) / 10000)
+
+def track_store_from_events(camera: Camera, tracks: Dict[int, List[HumanEvent]]) -> TrackStore:
+    """Creates a track store from human events that are already grouped into tracks, the opposite of `TrackStore.to_map`.
+
+    :param camera: The camera the human events are from.
+    :param tracks: The map of object ID to HumanEvent array, each sorted by timestamp.
+    :return: Returns the track store.
+    """
+
+    if len(tracks) == 0:
+        return empty_track_store(camera)
+
+    events = [event for track in tracks.values() for event in track]
+    offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+    np.cumsum([len(track) for track in tracks.values()], out=offsets[1:])
+
+    return TrackStore(camera=camera,
+                      object_ids=np.array(list(tracks.keys()), dtype=np.int64),
+                      offsets=offsets,
+                      timestamps=np.array([event.timestamp for event in events], dtype=np.int64),
+                      x=np.array([event.position[0] for event in events], dtype=np.float64),
+                      y=np.array([event.position[1] for event in events], dtype=np.float64),
+                      w=np.array([event.dimensions[0] for event in events], dtype=np.float64),
+                      h=np.array([event.dimensions[1] for event in events], dtype=np.float64))
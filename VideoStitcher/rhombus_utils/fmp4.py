@@ -0,0 +1,423 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple
+import os
+import struct
+
+# Boxes are copied in chunks of this size, so that a whole mdat is never held in memory
+COPY_CHUNK_BYTES = 64 * 1024
+
+# Flags of the tfhd box, see ISO/IEC 14496-12 8.8.7
+TFHD_BASE_DATA_OFFSET_PRESENT = 0x000001
+TFHD_SAMPLE_DESCRIPTION_INDEX_PRESENT = 0x000002
+TFHD_DEFAULT_SAMPLE_DURATION_PRESENT = 0x000008
+TFHD_DEFAULT_SAMPLE_SIZE_PRESENT = 0x000010
+TFHD_DEFAULT_SAMPLE_FLAGS_PRESENT = 0x000020
+
+# Flags of the trun box, see ISO/IEC 14496-12 8.8.8
+TRUN_DATA_OFFSET_PRESENT = 0x000001
+TRUN_FIRST_SAMPLE_FLAGS_PRESENT = 0x000004
+TRUN_SAMPLE_DURATION_PRESENT = 0x000100
+TRUN_SAMPLE_SIZE_PRESENT = 0x000200
+TRUN_SAMPLE_FLAGS_PRESENT = 0x000400
+TRUN_SAMPLE_COMPOSITION_TIME_OFFSET_PRESENT = 0x000800
+
+class FMP4Error(Exception):
+    """Raised when clips can't be concatenated without re-muxing them, either because they aren't fragmented mp4s with a single track or because their codec parameters differ."""
+    pass
+
+class Box(NamedTuple):
+    """The header of an mp4 box
+
+    :attribute type: The four character type of the box
+    :attribute offset: The offset of the start of the box (including the header)
+    :attribute header_size: The size of the header in bytes
+    :attribute size: The size of the whole box in bytes, including the header
+    """
+
+    type: str
+    offset: int
+    header_size: int
+    size: int
+
+class InitInfo(NamedTuple):
+    """The parts of the init segment of a clip which have to be the same for its fragments to be appended to another clip
+
+    :attribute init: The ftyp and moov boxes of the clip, which are written at the start of the concatenated clip
+    :attribute end: The offset in the clip where the fragments start
+    :attribute track_id: The ID of the only track of the clip
+    :attribute timescale: The number of time units per second of the track
+    :attribute sample_description: The stsd box, which holds the codec parameters
+    :attribute default_sample_duration: The default sample duration from the trex box, used if a fragment doesn't give one
+    :attribute defaults: The default sample description index, duration, size and flags from the trex box
+    """
+
+    init: bytes
+    end: int
+    track_id: int
+    timescale: int
+    sample_description: bytes
+    default_sample_duration: int
+    defaults: bytes
+
+def _read_box(data: bytes, offset: int, end: int) -> Box:
+    """Reads the header of a box from a buffer
+
+    :param data: The buffer to read from
+    :param offset: The offset of the box in the buffer
+    :param end: The end of the parent box, which the box can't go past
+    :return: Returns the header of the box
+    """
+
+    if offset + 8 > end:
+        raise FMP4Error("Truncated box header at " + str(offset))
+
+    size, type = struct.unpack_from(">I4s", data, offset)
+    header_size = 8
+
+    if size == 1:
+        if offset + 16 > end:
+            raise FMP4Error("Truncated box header at " + str(offset))
+        size, = struct.unpack_from(">Q", data, offset + 8)
+        header_size = 16
+    elif size == 0:
+        size = end - offset
+
+    if size < header_size or offset + size > end:
+        raise FMP4Error("Invalid size of box " + str(type) + " at " + str(offset))
+
+    return Box(type.decode("latin-1"), offset, header_size, size)
+
+def _children(data: bytes, parent: Box) -> List[Box]:
+    """Reads the header of every child of a box
+
+    :param data: The buffer holding the parent box
+    :param parent: The parent box
+    :return: Returns the headers of the children, in order
+    """
+
+    children: List[Box] = list()
+    offset = parent.offset + parent.header_size
+    end = parent.offset + parent.size
+
+    while offset < end:
+        child = _read_box(data, offset, end)
+        children.append(child)
+        offset += child.size
+
+    return children
+
+def _find(data: bytes, parent: Box, path: List[str]) -> Box:
+    """Finds a box below a parent box, for example ["trak", "mdia", "mdhd"] below moov
+
+    :param data: The buffer holding the parent box
+    :param parent: The parent box
+    :param path: The types of the boxes to walk down through
+    :return: Returns the box at the end of the path
+    """
+
+    box = parent
+    for type in path:
+        matches = [child for child in _children(data, box) if child.type == type]
+
+        # A clip with more than one track (like with audio) can't just be appended to another, since the fragments would need to be matched up by track
+        if len(matches) != 1:
+            raise FMP4Error("Expected one " + type + " box but found " + str(len(matches)))
+
+        box = matches[0]
+
+    return box
+
+def _body(data: bytes, box: Box) -> bytes:
+    """Gets the contents of a box after its header
+
+    :param data: The buffer holding the box
+    :param box: The box
+    :return: Returns the contents of the box
+    """
+
+    return data[box.offset + box.header_size:box.offset + box.size]
+
+def _read_top_level_box(file: BinaryIO) -> Optional[Tuple[Box, bytes]]:
+    """Reads the header of the next top level box of a file, leaving the file at the start of the contents of the box
+
+    :param file: The file to read from
+    :return: Returns the box and the bytes of its header, or None at the end of the file
+    """
+
+    offset = file.tell()
+    header = file.read(8)
+    if len(header) == 0:
+        return None
+    if len(header) < 8:
+        raise FMP4Error("Truncated box header at " + str(offset))
+
+    size, type = struct.unpack(">I4s", header)
+    header_size = 8
+
+    if size == 1:
+        large_size = file.read(8)
+        if len(large_size) < 8:
+            raise FMP4Error("Truncated box header at " + str(offset))
+        header += large_size
+        size, = struct.unpack(">Q", large_size)
+        header_size = 16
+    elif size == 0:
+        # The box goes until the end of the file
+        end = file.seek(0, 2)
+        file.seek(offset + header_size)
+        size = end - offset
+
+    if size < header_size:
+        raise FMP4Error("Invalid size of box " + str(type) + " at " + str(offset))
+
+    return Box(type.decode("latin-1"), offset, header_size, size), header
+
+def _copy(source: BinaryIO, destination: BinaryIO, length: int) -> None:
+    """Copies bytes from one file to another in chunks
+
+    :param source: The file to copy from, at the position to start copying at
+    :param destination: The file to copy to
+    :param length: The number of bytes to copy
+    """
+
+    while length > 0:
+        chunk = source.read(min(length, COPY_CHUNK_BYTES))
+        if len(chunk) == 0:
+            raise FMP4Error("Clip ended in the middle of a box")
+        destination.write(chunk)
+        length -= len(chunk)
+
+def read_init(file: BinaryIO) -> InitInfo:
+    """Reads the init segment (the ftyp and moov boxes) at the start of a fragmented mp4
+
+    :param file: The clip, at its start
+    :return: Returns the parts of the init segment needed to concatenate the clip
+    """
+
+    init = b""
+    while True:
+        res = _read_top_level_box(file)
+        if res is None:
+            raise FMP4Error("Clip has no moov box")
+
+        box, header = res
+
+        # If the footage comes before the moov box, this isn't a fragmented mp4 and the whole clip would end up in memory
+        if box.type in ("mdat", "moof"):
+            raise FMP4Error("Clip has " + box.type + " box before its moov box")
+
+        init += header + file.read(box.size - box.header_size)
+
+        if box.type == "moov":
+            break
+
+    end = file.tell()
+    moov = _read_box(init, len(init) - box.size, len(init))
+
+    # Get the timescale of the track from its mdhd box, which is after the creation and modification times
+    mdhd = _body(init, _find(init, moov, ["trak", "mdia", "mdhd"]))
+    timescale, = struct.unpack_from(">I", mdhd, 20 if mdhd[0] == 1 else 12)
+
+    # Get the ID of the track from its tkhd box, which is also after the creation and modification times
+    tkhd = _body(init, _find(init, moov, ["trak", "tkhd"]))
+    track_id, = struct.unpack_from(">I", tkhd, 20 if tkhd[0] == 1 else 12)
+
+    sample_description = _body(init, _find(init, moov, ["trak", "mdia", "minf", "stbl", "stsd"]))
+
+    # The trex box holds the defaults for every fragment, after its version, flags and track ID
+    trex = _body(init, _find(init, moov, ["mvex", "trex"]))
+    default_sample_duration, = struct.unpack_from(">I", trex, 12)
+
+    return InitInfo(init=init, end=end, track_id=track_id, timescale=timescale, sample_description=sample_description,
+                    default_sample_duration=default_sample_duration, defaults=trex[8:24])
+
+def _rewrite_moof(moof: bytearray, box: Box, sequence_number: int, track_id: int, data_offset_delta: int, first_time: Optional[int], time_offset: int,
+                  default_sample_duration: int) -> Tuple[int, int]:
+    """Rewrites a moof box in place so that its fragment can be appended to another clip. Nothing changes size, so the data offsets of the fragment stay the same.
+
+    :param moof: The moof box
+    :param box: The header of the moof box, with an offset of 0
+    :param sequence_number: The new sequence number of the fragment
+    :param track_id: The new ID of the track
+    :param data_offset_delta: How far the fragment has moved in the file, for absolute data offsets
+    :param first_time: The decode time of the first fragment of the clip, or None if this is the first fragment
+    :param time_offset: The decode time in the concatenated clip where the clip starts
+    :param default_sample_duration: The default sample duration from the trex box of the clip
+    :return: Returns the original decode time of the fragment and the original decode time of the end of the fragment
+    """
+
+    children = _children(moof, box)
+
+    mfhd = [child for child in children if child.type == "mfhd"]
+    if len(mfhd) != 1:
+        raise FMP4Error("Fragment has no mfhd box")
+    struct.pack_into(">I", moof, mfhd[0].offset + mfhd[0].header_size + 4, sequence_number)
+
+    traf = [child for child in children if child.type == "traf"]
+    if len(traf) != 1:
+        raise FMP4Error("Expected one traf box but found " + str(len(traf)))
+
+    traf_children = _children(moof, traf[0])
+
+    # Give the fragment the track ID of the first clip, and move any absolute data offset along with the fragment
+    tfhd = _find(moof, traf[0], ["tfhd"])
+    position = tfhd.offset + tfhd.header_size
+    flags = int.from_bytes(moof[position + 1:position + 4], "big")
+    struct.pack_into(">I", moof, position + 4, track_id)
+    position += 8
+
+    if flags & TFHD_BASE_DATA_OFFSET_PRESENT:
+        base_data_offset, = struct.unpack_from(">Q", moof, position)
+        struct.pack_into(">Q", moof, position, base_data_offset + data_offset_delta)
+        position += 8
+    if flags & TFHD_SAMPLE_DESCRIPTION_INDEX_PRESENT:
+        position += 4
+    if flags & TFHD_DEFAULT_SAMPLE_DURATION_PRESENT:
+        default_sample_duration, = struct.unpack_from(">I", moof, position)
+
+    # Add up how long the fragment is, so that the next clip can start right after the end of this one
+    duration = 0
+    for trun in [child for child in traf_children if child.type == "trun"]:
+        position = trun.offset + trun.header_size
+        flags = int.from_bytes(moof[position + 1:position + 4], "big")
+        sample_count, = struct.unpack_from(">I", moof, position + 4)
+        position += 8
+
+        if flags & TRUN_DATA_OFFSET_PRESENT:
+            position += 4
+        if flags & TRUN_FIRST_SAMPLE_FLAGS_PRESENT:
+            position += 4
+
+        if not flags & TRUN_SAMPLE_DURATION_PRESENT:
+            duration += sample_count * default_sample_duration
+            continue
+
+        sample_size = 4 * bin(flags & (TRUN_SAMPLE_DURATION_PRESENT | TRUN_SAMPLE_SIZE_PRESENT | TRUN_SAMPLE_FLAGS_PRESENT | TRUN_SAMPLE_COMPOSITION_TIME_OFFSET_PRESENT)).count("1")
+        if position + sample_count * sample_size > trun.offset + trun.size:
+            raise FMP4Error("Truncated trun box")
+
+        # The sample duration is always the first field of each sample
+        for sample in range(sample_count):
+            duration += struct.unpack_from(">I", moof, position + sample * sample_size)[0]
+
+    # Move the decode time of the fragment so that the clip starts where the previous clip ended
+    tfdt = _find(moof, traf[0], ["tfdt"])
+    position = tfdt.offset + tfdt.header_size
+    version = moof[position]
+    decode_time, = struct.unpack_from(">Q" if version == 1 else ">I", moof, position + 4)
+
+    new_decode_time = time_offset + decode_time - (decode_time if first_time is None else first_time)
+    if new_decode_time < 0 or (version == 0 and new_decode_time >= 2 ** 32):
+        raise FMP4Error("Decode time out of range")
+    struct.pack_into(">Q" if version == 1 else ">I", moof, position + 4, new_decode_time)
+
+    return decode_time, decode_time + duration
+
+def concat_fmp4(paths: List[str], output_path: str) -> None:
+    """Concatenates fragmented mp4 clips into one clip, without re-muxing them. The init segment of the first clip is kept,
+    and the fragments of every clip are copied after it with their sequence numbers, track IDs and decode times rewritten so that the clips play one after another.
+    Only the moof boxes are ever held in memory, the mdat boxes are copied straight from one file to the other.
+
+    :param paths: The clips to concatenate, in order
+    :param output_path: The file to write the concatenated clip to
+    :raises FMP4Error: If the clips can't be concatenated like this, in which case they have to be re-muxed (for example with ffmpeg) instead.
+                       Nothing is left at `output_path` when this is raised.
+    """
+
+    try:
+        _concat_fmp4(paths, output_path)
+    except BaseException as e:
+        # Don't leave half of a clip behind for whatever is used instead
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+        # The boxes are only checked as far as we need them, so a box whose fields go past its end shows up as an error from reading them
+        if isinstance(e, (struct.error, IndexError)):
+            raise FMP4Error("Malformed box (" + str(e) + ")") from e
+        raise
+
+def _concat_fmp4(paths: List[str], output_path: str) -> None:
+    """Concatenates fragmented mp4 clips into one clip, see `concat_fmp4`.
+
+    :param paths: The clips to concatenate, in order
+    :param output_path: The file to write the concatenated clip to
+    """
+
+    if len(paths) == 0:
+        raise FMP4Error("No clips to concatenate")
+
+    # Check that the fragments of every clip can be played with the codec parameters of the first clip before writing anything
+    inits: List[InitInfo] = list()
+    for path in paths:
+        with open(path, "rb") as file:
+            inits.append(read_init(file))
+
+    first = inits[0]
+    for path, init in zip(paths, inits):
+        if init.timescale != first.timescale or init.sample_description != first.sample_description or init.defaults != first.defaults:
+            raise FMP4Error("Codec parameters of " + path + " are different from " + paths[0])
+
+    with open(output_path, "wb") as output:
+        output.write(first.init)
+
+        sequence_number = 1
+        time_offset = 0
+
+        for path, init in zip(paths, inits):
+            with open(path, "rb") as file:
+                file.seek(init.end)
+
+                first_time: Optional[int] = None
+                end_time: Optional[int] = None
+
+                while True:
+                    res = _read_top_level_box(file)
+                    if res is None:
+                        break
+
+                    box, header = res
+
+                    if box.type == "moof":
+                        moof = bytearray(header + file.read(box.size - box.header_size))
+                        if len(moof) != box.size:
+                            raise FMP4Error("Clip ended in the middle of a box")
+
+                        decode_time, fragment_end_time = _rewrite_moof(moof, Box(box.type, 0, box.header_size, box.size), sequence_number, first.track_id,
+                                                                       output.tell() - box.offset, first_time, time_offset, init.default_sample_duration)
+                        if first_time is None:
+                            first_time = decode_time
+                        end_time = fragment_end_time if end_time is None else max(end_time, fragment_end_time)
+
+                        output.write(moof)
+                        sequence_number += 1
+                    elif box.type == "mdat":
+                        output.write(header)
+                        _copy(file, output, box.size - box.header_size)
+                    else:
+                        # Boxes like styp and sidx only describe the segments of the original clip, and would be wrong in the concatenated one
+                        file.seek(box.offset + box.size)
+
+                # The next clip starts right where this one ends
+                if first_time is not None:
+                    time_offset += end_time - first_time
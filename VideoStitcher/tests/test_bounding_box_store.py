@@ -0,0 +1,119 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import os
+import sys
+import time
+import unittest
+from typing import List, Tuple
+
+# The tests are run from the VideoStitcher directory or the repo root, so make sure the VideoStitcher modules can be imported either way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rhombus_services.bounding_box_store import BoundingBoxStore, HumanBoundingBox, SETTLE_SECONDS
+
+class FakeRhombus:
+    """Stands in for the human event requests to Rhombus, with one bounding box every second and a record of every window that was asked for.
+
+    :attribute calls: The (start time, duration) in seconds of every fetch.
+    """
+
+    calls: List[Tuple[int, int]]
+
+    def __init__(self):
+        self.calls = list()
+
+    def fetch(self, start_time: int, duration: int) -> List[HumanBoundingBox]:
+        self.calls.append((start_time, duration))
+
+        # Rhombus hands back a bit more than was asked for, which the store has to trim
+        return [box_at(second) for second in range(start_time - 1, start_time + duration + 1)]
+
+def box_at(second: int) -> HumanBoundingBox:
+    return HumanBoundingBox(ts=second * 1000, object_id=second, l=0.1, r=0.2, t=0.3, b=0.4)
+
+class BoundingBoxStoreTest(unittest.TestCase):
+    def setUp(self):
+        # Long enough ago that all of these windows are settled
+        self.start = int(time.time()) - 10 * SETTLE_SECONDS - 1000
+        self.rhombus = FakeRhombus()
+
+    def get(self, store: BoundingBoxStore, start_offset: int, duration: int, camera_uuid: str = "camera") -> List[HumanBoundingBox]:
+        boxes = store.get_boxes(camera_uuid, self.start + start_offset, duration, self.rhombus.fetch)
+
+        # Whether the boxes came from the store or from Rhombus, they have to be exactly the boxes in the window
+        self.assertEqual(boxes, [box_at(self.start + start_offset + second) for second in range(duration)])
+        return boxes
+
+    def test_only_gaps_are_fetched(self):
+        store = BoundingBoxStore(":memory:", 100000)
+
+        self.get(store, 0, 100)
+        self.get(store, 50, 100)
+        self.assertEqual(self.rhombus.calls, [(self.start, 100), (self.start + 100, 50)])
+
+        # Everything is in the store now
+        self.get(store, 0, 150)
+        self.assertEqual(len(self.rhombus.calls), 2)
+
+        # A window with stored windows on both sides only fetches the gaps on either side
+        self.get(store, 200, 10)
+        self.get(store, -20, 240)
+        self.assertEqual(self.rhombus.calls[3:], [(self.start - 20, 20), (self.start + 150, 50), (self.start + 210, 10)])
+
+        # Other cameras have their own windows
+        self.get(store, 0, 10, camera_uuid="other camera")
+        self.assertEqual(self.rhombus.calls[-1], (self.start, 10))
+
+    def test_recent_windows_are_never_stored(self):
+        store = BoundingBoxStore(":memory:", 100000)
+        self.start = int(time.time()) - SETTLE_SECONDS // 2
+
+        self.get(store, 0, 10)
+        self.get(store, 0, 10)
+        self.assertEqual(self.rhombus.calls, [(self.start, 10), (self.start, 10)])
+
+    def test_least_recently_used_windows_are_evicted(self):
+        # Each window of 10 seconds is 11 entries (10 boxes and the window), so only 3 windows fit
+        store = BoundingBoxStore(":memory:", 35)
+
+        self.get(store, 0, 10)
+        self.get(store, 100, 10)
+        self.get(store, 200, 10)
+
+        # Use the first window again so that the second one is now the least recently used
+        time.sleep(0.01)
+        self.get(store, 0, 10)
+        self.assertEqual(len(self.rhombus.calls), 3)
+
+        # Adding a fourth window evicts the second one
+        time.sleep(0.01)
+        self.get(store, 300, 10)
+        self.get(store, 0, 10)
+        self.get(store, 200, 10)
+        self.assertEqual(len(self.rhombus.calls), 4)
+
+        self.get(store, 100, 10)
+        self.assertEqual(self.rhombus.calls[-1], (self.start + 100, 10))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import math
+import os
+import sys
+import unittest
+from typing import List
+
+import numpy as np
+
+# The tests are run from the VideoStitcher directory or the repo root, so make sure the VideoStitcher modules can be imported either way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rasterization.analytic import AnalyticCoverageIndex
+from rasterization.coverage_index import CoverageIndex, new_coverage_index
+from rhombus_types.camera import Camera
+from rhombus_types.events import ExitEvent
+from rhombus_types.human_event import HumanEvent
+from rhombus_types.vector import Vec2
+
+# Every direction a normalized velocity can point in
+DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+def random_site(rng: np.random.Generator) -> List[Camera]:
+    """Creates the cameras of a random site, all within about 50 meters of each other.
+
+    :param rng: The random number generator
+    :return: Returns the cameras
+    """
+
+    base = np.array([37 + rng.random(), -122 + rng.random()])
+    return [Camera(uuid="camera-%d" % i, rotation_radians=float(rng.uniform(-math.pi, math.pi)), location=Vec2(*(base + rng.normal(0, 2e-4, 2))),
+                   FOV=float(rng.uniform(0.8, 2.2)), view_distance=float(rng.uniform(5, 40)))
+            for i in range(int(rng.integers(2, 12)))]
+
+def exit_event(camera: Camera, velocity: Vec2) -> ExitEvent:
+    """Creates an exit event on a camera, only the camera and the velocity matter for camera selection.
+
+    :param camera: The camera of the exit event
+    :param velocity: The velocity of the exit event
+    :return: Returns the exit event
+    """
+
+    event = HumanEvent(id=1, position=Vec2(0.5, 0.5), dimensions=Vec2(0.1, 0.1), timestamp=0, camera=camera)
+    return ExitEvent(id=1, events=[event], velocity=velocity, related_events=[])
+
+class AnalyticCoverageIndexTest(unittest.TestCase):
+    def test_matches_raster_backend(self):
+        rng = np.random.default_rng(14)
+
+        queries = 0
+        equal = 0
+        for _ in range(8):
+            cameras = random_site(rng)
+
+            for pixels_per_meter in (1, 3):
+                raster = CoverageIndex(cameras, pixels_per_meter)
+                analytic = AnalyticCoverageIndex(cameras)
+
+                for origin in cameras:
+                    for direction in DIRECTIONS:
+                        for capture_radius in (5, 30):
+                            event = exit_event(origin, Vec2(*direction))
+                            raster_uuids = set(camera.uuid for camera in raster.get_valid_cameras(event, capture_radius))
+                            analytic_uuids = set(camera.uuid for camera in analytic.get_valid_cameras(event, capture_radius))
+
+                            # A pixel is only caught when its center is strictly inside both the capture net and a camera's FOV, and then the two
+                            # polygons overlap, so every camera the raster backend finds the analytic one has to find too
+                            self.assertLessEqual(raster_uuids, analytic_uuids)
+
+                            queries += 1
+                            equal += raster_uuids == analytic_uuids
+
+        # The only extra cameras are ones whose overlap with the capture net is too thin to cover the center of any pixel, which should be rare
+        self.assertGreater(equal / queries, 0.8)
+
+    def test_new_coverage_index(self):
+        cameras = random_site(np.random.default_rng(1))
+
+        self.assertIsInstance(new_coverage_index(cameras, "ANALYTIC", 1), AnalyticCoverageIndex)
+        self.assertIsInstance(new_coverage_index(cameras, "RASTER", 1), CoverageIndex)
+        with self.assertRaises(ValueError):
+            new_coverage_index(cameras, "ANALYTICAL", 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+import os
+import struct
+import sys
+import tempfile
+import unittest
+from typing import Dict, List, Optional, Tuple
+
+# The tests are run from the VideoStitcher directory or the repo root, so make sure the VideoStitcher modules can be imported either way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rhombus_utils.fmp4 import FMP4Error, TFHD_BASE_DATA_OFFSET_PRESENT, TRUN_DATA_OFFSET_PRESENT, TRUN_SAMPLE_DURATION_PRESENT, TRUN_SAMPLE_SIZE_PRESENT, concat_fmp4
+
+SAMPLE_DURATION = 3000
+
+# The tfhd flag saying that data offsets are from the start of the moof box, which is how Rhombus clips are fragmented
+TFHD_DEFAULT_BASE_IS_MOOF = 0x020000
+
+def box(type: str, *children: bytes) -> bytes:
+    payload = b"".join(children)
+    return struct.pack(">I4s", 8 + len(payload), type.encode("latin-1")) + payload
+
+def full_box(type: str, version: int, flags: int, *children: bytes) -> bytes:
+    return box(type, struct.pack(">I", (version << 24) | flags), *children)
+
+def init_segment(track_id: int, timescale: int = 90000, codec: str = "avc1", mdhd: Optional[bytes] = None) -> bytes:
+    """Creates the ftyp and moov boxes of a clip with a single track, with only the fields that are read filled in."""
+
+    tkhd = full_box("tkhd", 0, 0, struct.pack(">III", 0, 0, track_id), bytes(68))
+    if mdhd is None:
+        mdhd = full_box("mdhd", 0, 0, struct.pack(">III", 0, 0, timescale), bytes(8))
+    stsd = full_box("stsd", 0, 0, struct.pack(">I", 1), box(codec, bytes(16)))
+    trex = full_box("trex", 0, 0, struct.pack(">IIIII", track_id, 1, SAMPLE_DURATION, 0, 0))
+
+    trak = box("trak", tkhd, box("mdia", mdhd, box("minf", box("stbl", stsd))))
+    return box("ftyp", b"iso6", bytes(4), b"iso6") + box("moov", full_box("mvhd", 0, 0, bytes(96)), trak, box("mvex", trex))
+
+def fragment(sequence_number: int, track_id: int, decode_time: int, samples: List[bytes], durations: bool = True, tfhd_flags: int = TFHD_DEFAULT_BASE_IS_MOOF,
+             truncated_trun: bool = False) -> bytes:
+    """Creates a moof and mdat box, with the data offset of the samples relative to the start of the moof box."""
+
+    flags = TRUN_DATA_OFFSET_PRESENT | TRUN_SAMPLE_SIZE_PRESENT | (TRUN_SAMPLE_DURATION_PRESENT if durations else 0)
+    fields = b"".join((struct.pack(">I", SAMPLE_DURATION) if durations else b"") + struct.pack(">I", len(sample)) for sample in samples)
+
+    def moof(data_offset: int) -> bytes:
+        trun = full_box("trun", 0, flags, *([] if truncated_trun else [struct.pack(">Ii", len(samples), data_offset), fields]))
+        traf = box("traf", full_box("tfhd", 0, tfhd_flags, struct.pack(">I", track_id)), full_box("tfdt", 1, 0, struct.pack(">Q", decode_time)), trun)
+        return box("moof", full_box("mfhd", 0, 0, struct.pack(">I", sequence_number)), traf)
+
+    size = len(moof(0))
+    return box("styp", b"msdh", bytes(4)) + moof(size + 8) + box("mdat", *samples)
+
+def read_fragments(data: bytes) -> List[Dict[str, object]]:
+    """Reads back the fields of every fragment of a clip that the concatenation rewrites, without using the module under test."""
+
+    def children(start: int, end: int) -> List[Tuple[str, int, int]]:
+        result = list()
+        while start < end:
+            size, type = struct.unpack_from(">I4s", data, start)
+            result.append((type.decode("latin-1"), start + 8, start + size))
+            start += size
+        return result
+
+    fragments = list()
+    for type, start, end in children(0, len(data)):
+        if type == "moof":
+            boxes = dict((child[0], child) for child in children(start, end))
+            traf = dict((child[0], child) for child in children(*boxes["traf"][1:]))
+            fragments.append({
+                "sequence_number": struct.unpack_from(">I", data, boxes["mfhd"][1] + 4)[0],
+                "track_id": struct.unpack_from(">I", data, traf["tfhd"][1] + 4)[0],
+                "decode_time": struct.unpack_from(">Q", data, traf["tfdt"][1] + 4)[0],
+            })
+        elif type == "mdat":
+            fragments[-1]["samples"] = data[start:end]
+        elif type != "ftyp" and type != "moov":
+            raise AssertionError("Unexpected " + type + " box")
+
+    return fragments
+
+class FMP4Test(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.output = os.path.join(self.dir.name, "output.mp4")
+
+    def write(self, name: str, *parts: bytes) -> str:
+        path = os.path.join(self.dir.name, name)
+        with open(path, "wb") as file:
+            file.write(b"".join(parts))
+        return path
+
+    def test_concatenates(self):
+        first = self.write("first.mp4", init_segment(1),
+                           fragment(7, 1, 1000, [b"a1", b"a2", b"a3"]),
+                           fragment(8, 1, 1000 + 3 * SAMPLE_DURATION, [b"b1", b"b2", b"b3"]))
+        # The second clip has a different track ID, starts at a different time and gets its sample durations from the trex box
+        second = self.write("second.mp4", init_segment(2),
+                            fragment(1, 2, 500000, [b"c1", b"c2"], durations=False),
+                            fragment(2, 2, 500000 + 2 * SAMPLE_DURATION, [b"d1"], durations=False))
+
+        concat_fmp4([first, second], self.output)
+
+        with open(self.output, "rb") as file:
+            data = file.read()
+
+        self.assertTrue(data.startswith(init_segment(1)))
+        self.assertEqual(read_fragments(data), [
+            {"sequence_number": 1, "track_id": 1, "decode_time": 0, "samples": b"a1a2a3"},
+            {"sequence_number": 2, "track_id": 1, "decode_time": 3 * SAMPLE_DURATION, "samples": b"b1b2b3"},
+            {"sequence_number": 3, "track_id": 1, "decode_time": 6 * SAMPLE_DURATION, "samples": b"c1c2"},
+            {"sequence_number": 4, "track_id": 1, "decode_time": 8 * SAMPLE_DURATION, "samples": b"d1"},
+        ])
+
+    def assert_fails(self, paths: List[str]) -> None:
+        with self.assertRaises(FMP4Error):
+            concat_fmp4(paths, self.output)
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_different_timescale(self):
+        self.assert_fails([self.write("first.mp4", init_segment(1), fragment(1, 1, 0, [b"a"])),
+                           self.write("second.mp4", init_segment(1, timescale=30000), fragment(1, 1, 0, [b"b"]))])
+
+    def test_different_sample_description(self):
+        self.assert_fails([self.write("first.mp4", init_segment(1), fragment(1, 1, 0, [b"a"])),
+                           self.write("second.mp4", init_segment(1, codec="hvc1"), fragment(1, 1, 0, [b"b"]))])
+
+    def test_malformed_boxes(self):
+        # An empty mdhd box, which fails while reading the init segment
+        self.assert_fails([self.write("first.mp4", init_segment(1, mdhd=box("mdhd")), fragment(1, 1, 0, [b"a"]))])
+
+        # A trun box that ends before its sample count, which fails after the output was started
+        self.assert_fails([self.write("first.mp4", init_segment(1), fragment(1, 1, 0, [b"a"])),
+                           self.write("second.mp4", init_segment(1), fragment(1, 1, 0, [b"b"], truncated_trun=True))])
+
+        # A tfhd box which says it has a base data offset but is too short to hold it
+        self.assert_fails([self.write("first.mp4", init_segment(1), fragment(1, 1, 0, [b"a"])),
+                           self.write("second.mp4", init_segment(1), fragment(1, 1, 0, [b"b"], tfhd_flags=TFHD_BASE_DATA_OFFSET_PRESENT))])
+
+if __name__ == '__main__':
+    unittest.main()
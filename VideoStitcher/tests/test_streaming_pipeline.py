@@ -0,0 +1,187 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+import os
+import sys
+import unittest
+from typing import Dict, List, Tuple
+from unittest import mock
+
+import numpy as np
+
+# The tests are run from the VideoStitcher directory or the repo root, so make sure the VideoStitcher modules can be imported either way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pipeline.streaming_pipeline import Chain, StreamingPipeline
+from rhombus_types.camera import Camera
+from rhombus_types.events import EnterEvent, ExitEvent, FinalizedEvent
+from rhombus_types.track_store import TrackStore, empty_track_store
+from rhombus_types.vector import Vec2
+
+# Each track is a list of (timestamp in miliseconds, x, y) for one object ID
+Tracks = Dict[int, List[Tuple[int, float, float]]]
+
+def walk(start_time: int, start_x: float, end_x: float, y: float = 0.3, count: int = 4) -> List[Tuple[int, float, float]]:
+    """Creates a track of someone walking in a straight line across the camera, with one bounding box every second.
+
+    :param start_time: The timestamp in miliseconds of the first bounding box.
+    :param start_x: Where the person starts from 0-1.
+    :param end_x: Where the person ends up from 0-1.
+    :param y: The height from 0-1 the person walks along.
+    :param count: The number of bounding boxes.
+    :return: Returns the track.
+    """
+
+    return [(start_time + i * 1000, float(x), y) for i, x in enumerate(np.linspace(start_x, end_x, count))]
+
+class FakeRhombus:
+    """Stands in for the human event requests to Rhombus, handing back the slice of some made up tracks that was asked for.
+
+    :attribute tracks: The tracks of each camera UUID.
+    :attribute cameras: The cameras by UUID.
+    """
+
+    tracks: Dict[str, Tracks]
+    cameras: Dict[str, Camera]
+
+    def __init__(self, cameras: List[Camera]):
+        self.cameras = {camera.uuid: camera for camera in cameras}
+        self.tracks = {camera.uuid: dict() for camera in cameras}
+
+    def get_human_events_concurrently(self, api_client, requests: List[Tuple[Camera, int, int]], max_concurrency: int) -> List[TrackStore]:
+        return [self.slice(camera, start_time, duration) for camera, start_time, duration in requests]
+
+    def slice(self, camera: Camera, start_time: int, duration: int) -> TrackStore:
+        object_ids = list()
+        offsets = [0]
+        boxes = list()
+        for object_id, track in self.tracks[camera.uuid].items():
+            inside = [box for box in track if start_time * 1000 <= box[0] < (start_time + duration) * 1000]
+            if len(inside) == 0:
+                continue
+
+            object_ids.append(object_id)
+            boxes.extend(inside)
+            offsets.append(len(boxes))
+
+        if len(boxes) == 0:
+            return empty_track_store(camera)
+
+        timestamps, x, y = zip(*boxes)
+        return TrackStore(camera=camera, object_ids=np.array(object_ids, dtype=np.int64), offsets=np.array(offsets, dtype=np.int64),
+                          timestamps=np.array(timestamps, dtype=np.int64), x=np.array(x), y=np.array(y),
+                          w=np.full(len(boxes), 0.1), h=np.full(len(boxes), 0.2))
+
+class FakeCoverageIndex:
+    """Says that a person leaving any camera could walk into any of the other cameras."""
+
+    def __init__(self, cameras: List[Camera]):
+        self.cameras = cameras
+
+    def get_valid_cameras(self, exit_event: ExitEvent, capture_radius: float) -> List[Camera]:
+        return [camera for camera in self.cameras if camera.uuid != exit_event.events[0].camera.uuid]
+
+def link_summary(event: FinalizedEvent) -> List[Tuple[str, int, int, int]]:
+    """Flattens finalized events into the (camera UUID, object ID, start time, end time) of each link."""
+
+    links = list()
+    while event is not None:
+        links.append((event.data[0].camera.uuid, event.id, event.start_time, event.end_time))
+        event = event.following_event
+    return links
+
+class StreamingPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.cameras = [Camera(uuid=uuid, rotation_radians=0, location=Vec2(i * 10, 0), FOV=1, view_distance=10) for i, uuid in enumerate(["A", "B", "C"])]
+        self.rhombus = FakeRhombus(self.cameras)
+        self.updates: List[Tuple[int, List[Tuple[str, int, int, int]], bool]] = list()
+
+        patcher = mock.patch("pipeline.streaming_pipeline.get_human_events_concurrently", self.rhombus.get_human_events_concurrently)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pipeline = StreamingPipeline(None, self.cameras, self.on_chain, 0, FakeCoverageIndex(self.cameras))
+
+    def on_chain(self, chain: Chain, event: FinalizedEvent, finished: bool) -> None:
+        self.updates.append((chain.id, link_summary(event), finished))
+
+    def test_hand_off(self):
+        # Walks out of the right side of A, then walks into B from the left and straight back out the right side as one track
+        self.rhombus.tracks["A"][1] = walk(1000, 0.5, 0.97)
+        self.rhombus.tracks["B"][7] = walk(8000, 0.03, 0.97, count=7)
+
+        # The track on A is split across two slices and only closes once the object hasn't been seen for a while
+        self.pipeline.step(3)
+        self.pipeline.step(8)
+        self.assertEqual(self.updates, [])
+
+        # The enter event on B completes the hand-off, and then the exit event of the same track replaces it
+        self.pipeline.step(30)
+        self.assertEqual(self.updates, [(0, [("A", 1, 1000, 4000), ("B", 7, 8000, 14000)], False)])
+
+        # Nothing shows up on A or C within the related event window, so the chain is finished
+        self.pipeline.step(60)
+        self.assertEqual(self.updates[1:], [(0, [("A", 1, 1000, 4000), ("B", 7, 8000, 14000)], True)])
+
+    def test_chain_continues(self):
+        # Walks from A to B to C
+        self.rhombus.tracks["A"][1] = walk(1000, 0.5, 0.97)
+        self.rhombus.tracks["B"][7] = walk(8000, 0.03, 0.97, count=7)
+        self.rhombus.tracks["C"][3] = walk(18000, 0.03, 0.5)
+
+        self.pipeline.step(30)
+        self.pipeline.step(80)
+
+        expected = [("A", 1, 1000, 4000), ("B", 7, 8000, 14000), ("C", 3, 18000, 21000)]
+        self.assertEqual(self.updates[-1], (0, expected, True))
+        self.assertEqual([update for update in self.updates if update[2]], [(0, expected, True)])
+
+    def test_enter_event_is_only_used_once(self):
+        # Two people leave A, but only one person walks into B
+        self.rhombus.tracks["A"][1] = walk(1000, 0.5, 0.97)
+        self.rhombus.tracks["A"][2] = walk(2000, 0.5, 0.97)
+        self.rhombus.tracks["B"][7] = walk(8000, 0.03, 0.5)
+
+        self.pipeline.step(30)
+        self.pipeline.step(80)
+
+        # The first person to leave has the earliest deadline so they get the enter event, and the other exit is never reported
+        finished = [update for update in self.updates if update[2]]
+        self.assertEqual(finished, [(0, [("A", 1, 1000, 4000), ("B", 7, 8000, 11000)], True)])
+
+    def test_exit_without_enter_is_not_reported(self):
+        self.rhombus.tracks["A"][1] = walk(1000, 0.5, 0.97)
+
+        self.pipeline.step(30)
+        self.pipeline.step(80)
+        self.assertEqual(self.updates, [])
+
+    def test_lag_is_at_least_the_settle_time(self):
+        from rhombus_environment.environment import Environment
+        from rhombus_services.bounding_box_store import SETTLE_SECONDS
+
+        with mock.patch.object(Environment.get(), "stream_lag_seconds", 5):
+            self.assertEqual(StreamingPipeline.lag_seconds(), SETTLE_SECONDS)
+        with mock.patch.object(Environment.get(), "stream_lag_seconds", SETTLE_SECONDS + 30):
+            self.assertEqual(StreamingPipeline.lag_seconds(), SETTLE_SECONDS + 30)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,198 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import os
+import sys
+import unittest
+from typing import List
+
+import numpy as np
+
+# The tests are run from the VideoStitcher directory or the repo root, so make sure the VideoStitcher modules can be imported either way
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pipeline.isolators.velocity_isolator import isolate_velocities
+from rhombus_types.camera import Camera
+from rhombus_types.events import EdgeEventsType
+from rhombus_types.track_store import TrackStore
+from rhombus_types.vector import Vec2, vec2_compare
+from rhombus_utils.velocity import normalize_velocity, normalize_position, get_velocity
+
+def reference_isolate_velocities(events: TrackStore, type: EdgeEventsType) -> np.ndarray:
+    """The per-track velocity isolator from before it was vectorized, kept as the reference the vectorized one has to match.
+    The only change is that a track with a single event has no velocities and is kept as a tie, where this used to raise an IndexError.
+
+    :param events: The tracks of human events
+    :param type: Whether or not we are isolating based on enter or exit events
+    :return: Returns whether each of the tracks made it
+    """
+
+    keep = np.ones(len(events), dtype=bool)
+
+    for track in range(len(events)):
+        es = events.events(track, 0, 4) if type == EdgeEventsType.Begin else events.events(track, -5)
+
+        begin_event = es[0]
+        final_event = es[len(es) - 1]
+
+        velocities: List[np.ndarray] = list()
+
+        if type == EdgeEventsType.Begin:
+            for i in range(1, min(4, len(es))):
+                velocities.append(get_velocity(es[i - 1], es[i]))
+
+        elif type == EdgeEventsType.End:
+            for i in range(len(es) - 2, max(len(es) - 5, -1), -1):
+                velocities.append(get_velocity(es[i], es[i + 1]))
+
+        if len(velocities) > 0 and len(velocities) % 2 == 0:
+            velocities.pop()
+
+        averages = []
+        for axis in range(2):
+            neg_count = 0
+            pos_count = 0
+
+            for velocity in velocities:
+                normalized_velocity = normalize_velocity(velocity)
+                if normalized_velocity[axis] > 0:
+                    pos_count += 1
+                elif normalized_velocity[axis] < 0:
+                    neg_count += 1
+
+            check = 1 if pos_count > neg_count else -1
+
+            if pos_count == neg_count:
+                break
+
+            total_velocity: float = 0
+            for velocity in velocities:
+                if normalize_velocity(velocity)[axis] == check:
+                    total_velocity += velocity[axis]
+
+            averages.append(total_velocity / max(pos_count, neg_count))
+
+        # A tie on either axis keeps the track
+        if len(averages) < 2:
+            continue
+
+        velocity = Vec2(averages[0], averages[1])
+
+        if vec2_compare(np.absolute(velocity), 0.015 / 1000) == 1:
+            keep[track] = False
+
+        else:
+            normalized_velocity = normalize_velocity(velocity)
+
+            if type == EdgeEventsType.End:
+                normalized_position = normalize_position(final_event.position, Vec2(0.4, 0.4))
+                if normalized_velocity[0] - normalized_position[0] != 0 and normalized_velocity[1] - normalized_position[1] != 0:
+                    keep[track] = False
+
+            elif type == EdgeEventsType.Begin:
+                normalized_position = normalize_position(begin_event.position, Vec2(0.5, 0.5))
+                if normalized_velocity[0] - normalized_position[0] == 0 or normalized_velocity[1] - normalized_position[1] == 0:
+                    keep[track] = False
+
+    return keep
+
+def random_track_store(rng: np.random.Generator, track_count: int) -> TrackStore:
+    """Creates a track store of random tracks, including the edge cases that the isolator has to handle.
+
+    :param rng: The random number generator
+    :param track_count: The number of tracks
+    :return: Returns the track store
+    """
+
+    lengths = rng.integers(1, 9, size=track_count)
+    offsets = np.zeros(track_count + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    timestamps = []
+    x = []
+    y = []
+    for length in lengths:
+        kind = rng.integers(0, 4)
+
+        if kind == 0:
+            # Timestamps from a tiny range, so there are plenty of duplicates and zero elapsed times
+            track_timestamps = np.sort(rng.integers(0, 3, size=length))
+        else:
+            track_timestamps = np.cumsum(rng.integers(1, 2000, size=length))
+
+        if kind == 1:
+            # Someone standing still
+            track_x = np.full(length, rng.random())
+            track_y = np.full(length, rng.random())
+        elif kind == 2:
+            # Someone walking in a straight line towards or away from an edge
+            start = rng.random(2)
+            step = rng.normal(0, 0.05, size=2)
+            track_x = np.clip(start[0] + step[0] * np.arange(length), 0, 1)
+            track_y = np.clip(start[1] + step[1] * np.arange(length), 0, 1)
+        else:
+            track_x = rng.random(length)
+            track_y = rng.random(length)
+
+        timestamps.append(track_timestamps)
+        x.append(track_x)
+        y.append(track_y)
+
+    camera = Camera(uuid="camera", rotation_radians=0, location=Vec2(0, 0), FOV=1, view_distance=10)
+
+    return TrackStore(camera=camera, object_ids=np.arange(track_count, dtype=np.int64), offsets=offsets,
+                      timestamps=np.concatenate(timestamps).astype(np.int64), x=np.concatenate(x), y=np.concatenate(y),
+                      w=np.full(offsets[-1], 0.1), h=np.full(offsets[-1], 0.2))
+
+class VelocityIsolatorTest(unittest.TestCase):
+    def assert_matches_reference(self, events: TrackStore) -> None:
+        for type in (EdgeEventsType.Begin, EdgeEventsType.End):
+            expected = events.object_ids[reference_isolate_velocities(events, type)]
+            actual = isolate_velocities(events, type).object_ids
+            np.testing.assert_array_equal(actual, expected, err_msg=str(type))
+
+    def test_random_tracks(self):
+        rng = np.random.default_rng(18)
+        for _ in range(200):
+            self.assert_matches_reference(random_track_store(rng, int(rng.integers(1, 40))))
+
+    def test_single_box_tracks_are_kept(self):
+        events = random_track_store(np.random.default_rng(1), 20)
+        single = events.select(events.lengths == 1)
+        self.assertGreater(len(single), 0)
+
+        for type in (EdgeEventsType.Begin, EdgeEventsType.End):
+            self.assertEqual(len(isolate_velocities(single, type)), len(single))
+
+    def test_zero_elapsed_time(self):
+        # Every velocity of these tracks is between two events at the same time, so every track is a tie and is kept
+        camera = Camera(uuid="camera", rotation_radians=0, location=Vec2(0, 0), FOV=1, view_distance=10)
+        events = TrackStore(camera=camera, object_ids=np.array([1, 2]), offsets=np.array([0, 4, 6]),
+                            timestamps=np.array([5, 5, 5, 5, 7, 7]), x=np.array([0.1, 0.3, 0.6, 0.9, 0.2, 0.8]),
+                            y=np.full(6, 0.5), w=np.full(6, 0.1), h=np.full(6, 0.1))
+
+        self.assert_matches_reference(events)
+        for type in (EdgeEventsType.Begin, EdgeEventsType.End):
+            np.testing.assert_array_equal(isolate_velocities(events, type).object_ids, [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
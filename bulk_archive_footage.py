@@ -0,0 +1,348 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 #
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 #
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 #
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import requests
+import urllib3
+
+import rhombus_logging
+from copy_footage_to_local_storage import FEDERATED_TOKEN_DURATION_SEC, FEDERATED_TOKEN_REFRESH_MARGIN_SEC
+from rhombus_federated_token import FederatedTokenManager, session_token_fetcher
+from rhombus_media_client import AsyncMediaClient, BandwidthLimiter, get_segment_uri
+
+# just to prevent unnecessary logging since we are not verifying the host
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+_logger = rhombus_logging.get_logger("rhombus.BulkArchiveFootage")
+
+
+class ArchiveJob:
+    """One camera and time window to archive into its own MP4 file."""
+
+    def __init__(self, device_id, start_time, duration, output):
+        self.device_id = device_id
+        self.start_time = start_time
+        self.duration = duration
+        self.output = output
+
+
+class SharedFederatedToken:
+    """A federated session token for media that is shared by every camera being archived.
+
+    The token is refreshed at most once no matter how many cameras notice that it is about to expire, or get a 401
+    with it. Every refresh bumps `generation`, which lets each camera tell whether its media session was started with
+    the current token.
+    """
+
+    def __init__(self, api_sess, api_url):
+        self.token = None
+        self.generation = 0
+        # the token manager refreshes the token in the background before it expires and coalesces the refreshes
+        self.__manager = FederatedTokenManager(
+            session_token_fetcher(api_sess, api_url + "/api/org/generateFederatedSessionToken"),
+            FEDERATED_TOKEN_DURATION_SEC, FEDERATED_TOKEN_REFRESH_MARGIN_SEC)
+
+    async def ensure_fresh(self, stale_generation=None):
+        """Picks up the token once it was refreshed because it was about to expire, or refreshes it if it is still
+        the one from `stale_generation`.
+
+        :param stale_generation: The generation of a token that was rejected by a camera.
+        :return: The generation of the current token.
+        """
+        token = await self.__manager.get_token_async(
+            stale_token=self.token if stale_generation == self.generation else None)
+        if token != self.token:
+            self.token = token
+            self.generation += 1
+        return self.generation
+
+
+class BulkArchiveFootage:
+    def __init__(self, cli_args):
+        arg_parser = self.__initialize_argument_parser()
+        args = arg_parser.parse_args(cli_args)
+
+        if args.debug:
+            _logger.setLevel("DEBUG")
+
+        if not args.jobs and not args.device_ids:
+            arg_parser.error("one of --jobs or --device_ids is required")
+
+        self.api_url = "https://api2.rhombussystems.com"
+        self.output_dir = args.output_dir
+        self.use_wan = args.usewan
+        self.auto_path = args.autopath
+        self.camera_workers = max(1, args.camera_workers)
+        self.global_workers = max(1, args.global_workers)
+        self.max_cameras = max(1, args.max_cameras)
+        self.bandwidth_limiter = BandwidthLimiter(args.bandwidth_mbps * 1000 * 1000 / 8) \
+            if args.bandwidth_mbps else None
+
+        if args.start_time:
+            start_time = args.start_time
+        else:
+            now = datetime.now()
+            start_time = int((now - timedelta(hours=1)).timestamp())
+        duration = args.duration if args.duration else 1 * 60 * 60  # 1 hour
+
+        self.jobs = self.__load_jobs(args.jobs) if args.jobs else []
+        for device_id in args.device_ids or []:
+            self.jobs.append(self.__create_job(device_id, start_time, duration))
+
+        # initialize api http client
+        self.api_sess = requests.session()
+
+        # auth scheme changes depending on whether using cert/key or just api token
+        if args.cert and args.private_key:
+            scheme = "api"
+            self.api_sess.cert = (args.cert, args.private_key)
+        else:
+            scheme = "api-token"
+
+        self.api_sess.headers = {
+            "x-auth-scheme": scheme,
+            "x-auth-apikey": args.api_key}
+
+        self.api_sess.verify = False
+
+        self.media_headers = {
+            "x-auth-scheme": scheme,
+            "x-auth-apikey": args.api_key}
+
+    def execute(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        started = time.time()
+        failed = asyncio.run(self.__archive_all())
+        elapsed = time.time() - started
+
+        total_bytes = sum(os.path.getsize(job.output) for job in self.jobs if os.path.exists(job.output))
+        _logger.info("Archived %d of %d windows, %.1f MB in %.0f seconds (%.1f Mbps)",
+                     len(self.jobs) - len(failed), len(self.jobs), total_bytes / 1000 / 1000, elapsed,
+                     total_bytes * 8 / 1000 / 1000 / max(elapsed, 1))
+
+        for job in failed:
+            _logger.warn("Failed to archive %s from [%s]", job.device_id,
+                         datetime.fromtimestamp(job.start_time).strftime('%c'))
+
+        return len(failed) == 0
+
+    async def __archive_all(self):
+        """Archives every job, with up to self.max_cameras cameras downloading at once.
+
+        :return: The jobs that failed.
+        """
+        token = SharedFederatedToken(self.api_sess, self.api_url)
+        await token.ensure_fresh()
+
+        # the connector limit is the global cap on segment requests in flight, the per camera cap is enforced by the
+        # concurrency of each camera's segment fetcher. Over WAN every camera shares the same media host, so there is
+        # no per host limit
+        client = AsyncMediaClient(max_connections=self.global_workers, max_connections_per_host=0,
+                                  verify_ssl=False, bandwidth_limiter=self.bandwidth_limiter)
+
+        # start the longest windows first so that a long camera does not end up running alone at the end of the night
+        queue = asyncio.Queue()
+        for job in sorted(self.jobs, key=lambda job: job.duration, reverse=True):
+            queue.put_nowait(job)
+
+        failed = []
+
+        async def worker():
+            while not queue.empty():
+                job = queue.get_nowait()
+                try:
+                    await self.__archive_job(client, token, job)
+                except Exception as e:
+                    _logger.warn("Failed to archive %s: %s", job.device_id, e)
+                    failed.append(job)
+
+        async with client:
+            await asyncio.gather(*[worker() for _ in range(min(self.max_cameras, len(self.jobs)))])
+
+        return failed
+
+    async def __archive_job(self, client, token, job):
+        """Downloads one camera's time window into its output file.
+
+        :param client: The media client shared by all cameras.
+        :param token:  The federated token shared by all cameras.
+        :param job:    The camera and time window to archive.
+        """
+        loop = asyncio.get_running_loop()
+        started = time.time()
+        _logger.info("Archiving %s from [%s] - [%s] to %s", job.device_id,
+                     datetime.fromtimestamp(job.start_time).strftime('%c'),
+                     datetime.fromtimestamp(job.start_time + job.duration).strftime('%c'), job.output)
+
+        # get camera media uris
+        media_uri_payload = {"cameraUuid": job.device_id}
+        media_uri_resp = await loop.run_in_executor(None, lambda: self.api_sess.post(
+            self.api_url + "/api/camera/getMediaUris", json=media_uri_payload))
+        _logger.debug("Camera media uri response: %s", media_uri_resp.content)
+
+        if media_uri_resp.status_code != 200:
+            raise Exception("Failed to retrieve camera media uris: %s" % media_uri_resp.content)
+
+        if self.auto_path:
+            mpd_uri_templates = [media_uri_resp.json()["lanVodMpdUrisTemplates"][0],
+                                 media_uri_resp.json()["wanVodMpdUriTemplate"]]
+        elif self.use_wan:
+            mpd_uri_templates = [media_uri_resp.json()["wanVodMpdUriTemplate"]]
+        else:
+            mpd_uri_templates = [media_uri_resp.json()["lanVodMpdUrisTemplates"][0]]
+        media_uri_resp.close()
+
+        mpd_uris = [mpd_uri_template.replace("{START_TIME}", str(job.start_time)).replace("{DURATION}",
+                                                                                         str(job.duration))
+                    for mpd_uri_template in mpd_uri_templates]
+        _logger.debug("Mpd uris: %s", mpd_uris)
+
+        def media_headers():
+            # use the shared federated session token as our session id for the camera to process our requests
+            return dict(self.media_headers, Cookie="RSESSIONID=RFT:" + str(token.token))
+
+        # the camera media session has to be restarted whenever the shared token changes
+        session = {"generation": None, "started_at": 0, "selector": None}
+        session_lock = asyncio.Lock()
+
+        async def start_session():
+            session["generation"] = token.generation
+            if session["selector"] is None:
+                # with --autopath the LAN and the WAN MPD files are requested at once, the download starts on
+                # whichever answers first and then moves to whichever turns out to be faster
+                session["selector"] = await client.select_path(mpd_uris, media_headers)
+                mpd_info = session["selector"].current.mpd_info
+            else:
+                mpd_info = await client.restart_media_sessions(session["selector"], media_headers)
+            session["started_at"] = loop.time()
+            return mpd_info
+
+        async def on_unauthorized():
+            failed_at = loop.time()
+            async with session_lock:
+                # another segment of this camera already got a 401 and restarted the session since ours failed
+                if session["started_at"] > failed_at:
+                    return
+
+                await token.ensure_fresh(stale_generation=session["generation"])
+                await start_session()
+
+        mpd_info = await start_session()
+
+        with open(job.output, "wb") as output_fp:
+            # first write the init file
+            await client.get_to_file(get_segment_uri(session["selector"].current.mpd_uri, mpd_info.init_string),
+                                     output_fp, media_headers, on_unauthorized)
+
+            # then the actual video segment files, up to self.camera_workers in flight for this camera. Segment bodies
+            # are streamed to disk as they arrive, so memory stays flat however many cameras are downloading
+            segments = client.write_segments(output_fp, session["selector"], mpd_info,
+                                             mpd_info.get_segment_count(job.duration), media_headers,
+                                             concurrency=self.camera_workers,
+                                             on_unauthorized=on_unauthorized)
+            async for _ in segments:
+                # refresh the shared token before it expires and move this camera over to it
+                if await token.ensure_fresh() != session["generation"]:
+                    async with session_lock:
+                        if token.generation != session["generation"]:
+                            await start_session()
+
+            size = output_fp.tell()
+
+        elapsed = time.time() - started
+        _logger.info("Archived %s, %.1f MB in %.0f seconds", job.device_id, size / 1000 / 1000, elapsed)
+
+    def __load_jobs(self, path):
+        """Reads the archive jobs from a CSV file with one `camera uuid,start time,duration` line per window.
+
+        :param path: The path of the CSV file. Empty lines and lines starting with # are skipped.
+        :return: The list of jobs.
+        """
+        jobs = []
+        with open(path, "r", newline="") as fp:
+            for row in csv.reader(fp):
+                if len(row) == 0 or row[0].strip().startswith("#"):
+                    continue
+
+                device_id, start_time, duration = [column.strip() for column in row[:3]]
+                jobs.append(self.__create_job(device_id, int(start_time), int(duration)))
+        return jobs
+
+    def __create_job(self, device_id, start_time, duration):
+        output = os.path.join(self.output_dir, "%s_%d.mp4" % (device_id, start_time))
+        return ArchiveJob(device_id, start_time, duration, output)
+
+    @staticmethod
+    def __initialize_argument_parser():
+        parser = argparse.ArgumentParser(
+            description='Pulls footage from many cameras at once and stores it to the filesystem, one MP4 per camera '
+                        'and time window.')
+        parser.add_argument('--api_key', '-a', type=str, required=True,
+                            help='Rhombus API key')
+        parser.add_argument('--output_dir', '-o', type=str, required=True,
+                            help='The directory to write the MP4 files to')
+        parser.add_argument('--jobs', '-j', type=str, required=False,
+                            help='CSV file with one "camera uuid,start time in epoch seconds,duration in seconds" line '
+                                 'per window to archive')
+        parser.add_argument('--device_ids', '-d', type=str, nargs='+', required=False,
+                            help='Device Ids to pull footage from, all for the window given by --start_time and '
+                                 '--duration')
+        parser.add_argument('--cert', '-c', type=str, required=False,
+                            help='Path to API cert')
+        parser.add_argument('--private_key', '-p', type=str, required=False,
+                            help='Path to API private key')
+        parser.add_argument('--start_time', '-s', type=int, required=False,
+                            help='Start time in epoch seconds for --device_ids (default one hour ago)')
+        parser.add_argument('--duration', '-u', type=int, required=False,
+                            help='Duration in seconds for --device_ids (default one hour)')
+        parser.add_argument('--debug', '-g', required=False, action='store_true',
+                            help='Print debug logging')
+        parser.add_argument('--usewan', '-w', required=False,
+                            help='Use a WAN connection to download rather than a LAN connection', action='store_true')
+        parser.add_argument('--autopath', '-l', required=False, action='store_true',
+                            help='Try the LAN and the WAN connection of every camera at once, start on whichever '
+                                 'answers first and switch to the other while downloading if it turns out to be faster')
+        parser.add_argument('--camera_workers', '-n', type=int, required=False, default=2,
+                            help='Number of segment requests to keep in flight per camera (default 2)')
+        parser.add_argument('--global_workers', '-t', type=int, required=False, default=32,
+                            help='Number of segment requests to keep in flight across all cameras (default 32)')
+        parser.add_argument('--max_cameras', '-m', type=int, required=False, default=16,
+                            help='Number of cameras to download from at once (default 16)')
+        parser.add_argument('--bandwidth_mbps', '-b', type=float, required=False,
+                            help='Cap on the combined download rate of all cameras in megabits per second')
+        return parser
+
+
+if __name__ == "__main__":
+    # this cli command will save the last hour of footage from each of the specified devices
+    # python3 bulk_archive_footage.py -a "<API TOKEN>" -d "<DEVICE ID>" "<DEVICE ID>" -o archive/
+    engine = BulkArchiveFootage(sys.argv[1:])
+    if not engine.execute():
+        sys.exit(1)
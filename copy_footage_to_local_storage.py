@@ -22,32 +22,99 @@
 
 import requests
 import argparse
+import json
+import os
 import sys
+import threading
 import rhombus_logging
 from datetime import datetime, timedelta
 import urllib3
 
-# just to prevent unnecessary logging since we are not verifying the host
-from rhombus_mpd_info import RhombusMPDInfo
+from rhombus_federated_token import FederatedTokenManager, session_token_fetcher
+from rhombus_media_client import MediaClient, get_segment_uri
+from rhombus_segment_cache import SegmentCache
 
+# just to prevent unnecessary logging since we are not verifying the host
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 _logger = rhombus_logging.get_logger("rhombus.CopyFootageToLocalStorage")
 
-URI_FILE_ENDINGS = ["clip.mpd", "file.mpd"]
+# federated session tokens for media last this long, and are refreshed this long before they expire
+FEDERATED_TOKEN_DURATION_SEC = 60 * 60
+FEDERATED_TOKEN_REFRESH_MARGIN_SEC = 2 * 60
+
+# the manifest sidecar is written next to the output MP4, and the init segment is recorded in it with this index
+MANIFEST_SUFFIX = ".manifest"
+INIT_SEGMENT_INDEX = -1
+
+
+class SegmentManifest:
+    """Sidecar file that records which segments of a download have made it into the output MP4.
+
+    The manifest is a JSON lines file. The first line describes the download (device, start time, duration and
+    connection) and every following line records one segment with its index, the byte offset it was written at in
+    the output and its length. The init segment is recorded with index INIT_SEGMENT_INDEX. Entries are appended only
+    after the segment has been written to the output, so on resume any entry the output cannot back is discarded.
+    """
 
+    def __init__(self, path, header, entries=None, append=False):
+        """Opens the manifest for writing.
 
-def get_segment_uri(mpd_uri, segment_name):
-    for ending in URI_FILE_ENDINGS:
-        if ending in mpd_uri:
-            return mpd_uri.replace(ending, segment_name)
+        :param path:    The path of the manifest file.
+        :param header:  The dictionary describing the download, written as the first line.
+        :param entries: The segment entries that are already known to be in the output.
+        :param append:  Whether to keep the existing file. Otherwise it is rewritten from `header` and `entries`.
+        """
+        self.path = path
+        self.entries = list(entries or [])
+        self.__fp = open(path, "a" if append else "w")
+
+        if not append:
+            self.__write_line(header)
+            for entry in self.entries:
+                self.__write_line(entry)
+
+    @staticmethod
+    def load(path):
+        """Reads a manifest from disk.
+
+        A crash can leave the last line half written, so reading stops at the first line that is not valid JSON.
 
-    return None
+        :param path: The path of the manifest file.
+        :return: The header dictionary and the list of segment entries, or (None, []) if there is no manifest.
+        """
+        if not os.path.exists(path):
+            return None, []
+
+        lines = []
+        with open(path, "r") as fp:
+            for line in fp:
+                try:
+                    lines.append(json.loads(line))
+                except ValueError:
+                    break
+
+        if len(lines) == 0:
+            return None, []
+        return lines[0], lines[1:]
+
+    def record(self, index, offset, length):
+        """Records that a segment has been written to the output.
+
+        :param index:  The segment index, or INIT_SEGMENT_INDEX for the init segment.
+        :param offset: The byte offset in the output at which the segment starts.
+        :param length: The length of the segment in bytes.
+        """
+        entry = {"index": index, "offset": offset, "length": length}
+        self.entries.append(entry)
+        self.__write_line(entry)
 
+    def close(self):
+        self.__fp.close()
 
-def get_segment_uri_index(rhombus_mpd_info, mpd_uri, index):
-    segment_name = rhombus_mpd_info.segment_pattern.replace("$Number$", str(index + rhombus_mpd_info.start_index))
-    return get_segment_uri(mpd_uri, segment_name)
+    def __write_line(self, line):
+        self.__fp.write(json.dumps(line) + "\n")
+        self.__fp.flush()
 
 
 class CopyFootageToLocalStorage:
@@ -62,6 +129,16 @@ class CopyFootageToLocalStorage:
         self.device_id = args.device_id
         self.output = args.output
         self.use_wan = args.usewan
+        self.auto_path = args.autopath
+        self.workers = max(1, args.workers)
+        self.max_buffer_bytes = args.max_buffer_mb * 1024 * 1024
+        self.resume = args.resume
+        self.manifest_path = self.output + MANIFEST_SUFFIX
+
+        self.mpd_uri = None
+        self.path_selector = None
+        self.federated_session_token = None
+        self.token_lock = threading.Lock()
 
         if args.start_time:
             self.start_time = args.start_time
@@ -89,40 +166,46 @@ class CopyFootageToLocalStorage:
 
         self.api_sess.verify = False
 
-        self.media_sess = requests.session()
-        self.media_sess.verify = False
-        self.media_sess.headers = {
+        # the token is refreshed in the background shortly before it expires, so downloads don't wait for it
+        self.token_manager = FederatedTokenManager(
+            session_token_fetcher(self.api_sess, self.api_url + "/api/org/generateFederatedSessionToken"),
+            FEDERATED_TOKEN_DURATION_SEC, FEDERATED_TOKEN_REFRESH_MARGIN_SEC)
+
+        self.media_headers = {
             "x-auth-scheme": scheme,
             "x-auth-apikey": args.api_key}
 
+        # segments of overlapping windows that were downloaded before are copied from the cache instead
+        segment_cache = SegmentCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+
+        # size the connection pool so that every worker gets its own keep-alive connection to the camera
+        self.media_client = MediaClient(max_connections_per_host=self.workers, verify_ssl=False,
+                                        segment_cache=segment_cache)
+
     def execute(self):
-        # get a federated session token for media that lasts 1 hour
-        session_req_payload = {"durationSec": 60 * 60}
-        session_req_resp = self.api_sess.post(self.api_url + "/api/org/generateFederatedSessionToken",
-                                              json=session_req_payload)
-        _logger.debug("Federated session token response: %s", session_req_resp.content)
-
-        if session_req_resp.status_code != 200:
-            _logger.warn("Failed to retrieve federated session token, cannot continue: %s", session_req_resp.content)
+        # get a federated session token for media, it is refreshed as needed while downloading
+        if not self.__fetch_federated_token():
             return
 
-        federated_session_token = session_req_resp.json()["federatedSessionToken"]
-        session_req_resp.close()
-
         # get camera media uris
         media_uri_payload = {"cameraUuid": self.device_id}
         media_uri_resp = self.api_sess.post(self.api_url + "/api/camera/getMediaUris",
                                             json=media_uri_payload)
         _logger.debug("Camera media uri response: %s", media_uri_resp.content)
 
-        if session_req_resp.status_code != 200:
+        if media_uri_resp.status_code != 200:
             _logger.warn("Failed to retrieve camera media uris, cannot continue: %s", media_uri_resp.content)
             return
 
-        mpd_uri_template = media_uri_resp.json()["wanVodMpdUriTemplate"] if self.use_wan else \
-            media_uri_resp.json()["lanVodMpdUrisTemplates"][0]
+        if self.auto_path:
+            mpd_uri_templates = [media_uri_resp.json()["lanVodMpdUrisTemplates"][0],
+                                 media_uri_resp.json()["wanVodMpdUriTemplate"]]
+        elif self.use_wan:
+            mpd_uri_templates = [media_uri_resp.json()["wanVodMpdUriTemplate"]]
+        else:
+            mpd_uri_templates = [media_uri_resp.json()["lanVodMpdUrisTemplates"][0]]
 
-        _logger.debug("Raw mpd uri template: %s", mpd_uri_template)
+        _logger.debug("Raw mpd uri templates: %s", mpd_uri_templates)
         media_uri_resp.close()
 
         """ 
@@ -135,59 +218,177 @@ class CopyFootageToLocalStorage:
         a single .mp4 gives the playable video.
         """
 
-        # the template has placeholders for where the clip start time and duration are supposed to go, so put the
-        # desired start time and duration in the template
-        mpd_uri = mpd_uri_template.replace("{START_TIME}", str(self.start_time)).replace("{DURATION}",
-                                                                                         str(self.duration))
-        _logger.debug("Mpd uri: %s", mpd_uri)
-
-        # use the federated session token as our session id for the camera to process our requests
-        media_headers = {"Cookie": "RSESSIONID=RFT:" + str(federated_session_token)}
-
-        # start media session with camera by requesting the MPD file
-        mpd_doc_resp = self.media_sess.get(mpd_uri, headers=media_headers)
-        _logger.debug("Mpd doc: %s", mpd_doc_resp.content)
-        mpd_info = RhombusMPDInfo(str(mpd_doc_resp.content, 'utf-8'))
-        mpd_doc_resp.close()
+        # the templates have placeholders for where the clip start time and duration are supposed to go, so put the
+        # desired start time and duration in the templates
+        mpd_uris = [mpd_uri_template.replace("{START_TIME}", str(self.start_time)).replace("{DURATION}",
+                                                                                           str(self.duration))
+                    for mpd_uri_template in mpd_uri_templates]
+        _logger.debug("Mpd uris: %s", mpd_uris)
+
+        # start media session with camera by requesting the MPD file. With --autopath the LAN and the WAN MPD files are
+        # requested at once and the download starts on whichever answers first, then moves to whichever turns out to
+        # be faster
+        self.path_selector = self.media_client.select_path(mpd_uris, self.__media_headers)
+        self.mpd_uri = self.path_selector.current.mpd_uri
+        mpd_info = self.path_selector.current.mpd_info
+        _logger.debug("Mpd uri: %s", self.mpd_uri)
+
+        # figure out where to pick up from if we are resuming a previous download
+        manifest_header = {"device_id": self.device_id, "start_time": self.start_time, "duration": self.duration,
+                           "use_wan": self.use_wan}
+        if self.auto_path:
+            manifest_header["auto_path"] = True
+        resume_offset, next_index, manifest_entries = self.__find_resume_point(manifest_header)
+
+        if next_index > INIT_SEGMENT_INDEX:
+            _logger.info("Resuming download at segment %d (%d bytes already on disk)", next_index, resume_offset)
+
+        # start writing the video stream, truncating anything after the last complete segment. The media client's
+        # connections are closed once we are done, even if the download fails part way through
+        with self.media_client, open(self.output, "r+b" if resume_offset > 0 else "wb") as output_fp:
+            output_fp.truncate(resume_offset)
+            output_fp.seek(resume_offset)
+
+            manifest = SegmentManifest(self.manifest_path, manifest_header, manifest_entries)
 
-        # start writing the video stream
-        with open(self.output, "wb") as output_fp:
             # first write the init file
-            init_seg_uri = get_segment_uri(mpd_uri, mpd_info.init_string)
-            _logger.debug("Init segment uri: %s", init_seg_uri)
-
-            init_seg_resp = self.media_sess.get(init_seg_uri, headers=media_headers)
-            _logger.debug("seg_init_resp: %s", init_seg_resp)
+            if next_index == INIT_SEGMENT_INDEX:
+                init_seg_uri = get_segment_uri(self.mpd_uri, mpd_info.init_string)
+                _logger.debug("Init segment uri: %s", init_seg_uri)
 
-            output_fp.write(init_seg_resp.content)
-            output_fp.flush()
-            init_seg_resp.close()
+                length = self.__get_media_to_file(init_seg_uri, output_fp)
 
-            # now write the actual video segment files.
-            # Each segment is 2 seconds, so we have a total of duration / 2 segments to download
-            for cur_seg in range(int(self.duration / 2)):
-                seg_uri = get_segment_uri_index(mpd_info, mpd_uri,
-                                                cur_seg)
-                _logger.debug("Segment uri: %s", seg_uri)
-
-                seg_resp = self.media_sess.get(seg_uri, headers=media_headers)
-                _logger.debug("seg_resp: %s", seg_resp)
-
-                output_fp.write(seg_resp.content)
                 output_fp.flush()
-                seg_resp.close()
+                manifest.record(INIT_SEGMENT_INDEX, resume_offset, length)
+                next_index = 0
 
-                # log every 10 minutes of footage downloaded
+            # now write the actual video segment files.
+            # Each segment is normally 2 seconds, so we have a total of duration / 2 segments to download, but the MPD
+            # document has the final say.
+            # Up to self.workers segments are requested at once, but they are always written in index order. Segment
+            # bodies are streamed to disk as they arrive rather than held in memory.
+            segments = self.media_client.write_segments(output_fp, self.path_selector, mpd_info,
+                                                        mpd_info.get_segment_count(self.duration), self.__media_headers,
+                                                        first_index=next_index, concurrency=self.workers,
+                                                        max_spooled_bytes=self.max_buffer_bytes,
+                                                        on_unauthorized=self.__force_refresh_media_session,
+                                                        camera_uuid=self.device_id, start_time=self.start_time)
+            for cur_seg, offset, length in segments:
+                manifest.record(cur_seg, offset, length)
+
+                # refresh the federated token before it expires, the segments already in flight keep downloading
+                self.__refresh_media_session()
+
+                # log every 300 segments (10 minutes of 2 second segments) of footage downloaded
                 if cur_seg > 0 and cur_seg % 300 == 0:
+                    output_fp.flush()
                     _logger.info("Segments written from [%s] - [%s]",
-                                 datetime.fromtimestamp(self.start_time + ((cur_seg - 300) * 2)).strftime('%c'),
-                                 datetime.fromtimestamp(self.start_time + (cur_seg * 2)).strftime('%c'))
+                                 datetime.fromtimestamp(self.start_time +
+                                                        mpd_info.get_segment_offset_sec(cur_seg - 300)).strftime('%c'),
+                                 datetime.fromtimestamp(self.start_time +
+                                                        mpd_info.get_segment_offset_sec(cur_seg)).strftime('%c'))
+
+            manifest.close()
 
         _logger.info("Succesfully downloaded video from [%s] - [%s] to %s",
                      datetime.fromtimestamp(self.start_time).strftime('%c'),
                      datetime.fromtimestamp(self.start_time + self.duration).strftime('%c'),
                      self.output)
 
+    def __find_resume_point(self, manifest_header):
+        """Finds where a previous download of the same footage stopped.
+
+        :param manifest_header: The manifest header describing the current download.
+        :return: The byte offset to resume writing at, the next segment index to download and the manifest entries
+                 for the segments already on disk. When not resuming this is (0, INIT_SEGMENT_INDEX, []).
+        """
+        if not self.resume:
+            return 0, INIT_SEGMENT_INDEX, []
+
+        header, entries = SegmentManifest.load(self.manifest_path)
+        if header is None or not os.path.exists(self.output):
+            _logger.info("Nothing to resume from, starting a new download")
+            return 0, INIT_SEGMENT_INDEX, []
+
+        if header != manifest_header:
+            _logger.warn("Manifest %s is for a different download, starting over", self.manifest_path)
+            return 0, INIT_SEGMENT_INDEX, []
+
+        # keep the longest run of contiguous entries that is actually backed by bytes in the output file
+        output_size = os.path.getsize(self.output)
+        offset = 0
+        next_index = INIT_SEGMENT_INDEX
+        complete_entries = []
+        for entry in entries:
+            if entry["index"] != next_index or entry["offset"] != offset or \
+                    entry["offset"] + entry["length"] > output_size:
+                break
+
+            complete_entries.append(entry)
+            offset += entry["length"]
+            next_index += 1
+
+        return offset, next_index, complete_entries
+
+    def __fetch_federated_token(self):
+        """Gets a federated session token for media.
+
+        :return: Whether a token was retrieved.
+        """
+        try:
+            self.federated_session_token = self.token_manager.get_token()
+        except Exception as e:
+            _logger.warn("Failed to retrieve federated session token, cannot continue: %s", e)
+            return False
+
+        return True
+
+    def __start_media_session(self):
+        """Starts a media session with the camera for the current federated token by requesting the MPD file over
+        every path the download may use.
+
+        :return: The parsed MPD document.
+        """
+        return self.media_client.restart_media_sessions(self.path_selector, self.__media_headers)
+
+    def __refresh_media_session(self, force=False):
+        """Picks up the federated token once the token manager has refreshed it, and restarts the camera media session
+        with it.
+
+        Can be called from the download loop and from the media client at the same time, so only the first caller
+        to notice the new token restarts the media session.
+
+        :param force: Refresh even if the token does not look expired, for example after the camera returned a 401.
+        """
+        with self.token_lock:
+            # a token rejected by the camera is only refreshed once, however many requests it was rejected for
+            token = self.token_manager.get_token(stale_token=self.federated_session_token if force else None)
+            if token == self.federated_session_token:
+                return
+
+            self.federated_session_token = token
+            self.__start_media_session()
+
+    def __force_refresh_media_session(self):
+        # the token can also be rejected before we expected it to expire, in which case the media client calls this
+        # before trying the request once more
+        self.__refresh_media_session(force=True)
+
+    def __media_headers(self):
+        # use the federated session token as our session id for the camera to process our requests
+        return dict(self.media_headers, Cookie="RSESSIONID=RFT:" + str(self.federated_session_token))
+
+    def __get_media_to_file(self, uri, output_fp):
+        """Streams a media file from the camera into the output, refreshing the federated token when it expires.
+
+        :param uri:       The media URI to download.
+        :param output_fp: The file to write the media file to, at its current position.
+        :return: The number of bytes written.
+        """
+        self.__refresh_media_session()
+        return self.media_client.get_to_file(uri, output_fp, self.__media_headers,
+                                             on_unauthorized=self.__force_refresh_media_session)
+
     @staticmethod
     def __initialize_argument_parser():
         parser = argparse.ArgumentParser(
@@ -210,6 +411,22 @@ class CopyFootageToLocalStorage:
                             help='Print debug logging')
         parser.add_argument('--usewan', '-w', required=False,
                             help='Use a WAN connection to download rather than a LAN connection', action='store_true')
+        parser.add_argument('--autopath', '-l', required=False, action='store_true',
+                            help='Try the LAN and the WAN connection at once, start on whichever answers first and '
+                                 'switch to the other while downloading if it turns out to be faster')
+        parser.add_argument('--workers', '-n', type=int, required=False, default=1,
+                            help='Number of segment requests to keep in flight at once (default 1)')
+        parser.add_argument('--max_buffer_mb', '-m', type=int, required=False, default=64,
+                            help='Cap in MB on segments downloaded ahead of the one being written, which are spooled '
+                                 'to temporary files next to the output (default 64)')
+        parser.add_argument('--resume', '-r', required=False, action='store_true',
+                            help='Continue a partial download of the same footage using the manifest next to the '
+                                 'output. Requires the same --start_time and --duration as the original run')
+        parser.add_argument('--cache_dir', '-k', type=str, required=False,
+                            help='Directory of a segment cache shared between runs, so that overlapping footage is '
+                                 'only downloaded from the camera once')
+        parser.add_argument('--cache_max_mb', '-x', type=int, required=False, default=1024,
+                            help='Size cap in MB of the segment cache (default 1024)')
         return parser
 
 
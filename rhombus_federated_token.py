@@ -0,0 +1,226 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 # 
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 # 
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 # 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+import rhombus_logging
+
+_logger = rhombus_logging.get_logger("rhombus.FederatedToken")
+
+# How long the federated tokens are requested for by default
+FEDERATED_TOKEN_DURATION_SEC = 60 * 60
+
+# When a token has less than this left it is refreshed in the background, while callers keep using the current one
+FEDERATED_TOKEN_REFRESH_MARGIN_SEC = 5 * 60
+
+# Generates a federated token lasting the given number of seconds, raising if Rhombus refuses
+TokenFetcher = Callable[[int], str]
+
+# The key of the token manager shared by everything in the process which uses a generated RhombusAPI client
+API_CLIENT_TOKEN_MANAGER = "api-client"
+
+
+def session_token_fetcher(api_sess, url: str) -> TokenFetcher:
+    """Creates a token fetcher which uses a `requests` session that is already authenticated with the Rhombus API.
+
+    :param api_sess: The requests session with the API key headers set
+    :param url: The URL of the generateFederatedSessionToken endpoint
+    :return: The token fetcher
+    """
+    def fetch(duration_sec: int) -> str:
+        session_req_resp = api_sess.post(url, json={"durationSec": duration_sec})
+        _logger.debug("Federated session token response: %s", session_req_resp.content)
+
+        if session_req_resp.status_code != 200:
+            raise Exception("Failed to retrieve federated session token: %s" % session_req_resp.content)
+
+        token = session_req_resp.json()["federatedSessionToken"]
+        session_req_resp.close()
+        return token
+
+    return fetch
+
+
+def api_client_token_fetcher(api_client) -> TokenFetcher:
+    """Creates a token fetcher which uses a client generated from the Rhombus API spec.
+
+    :param api_client: The `RhombusAPI.ApiClient` with the API key set
+    :return: The token fetcher
+    """
+    # Only the examples that use the generated client have RhombusAPI installed, so it is not imported up front
+    import RhombusAPI as rapi
+
+    org_api = rapi.OrgWebserviceApi(api_client=api_client)
+
+    def fetch(duration_sec: int) -> str:
+        federated_token_request = rapi.OrgGenerateFederatedSessionTokenRequest(duration_sec=duration_sec)
+        return org_api.generate_federated_session_token(body=federated_token_request).federated_session_token
+
+    return fetch
+
+
+class FederatedTokenManager:
+    """A federated session token for media that is shared by everything in the process which downloads media.
+
+    Generating a token is an API request, so instead of generating one for every clip the token is cached until it is
+    about to expire. Once it has less than `refresh_margin_sec` left it is refreshed in a background thread while
+    callers keep using the current one, so nobody has to wait for it. Only one refresh runs at a time: callers that
+    need a new token while a refresh is running wait for that refresh instead of starting their own.
+
+    The manager can be used from any thread with `get_token`, and from any event loop with `get_token_async`, which
+    never blocks the loop.
+
+    :attribute duration_sec: How long the tokens are requested for
+    :attribute refresh_margin_sec: How long before a token expires it is refreshed in the background
+    :attribute generation: How many tokens have been generated, which lets callers tell whether something (like a
+                           camera media session) was set up with the current token
+    """
+
+    duration_sec: int
+    refresh_margin_sec: int
+    generation: int
+
+    def __init__(self, fetch: TokenFetcher, duration_sec: int = FEDERATED_TOKEN_DURATION_SEC,
+                 refresh_margin_sec: int = FEDERATED_TOKEN_REFRESH_MARGIN_SEC):
+        """Constructor for the token manager. No token is generated until the first one is asked for.
+
+        :param fetch: Generates a new token. It is only ever called from the manager's refresh thread, so it may block
+        :param duration_sec: How long the tokens are requested for
+        :param refresh_margin_sec: How long before a token expires it is refreshed in the background
+        """
+        self.duration_sec = duration_sec
+        self.refresh_margin_sec = refresh_margin_sec
+        self.generation = 0
+        self.__fetch = fetch
+        self.__lock = threading.Lock()
+        self.__token: Optional[str] = None
+        self.__expiry_sec = 0.0
+        self.__refresh: Optional[Future] = None
+
+    @property
+    def token(self) -> Optional[str]:
+        """The current token, without checking whether it has expired, or None if no token was generated yet"""
+        return self.__token
+
+    def get_token(self, valid_for_sec: int = 0, stale_token: Optional[str] = None) -> str:
+        """Gets a token, waiting for a new one to be generated if the current one can't be used.
+
+        :param valid_for_sec: How long the token has to stay valid for, for example the length of the clip about to
+                              be downloaded with it
+        :param stale_token: A token that was rejected by a camera. If it is still the current token a new one is
+                            generated, otherwise the token that replaced it is returned
+        :return: The token
+        """
+        while True:
+            token, refresh = self.__check(valid_for_sec, stale_token)
+            if token is not None:
+                return token
+
+            refresh.result()
+
+            # Whatever the refresh came back with replaced the rejected token, even if Rhombus handed out the same one
+            stale_token = None
+
+    async def get_token_async(self, valid_for_sec: int = 0, stale_token: Optional[str] = None) -> str:
+        """See `get_token`. Waiting for a new token doesn't block the event loop."""
+        while True:
+            token, refresh = self.__check(valid_for_sec, stale_token)
+            if token is not None:
+                return token
+
+            await asyncio.wrap_future(refresh)
+            stale_token = None
+
+    def __check(self, valid_for_sec: int, stale_token: Optional[str]):
+        # Returns either a token that can be used, or the refresh to wait for before checking again
+        with self.__lock:
+            remaining_sec = self.__expiry_sec - time.time()
+
+            if self.__token is None or self.__token == stale_token or remaining_sec <= valid_for_sec:
+                return None, self.__start_refresh(valid_for_sec)
+
+            if remaining_sec <= self.refresh_margin_sec:
+                self.__start_refresh(valid_for_sec)
+
+            return self.__token, None
+
+    def __start_refresh(self, valid_for_sec: int) -> Future:
+        # Must be called with the lock held. If a refresh is already running, everyone waits for that one instead.
+        if self.__refresh is not None:
+            return self.__refresh
+
+        self.__refresh = Future()
+        duration_sec = max(self.duration_sec, valid_for_sec + self.refresh_margin_sec)
+        threading.Thread(target=self.__run_refresh, args=(self.__refresh, duration_sec), name="federated-token",
+                         daemon=True).start()
+        return self.__refresh
+
+    def __run_refresh(self, refresh: Future, duration_sec: int) -> None:
+        _logger.info("Refreshing federated session token")
+
+        # The token starts expiring as soon as it is requested, not when the response arrives
+        requested_sec = time.time()
+
+        try:
+            token = self.__fetch(duration_sec)
+        except Exception as e:
+            _logger.warning("Failed to refresh federated session token: %s", e)
+            with self.__lock:
+                self.__refresh = None
+            refresh.set_exception(e)
+            return
+
+        with self.__lock:
+            self.__token = token
+            self.__expiry_sec = requested_sec + duration_sec
+            self.generation += 1
+            self.__refresh = None
+        refresh.set_result(token)
+
+
+# The token managers shared by the whole process, by key
+_shared_managers_lock = threading.Lock()
+_shared_managers: Dict[str, FederatedTokenManager] = {}
+
+
+def shared_token_manager(key: str, create_fetcher: Callable[[], TokenFetcher],
+                         duration_sec: int = FEDERATED_TOKEN_DURATION_SEC,
+                         refresh_margin_sec: int = FEDERATED_TOKEN_REFRESH_MARGIN_SEC) -> FederatedTokenManager:
+    """Gets the token manager shared by everything in the process that asks for the same key, creating it the first
+    time, so that a new federated token is only generated when the last one is about to expire.
+
+    :param key: Which shared manager to get, for example `API_CLIENT_TOKEN_MANAGER`
+    :param create_fetcher: Creates the token fetcher of the manager, only called when the manager is created
+    :param duration_sec: See `FederatedTokenManager`, only used when the manager is created
+    :param refresh_margin_sec: See `FederatedTokenManager`, only used when the manager is created
+    :return: The shared token manager
+    """
+    with _shared_managers_lock:
+        manager = _shared_managers.get(key)
+        if manager is None:
+            manager = FederatedTokenManager(create_fetcher(), duration_sec, refresh_margin_sec)
+            _shared_managers[key] = manager
+        return manager
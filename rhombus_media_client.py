@@ -0,0 +1,751 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 #
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 #
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 #
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import asyncio
+import contextlib
+import functools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import (Any, AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple,
+                    TypeVar, Union)
+
+import aiohttp
+
+import rhombus_logging
+from rhombus_mpd_info import RhombusMPDInfo
+from rhombus_path_selector import MediaPath, PathSelector
+from rhombus_segment_cache import SegmentCache
+
+_logger = rhombus_logging.get_logger("rhombus.MediaClient")
+
+# The possible MPD URI endings. Live LAN streams end in "live.mpd", live WAN streams end in "file.mpd" like VODs do.
+URI_FILE_ENDINGS = ["clip.mpd", "file.mpd", "live.mpd"]
+
+# How many segment requests a single download keeps in flight by default
+DEFAULT_CONCURRENCY = 4
+
+# How many bytes of out of order segments a single download may hold in memory (or spool to disk) by default
+DEFAULT_MAX_BUFFERED_BYTES = 64 * 1024 * 1024
+
+# Cached segments of footage whose MPD document does not give a resolution are stored under this name
+UNKNOWN_RESOLUTION = "unknown"
+
+# Response bodies that are streamed to a file, or read under a bandwidth limit, are read in chunks of this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# How long the paths that lost the MPD race of `select_path` get to answer before they are given up on
+ALTERNATE_PATH_TIMEOUT_SEC = 30
+
+# Headers can either be given as a dictionary, or as a function returning one so that a refreshed federated token is
+# picked up by requests made after the refresh
+Headers = Union[Dict[str, str], Callable[[], Dict[str, str]], None]
+
+T = TypeVar('T')
+
+
+@functools.lru_cache(maxsize=1024)
+def _split_mpd_uri(mpd_uri: str) -> Optional[Tuple[str, str]]:
+    """Splits an MPD URI around its file ending, so that segment URIs only take a concatenation to build."""
+    for ending in URI_FILE_ENDINGS:
+        if ending in mpd_uri:
+            before, _, after = mpd_uri.partition(ending)
+            return before, after
+
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _get_segment_uri_formatter(rhombus_mpd_info: RhombusMPDInfo, mpd_uri: str) -> Callable[[int], Optional[str]]:
+    """Compiles the segment URIs of an MPD URI, so that each one only takes a concatenation to build."""
+    parts = _split_mpd_uri(mpd_uri)
+    if parts is None:
+        return lambda index: None
+
+    return rhombus_mpd_info.get_segment_name_formatter(parts[0], parts[1])
+
+
+def get_segment_uri(mpd_uri: str, segment_name: str) -> Optional[str]:
+    """Gets the URI of a segment with a given segment name.
+
+    :param mpd_uri: The original MPD URI
+    :param segment_name: The replacement name, for example "seg_init.mp4"
+    :return: The new URI
+    """
+    parts = _split_mpd_uri(mpd_uri)
+    if parts is None:
+        return None
+
+    return parts[0] + segment_name + parts[1]
+
+
+def get_segment_uri_index(rhombus_mpd_info: RhombusMPDInfo, mpd_uri: str, index: int) -> Optional[str]:
+    """Gets the URI of a segment with a given index
+
+    :param rhombus_mpd_info: The Rhombus MPD info
+    :param mpd_uri: The original MPD URI
+    :param index: The index starting from 0
+    :return: The new URI
+    """
+    return _get_segment_uri_formatter(rhombus_mpd_info, mpd_uri)(index)
+
+
+def _resolve_headers(headers: Headers) -> Dict[str, str]:
+    if callable(headers):
+        return headers()
+    return headers or {}
+
+
+def _append_file(source: BinaryIO, destination: BinaryIO, length: int) -> None:
+    """Appends the first `length` bytes of `source` to `destination` at its current position.
+
+    Where the platform can do it (Linux), the bytes are copied by the kernel with os.sendfile and never enter Python.
+    Otherwise this falls back to a buffered copy.
+    """
+    destination.flush()
+    offset = destination.tell()
+
+    try:
+        sent = 0
+        while sent < length:
+            count = os.sendfile(destination.fileno(), source.fileno(), sent, length - sent)
+            if count == 0:
+                raise EOFError("Spooled segment is shorter than expected")
+            sent += count
+
+        # sendfile moved the file descriptor, so bring the Python file object back in line with it
+        destination.seek(offset + length)
+    except (AttributeError, OSError):
+        source.seek(0)
+        destination.seek(offset)
+        shutil.copyfileobj(source, destination, STREAM_CHUNK_BYTES)
+
+
+class BandwidthLimiter:
+    """Token bucket that caps the combined download rate of every request made through the clients sharing it.
+
+    Waiters are served in the order they arrive, so one large download cannot starve the others.
+    """
+
+    def __init__(self, bytes_per_sec: float):
+        """Constructor for the bandwidth limiter
+
+        :param bytes_per_sec: The maximum average download rate in bytes per second. Up to one second worth of bytes
+                              can be downloaded in a burst after the limiter has been idle.
+        """
+        self.__rate = bytes_per_sec
+        self.__tokens = bytes_per_sec
+        self.__last_refill: Optional[float] = None
+        self.__lock = asyncio.Lock()
+
+    async def acquire(self, byte_count: int) -> None:
+        """Waits until `byte_count` bytes may be downloaded.
+
+        :param byte_count: The number of bytes that were just read, or are about to be
+        """
+        async with self.__lock:
+            now = asyncio.get_running_loop().time()
+            if self.__last_refill is not None:
+                self.__tokens = min(self.__rate, self.__tokens + (now - self.__last_refill) * self.__rate)
+            self.__last_refill = now
+
+            self.__tokens -= byte_count
+            if self.__tokens < 0:
+                # Holding the lock while sleeping is what keeps the waiters in order
+                await asyncio.sleep(-self.__tokens / self.__rate)
+
+
+class AsyncMediaClient:
+    """asyncio client used to download MPEG-DASH media (MPD documents, init segments and video segments) from Rhombus
+    cameras and the Rhombus media servers.
+
+    All requests go through one aiohttp session, so connections to each camera are pooled and kept alive between
+    segments instead of being opened per request. Segment downloads keep several requests in flight at once and hand
+    the segments back strictly in index order.
+
+    The session is created lazily on first use, so the client can be constructed outside of a running event loop.
+    """
+
+    def __init__(self, max_connections: int = 64, max_connections_per_host: int = 8,
+                 keepalive_timeout: float = 30.0, verify_ssl: bool = True,
+                 bandwidth_limiter: Optional[BandwidthLimiter] = None,
+                 segment_cache: Optional[SegmentCache] = None):
+        """Constructor for the media client
+
+        :param max_connections: The maximum number of open connections across all hosts. Requests beyond this wait for
+                                a connection to free up, so this is also the global limit on requests in flight.
+        :param max_connections_per_host: The maximum number of open connections to a single camera or media server,
+                                         or 0 for no limit.
+        :param keepalive_timeout: How long in seconds an idle connection is kept open for reuse.
+        :param verify_ssl: Whether to verify the TLS certificates of the media hosts.
+        :param bandwidth_limiter: An optional limiter that caps the download rate of this client.
+        :param segment_cache: An optional on-disk cache that `write_segments` reads segments from before asking the
+                              camera, and stores the segments it downloads in.
+        """
+        self.__max_connections = max_connections
+        self.__max_connections_per_host = max_connections_per_host
+        self.__keepalive_timeout = keepalive_timeout
+        self.__verify_ssl = verify_ssl
+        self.__bandwidth_limiter = bandwidth_limiter
+        self.__segment_cache = segment_cache
+        self.__session: Optional[aiohttp.ClientSession] = None
+        self.__path_tasks: Set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> 'AsyncMediaClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(limit=self.__max_connections,
+                                             limit_per_host=self.__max_connections_per_host,
+                                             keepalive_timeout=self.__keepalive_timeout,
+                                             ssl=None if self.__verify_ssl else False)
+            self.__session = aiohttp.ClientSession(connector=connector)
+        return self.__session
+
+    async def close(self) -> None:
+        """Closes all pooled connections."""
+        for task in self.__path_tasks:
+            task.cancel()
+
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    @contextlib.asynccontextmanager
+    async def __open(self, uri: str, headers: Headers,
+                     on_unauthorized: Optional[Callable[[], Any]]) -> AsyncIterator[aiohttp.ClientResponse]:
+        _logger.debug("Getting %s", uri)
+
+        response = await self.__get_session().get(uri, headers=_resolve_headers(headers))
+        try:
+            if response.status == 401 and on_unauthorized is not None:
+                response.release()
+                if asyncio.iscoroutinefunction(on_unauthorized):
+                    await on_unauthorized()
+                else:
+                    await asyncio.get_running_loop().run_in_executor(None, on_unauthorized)
+                response = await self.__get_session().get(uri, headers=_resolve_headers(headers))
+
+            if response.status != 200:
+                raise ConnectionError("Failed to get {}: {} {}".format(uri, response.status, response.reason))
+
+            yield response
+        finally:
+            response.release()
+
+    async def __iter_body(self, response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        async for chunk in response.content.iter_chunked(STREAM_CHUNK_BYTES):
+            if self.__bandwidth_limiter is not None:
+                await self.__bandwidth_limiter.acquire(len(chunk))
+            yield chunk
+
+    async def get(self, uri: str, headers: Headers = None,
+                  on_unauthorized: Optional[Callable[[], Any]] = None) -> bytes:
+        """Downloads a media file into memory.
+
+        :param uri: The media URI to download from
+        :param headers: The HTTP Headers to send with our request. These are required to authenticate
+        :param on_unauthorized: Called when the request is rejected with a 401, for example to refresh an expired
+                                federated token. The request is then retried once. Coroutine functions are awaited,
+                                anything else is called from a worker thread.
+        :return: The response body
+        """
+        async with self.__open(uri, headers, on_unauthorized) as response:
+            if self.__bandwidth_limiter is None:
+                return await response.read()
+
+            body = bytearray()
+            async for chunk in self.__iter_body(response):
+                body += chunk
+            return bytes(body)
+
+    async def get_to_file(self, uri: str, file: BinaryIO, headers: Headers = None,
+                          on_unauthorized: Optional[Callable[[], Any]] = None) -> int:
+        """Downloads a media file and streams it into `file` at its current position.
+
+        The body is written as it arrives, so no more than one chunk of it is held in memory however large it is.
+
+        :param uri: The media URI to download from
+        :param file: The binary file to write to
+        :param headers: See `get`
+        :param on_unauthorized: See `get`
+        :return: The number of bytes written
+        """
+        length = 0
+        async with self.__open(uri, headers, on_unauthorized) as response:
+            async for chunk in self.__iter_body(response):
+                file.write(chunk)
+                length += len(chunk)
+        return length
+
+    async def get_mpd_info(self, mpd_uri: str, headers: Headers = None,
+                           on_unauthorized: Optional[Callable[[], Any]] = None) -> RhombusMPDInfo:
+        """Downloads and parses an MPD document. For camera VODs this also starts the media session on the camera.
+
+        :param mpd_uri: The MPD URI
+        :param headers: The HTTP Headers to send with our request
+        :param on_unauthorized: See `get`
+        :return: The parsed MPD document
+        """
+        return RhombusMPDInfo.parse(str(await self.get(mpd_uri, headers, on_unauthorized), 'utf-8'))
+
+    async def select_path(self, mpd_uris: List[str], headers: Headers = None,
+                          on_unauthorized: Optional[Callable[[], Any]] = None) -> PathSelector:
+        """Requests the MPD document of the same media over several paths at once, usually the LAN and the WAN MPD
+        URI of a camera, and starts out on whichever answers first.
+
+        The download does not wait for the other paths. They are added to the selector in the background as they answer
+        so that `write_segments` and `fetch_segments` can measure them and switch to them, and are given up on if they
+        have not answered within `ALTERNATE_PATH_TIMEOUT_SEC`. An unreachable LAN therefore costs nothing instead of a
+        connection timeout.
+
+        :param mpd_uris: The MPD URIs of the same media, in order of preference
+        :param headers: The HTTP Headers to send with our requests
+        :param on_unauthorized: See `get`
+        :return: The path selector to pass to `write_segments` or `fetch_segments` in place of the MPD URI
+        """
+        tasks = {asyncio.ensure_future(self.__get_path(mpd_uri, headers, on_unauthorized)): mpd_uri
+                 for mpd_uri in mpd_uris}
+        pending = set(tasks)
+        selector = None
+        errors = []
+
+        try:
+            while selector is None and pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                # Several paths can finish together, in which case the preferred one goes first
+                for task in sorted(done, key=lambda finished: mpd_uris.index(tasks[finished])):
+                    if task.exception() is not None:
+                        _logger.debug("Media path %s is not available: %s", tasks[task], task.exception())
+                        errors.append(task.exception())
+                    elif selector is None:
+                        _logger.debug("Media path %s answered first", tasks[task])
+                        selector = PathSelector(task.result())
+                    else:
+                        selector.add_path(task.result())
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+
+        if selector is None:
+            raise errors[0]
+
+        for task in pending:
+            path_task = asyncio.ensure_future(self.__add_path_later(selector, tasks[task], task))
+            self.__path_tasks.add(path_task)
+            path_task.add_done_callback(self.__path_tasks.discard)
+
+        return selector
+
+    async def restart_media_sessions(self, selector: PathSelector, headers: Headers = None,
+                                     on_unauthorized: Optional[Callable[[], Any]] = None) -> RhombusMPDInfo:
+        """Requests the MPD document again over every path of `selector` that is still in use, which restarts the
+        camera media session on each of them, for example after the federated token was refreshed.
+
+        Only a failure on the current path is raised. Any other path that fails is logged, and is given up on as soon
+        as a segment request over it fails as well.
+
+        :param selector: The path selector from `select_path`
+        :param headers: The HTTP Headers to send with our requests
+        :param on_unauthorized: See `get`
+        :return: The parsed MPD document of the current path
+        """
+        current = selector.current
+        mpd_info = await self.get_mpd_info(current.mpd_uri, headers, on_unauthorized)
+
+        for path in selector.paths:
+            if path is current or path.failed:
+                continue
+
+            try:
+                await self.get_mpd_info(path.mpd_uri, headers, on_unauthorized)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                _logger.warning("Failed to restart the media session over %s: %s", path.mpd_uri, e)
+
+        return mpd_info
+
+    async def __get_path(self, mpd_uri: str, headers: Headers,
+                         on_unauthorized: Optional[Callable[[], Any]]) -> MediaPath:
+        mpd_doc = str(await self.get(mpd_uri, headers, on_unauthorized), 'utf-8')
+        return MediaPath(mpd_uri, RhombusMPDInfo.parse(mpd_doc), mpd_doc)
+
+    @staticmethod
+    async def __add_path_later(selector: PathSelector, mpd_uri: str, task: Awaitable[MediaPath]) -> None:
+        try:
+            path = await asyncio.wait_for(task, ALTERNATE_PATH_TIMEOUT_SEC)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _logger.debug("Media path %s is not available: %s", mpd_uri, e)
+            return
+
+        _logger.debug("Media path %s answered", mpd_uri)
+        selector.add_path(path)
+
+    @staticmethod
+    async def __get_segment(selector: PathSelector, index: int, get: Callable[[str], Awaitable[T]],
+                            size_of: Callable[[T], int], discard: Callable[[], None]) -> T:
+        while True:
+            path = selector.choose()
+            started = time.monotonic()
+            try:
+                result = await get(get_segment_uri_index(path.mpd_info, path.mpd_uri, index))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # The connection failed or dropped in the middle of the segment, so throw away anything partially
+                # downloaded and try again, over another path if there is one. Error responses are not retried, the
+                # other paths serve the same footage and would answer the same way
+                if not selector.record_failure(path):
+                    raise
+                _logger.warning("Failed to get segment %d over %s, retrying: %s", index, path.mpd_uri, e)
+                discard()
+                continue
+            except BaseException:
+                path.pending -= 1
+                raise
+
+            selector.record_success(path, size_of(result), time.monotonic() - started)
+            return result
+
+    @staticmethod
+    async def __fetch_in_order(fetch: Callable[[int], Awaitable[T]], size_of: Callable[[T], int], segment_count: int,
+                               first_index: int, concurrency: int, max_buffered_bytes: int
+                               ) -> AsyncIterator[Tuple[int, T]]:
+        tasks: Dict[int, asyncio.Future] = dict()
+        buffered: Dict[int, T] = dict()
+        buffered_bytes = 0
+        next_submit = first_index
+        next_write = first_index
+
+        try:
+            while next_write < segment_count:
+                # Keep the pool busy as long as the reorder buffer is under its cap. The segment being waited on is
+                # always allowed through, otherwise a full buffer could never drain.
+                while next_submit < segment_count and len(tasks) < concurrency and \
+                        (buffered_bytes < max_buffered_bytes or next_submit == next_write):
+                    tasks[next_submit] = asyncio.ensure_future(fetch(next_submit))
+                    next_submit += 1
+
+                if next_write not in buffered:
+                    done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_COMPLETED)
+                    for index in [index for index, task in tasks.items() if task in done]:
+                        result = tasks.pop(index).result()
+                        buffered[index] = result
+                        buffered_bytes += size_of(result)
+
+                # Hand every segment that is now contiguous to the caller
+                while next_write in buffered:
+                    result = buffered.pop(next_write)
+                    buffered_bytes -= size_of(result)
+                    yield next_write, result
+                    next_write += 1
+        finally:
+            # If the caller stopped early or a segment failed, don't leave requests running in the background
+            for task in tasks.values():
+                task.cancel()
+
+    async def fetch_segments(self, mpd_uri: Union[str, PathSelector], mpd_info: Optional[RhombusMPDInfo],
+                             segment_count: int,
+                             headers: Headers = None, first_index: int = 0,
+                             concurrency: int = DEFAULT_CONCURRENCY,
+                             max_buffered_bytes: int = DEFAULT_MAX_BUFFERED_BYTES,
+                             on_unauthorized: Optional[Callable[[], Any]] = None) -> AsyncIterator[Tuple[int, bytes]]:
+        """Downloads video segments into memory with up to `concurrency` requests in flight and yields them strictly
+        in index order.
+
+        Segments that finish out of order are held in a reorder buffer until every segment before them has been
+        yielded. Once the buffer holds `max_buffered_bytes` no new requests are started, except for the segment that
+        is being waited on, so memory stays bounded even when one slow segment holds up the rest.
+
+        :param mpd_uri: The MPD URI the segments belong to, or a `PathSelector` from `select_path` to download them
+                        over whichever path is fastest
+        :param mpd_info: The parsed MPD document, or None when `mpd_uri` is a `PathSelector`
+        :param segment_count: The total number of segments, including any before `first_index`
+        :param headers: The HTTP Headers to send with our requests
+        :param first_index: The index to start fetching at, used when resuming a partial download
+        :param concurrency: The maximum number of segment requests in flight at once
+        :param max_buffered_bytes: The memory cap in bytes of the reorder buffer
+        :param on_unauthorized: See `get`
+        :return: An async generator of (index, segment bytes) tuples in index order
+        """
+        selector = mpd_uri if isinstance(mpd_uri, PathSelector) else PathSelector(MediaPath(mpd_uri, mpd_info))
+
+        async def fetch(index: int) -> bytes:
+            return await self.__get_segment(selector, index, lambda uri: self.get(uri, headers, on_unauthorized), len,
+                                            lambda: None)
+
+        async for index, content in self.__fetch_in_order(fetch, len, segment_count, first_index, concurrency,
+                                                          max_buffered_bytes):
+            yield index, content
+
+    async def write_segments(self, file: BinaryIO, mpd_uri: Union[str, PathSelector],
+                             mpd_info: Optional[RhombusMPDInfo], segment_count: int,
+                             headers: Headers = None, first_index: int = 0,
+                             concurrency: int = DEFAULT_CONCURRENCY,
+                             max_spooled_bytes: int = DEFAULT_MAX_BUFFERED_BYTES,
+                             on_unauthorized: Optional[Callable[[], Any]] = None,
+                             camera_uuid: Optional[str] = None, start_time: Optional[int] = None
+                             ) -> AsyncIterator[Tuple[int, int, int]]:
+        """Downloads video segments and appends them to `file` strictly in index order, without ever holding a whole
+        segment in memory.
+
+        With a concurrency of 1 each segment is streamed straight into `file`. Otherwise every segment is streamed into
+        an anonymous spool file next to `file` while it downloads, and appended to `file` once every segment before it
+        has been written, using os.sendfile where the platform supports it. `max_spooled_bytes` caps the spool the same
+        way `max_buffered_bytes` caps the reorder buffer of `fetch_segments`.
+
+        If the client has a segment cache and `camera_uuid` and `start_time` are given, segments that are already
+        cached are copied from the cache instead of being downloaded, and downloaded segments are added to it.
+
+        :param file: The binary file to append the segments to
+        :param mpd_uri: See `fetch_segments`. With a `PathSelector` the segments may come from different paths, which
+                        serve the same footage
+        :param mpd_info: See `fetch_segments`
+        :param segment_count: See `fetch_segments`
+        :param headers: See `fetch_segments`
+        :param first_index: See `fetch_segments`
+        :param concurrency: See `fetch_segments`
+        :param max_spooled_bytes: The cap in bytes on segments downloaded ahead of the one being written
+        :param on_unauthorized: See `get`
+        :param camera_uuid: The UUID of the camera the footage is from, used as part of the segment cache key
+        :param start_time: The start time in seconds since epoch that the MPD URI was requested with, used to work out
+                           the absolute start time of each segment for the segment cache key
+        :return: An async generator of (index, offset in `file`, length) tuples, yielded after each segment is written
+        """
+        cache = self.__segment_cache if camera_uuid is not None and start_time is not None else None
+        selector = mpd_uri if isinstance(mpd_uri, PathSelector) else PathSelector(MediaPath(mpd_uri, mpd_info))
+        resolution = selector.current.mpd_info.resolution or UNKNOWN_RESOLUTION
+
+        def segment_start_time(index: int) -> int:
+            return start_time + round(selector.current.mpd_info.get_segment_offset_sec(index))
+
+        def get_to_file(segment_file: BinaryIO, index: int) -> Awaitable[int]:
+            offset = segment_file.tell()
+
+            def discard() -> None:
+                segment_file.seek(offset)
+                segment_file.truncate()
+
+            return self.__get_segment(selector, index,
+                                      lambda uri: self.get_to_file(uri, segment_file, headers, on_unauthorized),
+                                      lambda length: length, discard)
+
+        if concurrency <= 1 and cache is None:
+            for index in range(first_index, segment_count):
+                offset = file.tell()
+                length = await get_to_file(file, index)
+                yield index, offset, length
+            return
+
+        # Spool next to the output so the final copy stays on one filesystem
+        name = getattr(file, "name", None)
+        spool_dir = os.path.dirname(os.path.abspath(name)) if isinstance(name, str) else None
+        spools = set()
+        cached = set()
+
+        async def spool(index: int) -> BinaryIO:
+            if cache is not None:
+                cached_file = cache.open(camera_uuid, segment_start_time(index), resolution)
+                if cached_file is not None:
+                    spools.add(cached_file)
+                    cached.add(cached_file)
+                    cached_file.seek(0, os.SEEK_END)
+                    return cached_file
+
+            spool_file = tempfile.TemporaryFile(dir=spool_dir)
+            spools.add(spool_file)
+            await get_to_file(spool_file, index)
+            spool_file.flush()
+            return spool_file
+
+        try:
+            async for index, spool_file in self.__fetch_in_order(spool, lambda spool_file: spool_file.tell(),
+                                                                 segment_count, first_index, max(1, concurrency),
+                                                                 max_spooled_bytes):
+                offset = file.tell()
+                length = spool_file.tell()
+                _append_file(spool_file, file, length)
+
+                if cache is not None and spool_file not in cached:
+                    with cache.writer(camera_uuid, segment_start_time(index), resolution) as cache_file:
+                        _append_file(spool_file, cache_file, length)
+
+                spools.discard(spool_file)
+                spool_file.close()
+                yield index, offset, length
+
+            if cache is not None:
+                _logger.debug("%d of %d segments of %s came from the segment cache", len(cached),
+                              segment_count - first_index, camera_uuid)
+        finally:
+            # Segments that were downloaded ahead, or were still downloading when we stopped
+            for spool_file in spools:
+                spool_file.close()
+
+    async def download_vod(self, mpd_uri: Union[str, List[str]], path: str, duration_sec: int, headers: Headers = None,
+                           concurrency: int = DEFAULT_CONCURRENCY, camera_uuid: Optional[str] = None,
+                           start_time: Optional[int] = None) -> RhombusMPDInfo:
+        """Downloads a VOD into a single playable mp4 file.
+
+        The MPD document is requested first, which starts the media session, then the init segment and all of the
+        video segments are concatenated into `path`.
+
+        :param mpd_uri: The MPD URI of the VOD, with the start time and duration already filled in. If a list of MPD
+                        URIs of the same VOD is given, usually the LAN and the WAN one, the download uses whichever is
+                        fastest, see `select_path`
+        :param path: The mp4 file to write
+        :param duration_sec: The duration of the VOD in seconds
+        :param headers: The HTTP Headers to send with our requests
+        :param concurrency: The maximum number of segment requests in flight at once
+        :param camera_uuid: See `write_segments`
+        :param start_time: See `write_segments`
+        :return: The parsed MPD document
+        """
+        selector = await self.select_path(mpd_uri if isinstance(mpd_uri, list) else [mpd_uri], headers)
+        mpd_info = selector.current.mpd_info
+
+        with open(path, "wb") as file:
+            # The init segment holds the mp4 headers and has to come first
+            await self.get_to_file(get_segment_uri(selector.current.mpd_uri, mpd_info.init_string), file, headers)
+
+            async for _ in self.write_segments(file, selector, None, mpd_info.get_segment_count(duration_sec),
+                                               headers, concurrency=concurrency, camera_uuid=camera_uuid,
+                                               start_time=start_time):
+                pass
+
+        return mpd_info
+
+
+class MediaClient:
+    """Blocking wrapper around `AsyncMediaClient` for code that is not written with asyncio.
+
+    The wrapper runs its own event loop in a daemon thread and every method blocks until the coroutine it schedules
+    there finishes. One MediaClient should be created at startup and shared, so that all downloads share the same
+    connection pool.
+    """
+
+    client: AsyncMediaClient
+
+    def __init__(self, **kwargs):
+        """Constructor for the blocking media client
+
+        :param kwargs: Passed on to `AsyncMediaClient`
+        """
+        self.client = AsyncMediaClient(**kwargs)
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, name="media-client", daemon=True)
+        self.__thread.start()
+
+    def __enter__(self) -> 'MediaClient':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def run(self, coroutine):
+        """Runs a coroutine on the client's event loop and waits for its result.
+
+        :param coroutine: The coroutine to run, normally one of `self.client`'s methods
+        :return: The result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop).result()
+
+    def get(self, uri: str, headers: Headers = None, on_unauthorized: Optional[Callable[[], Any]] = None) -> bytes:
+        """See `AsyncMediaClient.get`"""
+        return self.run(self.client.get(uri, headers, on_unauthorized))
+
+    def get_mpd_info(self, mpd_uri: str, headers: Headers = None,
+                     on_unauthorized: Optional[Callable[[], Any]] = None) -> RhombusMPDInfo:
+        """See `AsyncMediaClient.get_mpd_info`"""
+        return self.run(self.client.get_mpd_info(mpd_uri, headers, on_unauthorized))
+
+    def select_path(self, mpd_uris: List[str], headers: Headers = None,
+                    on_unauthorized: Optional[Callable[[], Any]] = None) -> PathSelector:
+        """See `AsyncMediaClient.select_path`. The selector keeps being updated on the client's event loop, so it
+        should only be passed on to other calls of this client."""
+        return self.run(self.client.select_path(mpd_uris, headers, on_unauthorized))
+
+    def get_to_file(self, uri: str, file: BinaryIO, headers: Headers = None,
+                    on_unauthorized: Optional[Callable[[], Any]] = None) -> int:
+        """See `AsyncMediaClient.get_to_file`"""
+        return self.run(self.client.get_to_file(uri, file, headers, on_unauthorized))
+
+    def fetch_segments(self, *args, **kwargs) -> Iterator[Tuple[int, bytes]]:
+        """See `AsyncMediaClient.fetch_segments`. Segments keep downloading in the background while the caller
+        handles the ones already yielded."""
+        return self.__iterate(self.client.fetch_segments(*args, **kwargs))
+
+    def write_segments(self, *args, **kwargs) -> Iterator[Tuple[int, int, int]]:
+        """See `AsyncMediaClient.write_segments`. Segments keep downloading in the background while the caller
+        handles the ones already written."""
+        return self.__iterate(self.client.write_segments(*args, **kwargs))
+
+    def __iterate(self, generator: AsyncIterator[T]) -> Iterator[T]:
+        try:
+            while True:
+                try:
+                    yield self.run(generator.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # The caller may only let go of the generator after closing the client, by which point the requests
+            # still in flight have already been cancelled along with the session
+            if self.__loop.is_running():
+                self.run(generator.aclose())
+
+    def restart_media_sessions(self, selector: PathSelector, headers: Headers = None,
+                               on_unauthorized: Optional[Callable[[], Any]] = None) -> RhombusMPDInfo:
+        """See `AsyncMediaClient.restart_media_sessions`"""
+        return self.run(self.client.restart_media_sessions(selector, headers, on_unauthorized))
+
+    def download_vod(self, mpd_uri: Union[str, List[str]], path: str, duration_sec: int, headers: Headers = None,
+                     concurrency: int = DEFAULT_CONCURRENCY, camera_uuid: Optional[str] = None,
+                     start_time: Optional[int] = None) -> RhombusMPDInfo:
+        """See `AsyncMediaClient.download_vod`"""
+        return self.run(self.client.download_vod(mpd_uri, path, duration_sec, headers, concurrency, camera_uuid,
+                                                  start_time))
+
+    def close(self) -> None:
+        """Closes all pooled connections and stops the event loop."""
+        if not self.__loop.is_running():
+            return
+
+        self.run(self.__shutdown())
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
+
+    async def __shutdown(self) -> None:
+        # Cancel any segment requests a caller left running, for example when it stopped reading partway through a
+        # download because writing to disk failed
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        await self.client.close()
@@ -20,35 +20,251 @@
 # SOFTWARE.                                                                       #
 ###################################################################################
 
+import bisect
+import hashlib
 import re
+import threading
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Callable, List, Optional, Pattern, Tuple
+
+# Rhombus segments are 2 seconds long unless the MPD document says otherwise
+DEFAULT_SEGMENT_DURATION_SEC = 2
+
+# How many parsed MPD documents `RhombusMPDInfo.parse` keeps around
+MPD_CACHE_SIZE = 256
+
+# The identifiers of a SegmentTemplate media pattern, $Number$ and $Time$ with an optional printf width like
+# $Number%05d$, and $$ for a literal dollar sign
+_IDENTIFIER_REGEX = re.compile(r"\$(Number|Time)(?:%0(\d+)d)?\$|\$\$")
+
+
+def _compile_pattern(pattern: str) -> Tuple[str, Pattern]:
+    """Compiles a SegmentTemplate media pattern into a str.format string and a regex that matches the segment names.
+
+    :param pattern: The media pattern, for example "seg_$Number$.m4v"
+    :return: The format string taking `number` and `time` keyword arguments, for example "seg_{number}.m4v", and the
+             regex with a named group for each identifier
+    """
+    format_string = ""
+    regex = ""
+    position = 0
+
+    for match in _IDENTIFIER_REGEX.finditer(pattern):
+        literal = pattern[position:match.start()]
+        format_string += literal.replace("{", "{{").replace("}", "}}")
+        regex += re.escape(literal)
+
+        if match.group(0) == "$$":
+            format_string += "$"
+            regex += re.escape("$")
+        else:
+            name = match.group(1).lower()
+            format_string += "{%s:0%sd}" % (name, match.group(2)) if match.group(2) else "{%s}" % name
+            regex += "(?P<%s>[0-9]+)" % name
+
+        position = match.end()
+
+    literal = pattern[position:]
+    return format_string + literal.replace("{", "{{").replace("}", "}}"), re.compile(regex + re.escape(literal))
 
 
 class RhombusMPDInfo:
     """Parses and stores information about a Rhombus MPD document.
 
+    The segment pattern is compiled once when the document is parsed, so generating the name of a segment is a single
+    string format. Use `RhombusMPDInfo.parse` rather than the constructor to also reuse the whole parse for documents
+    that were seen before.
+
     :attribute segment_pattern: The segment pattern where "$Number$" should be replaced with the correct segment index.
                                 For example: seg_$Number$.mp4 at 200 -> seg_200.mp4
     :attribute init_string:     The string that is added to the end of the MPD URI to get the initial MP4 segment.
                                 For example: seg_init.mp4
     :attribute start_index:     The index that the segment should start at. For WAN streams this should be 1
                                 and for LAN streams 0.
+    :attribute resolution:      The resolution of the video representation, for example 1920x1080, or None if the
+                                document does not say.
+    :attribute timescale:       The number of time units per second used by `segment_times` and the "duration"
+                                attribute of the segment template.
+    :attribute segment_times:   The start time of every segment in `timescale` units if the document has a
+                                SegmentTimeline, otherwise None.
+    :attribute segment_duration_sec: The duration of every segment in seconds if the document has no SegmentTimeline,
+                                     either from the "duration" attribute or `DEFAULT_SEGMENT_DURATION_SEC`.
     """
     segment_pattern: str
     init_string: str
     start_index: int
+    resolution: Optional[str]
+    timescale: int
+    segment_times: Optional[List[int]]
+    segment_duration_sec: Optional[float]
+
+    __cache: 'OrderedDict[bytes, RhombusMPDInfo]' = OrderedDict()
+    __cache_lock = threading.Lock()
 
     def __init__(self, raw_doc: str):
         """Parses a raw MPD document from Rhombus.
 
         :param raw_doc: The raw UTF-8 MPD document.
         """
-        raw_doc = re.sub(' xmlns="[^"]+"', '', raw_doc, count=1)
-        tree = ET.ElementTree(ET.fromstring(raw_doc))
+        root = ET.fromstring(raw_doc)
 
-        root = tree.getroot()
+        # Drop the namespace from every tag so that the paths below work with and without one
+        for element in root.iter():
+            if element.tag.startswith("{"):
+                element.tag = element.tag.split("}", 1)[1]
 
         segment_template = root.find("./Period/AdaptationSet/SegmentTemplate")
         self.segment_pattern = segment_template.attrib['media']
         self.init_string = segment_template.attrib['initialization']
-        self.start_index = int(segment_template.attrib['startNumber'])
+        self.start_index = int(segment_template.attrib.get('startNumber', 1))
+        self.timescale = int(segment_template.attrib.get('timescale', 1))
+
+        representation = root.find("./Period/AdaptationSet/Representation")
+        if representation is not None and 'width' in representation.attrib and 'height' in representation.attrib:
+            self.resolution = representation.attrib['width'] + "x" + representation.attrib['height']
+        else:
+            self.resolution = None
+
+        timeline = segment_template.find("./SegmentTimeline")
+        if timeline is not None:
+            self.segment_times = []
+            self.segment_duration_sec = None
+
+            time = 0
+            for entry in timeline.findall("./S"):
+                time = int(entry.attrib.get('t', time))
+                duration = int(entry.attrib['d'])
+
+                # A negative repeat count means "until the next entry", which a single entry covers for our purposes
+                for _ in range(max(0, int(entry.attrib.get('r', 0))) + 1):
+                    self.segment_times.append(time)
+                    time += duration
+        else:
+            self.segment_times = None
+            if 'duration' in segment_template.attrib:
+                self.segment_duration_sec = int(segment_template.attrib['duration']) / self.timescale
+            else:
+                self.segment_duration_sec = DEFAULT_SEGMENT_DURATION_SEC
+
+        self.__format_string, self.__segment_regex = _compile_pattern(self.segment_pattern)
+        self.__get_segment_name = self.get_segment_name_formatter()
+
+    @staticmethod
+    def parse(raw_doc: str) -> 'RhombusMPDInfo':
+        """Parses a raw MPD document from Rhombus, reusing the result if the exact same document was parsed before.
+
+        The returned object is shared between everyone who parsed the same document, so it must not be modified.
+
+        :param raw_doc: The raw UTF-8 MPD document.
+        :return: The parsed MPD document.
+        """
+        key = hashlib.sha1(raw_doc.encode('utf-8')).digest()
+
+        with RhombusMPDInfo.__cache_lock:
+            mpd_info = RhombusMPDInfo.__cache.get(key)
+            if mpd_info is not None:
+                RhombusMPDInfo.__cache.move_to_end(key)
+                return mpd_info
+
+        mpd_info = RhombusMPDInfo(raw_doc)
+
+        with RhombusMPDInfo.__cache_lock:
+            RhombusMPDInfo.__cache[key] = mpd_info
+            while len(RhombusMPDInfo.__cache) > MPD_CACHE_SIZE:
+                RhombusMPDInfo.__cache.popitem(last=False)
+
+        return mpd_info
+
+    def get_segment_time(self, index: int) -> int:
+        """Gets the start time of a segment in `timescale` units.
+
+        :param index: The segment index starting at 0.
+        :return: The start time.
+        """
+        if self.segment_times is not None:
+            return self.segment_times[index]
+        return round(index * self.segment_duration_sec * self.timescale)
+
+    def get_segment_offset_sec(self, index: int) -> float:
+        """Gets how far into the footage a segment starts.
+
+        :param index: The segment index starting at 0.
+        :return: The offset of the start of the segment from the start of the first segment, in seconds.
+        """
+        if self.segment_times is not None:
+            return (self.segment_times[index] - self.segment_times[0]) / self.timescale
+        return index * self.segment_duration_sec
+
+    def get_segment_count(self, duration_sec: float) -> int:
+        """Gets the number of segments in the first `duration_sec` seconds of the footage.
+
+        :param duration_sec: The duration of the footage in seconds.
+        :return: The number of segments, not counting the init segment.
+        """
+        if self.segment_times is not None:
+            if not self.segment_times:
+                return 0
+            end_time = self.segment_times[0] + duration_sec * self.timescale
+            return bisect.bisect_left(self.segment_times, end_time)
+        return int(duration_sec / self.segment_duration_sec)
+
+    def get_segment_name(self, index: int) -> str:
+        """Gets the name of a segment, for example seg_200.mp4.
+
+        :param index: The segment index starting at 0.
+                      NOTE: This function already adds the starting index so always start at 0
+        :return: The segment name.
+        """
+        return self.__get_segment_name(index)
+
+    def get_segment_name_formatter(self, prefix: str = "", suffix: str = "") -> Callable[[int], str]:
+        """Compiles the segment pattern into a function that builds segment names, or whole segment URIs when given the
+        parts of the URI around the name.
+
+        :param prefix: Put in front of every name, for example the MPD URI up to its file name.
+        :param suffix: Put after every name, for example the query string of the MPD URI.
+        :return: A function taking the segment index starting at 0, like `get_segment_name`.
+        """
+        format_string = prefix.replace("{", "{{").replace("}", "}}") + self.__format_string + \
+            suffix.replace("{", "{{").replace("}", "}}")
+        format_name = format_string.format
+        start_index = self.start_index
+
+        if "time" in self.__segment_regex.groupindex:
+            return lambda index: format_name(number=index + start_index, time=self.get_segment_time(index))
+
+        if self.__format_string.count("{number}") == 1 and "{{" not in self.__format_string and \
+                "}}" not in self.__format_string:
+            # The usual seg_$Number$.m4v pattern is just a concatenation, which is cheaper than a format
+            before, after = self.__format_string.split("{number}")
+            before = prefix + before
+            after = after + suffix
+            return lambda index: before + str(index + start_index) + after
+
+        return lambda index: format_name(number=index + start_index)
+
+    def get_segment_number(self, segment_name: str) -> Optional[int]:
+        """Gets the number of a segment, including the start index, from its name. This is the reverse of
+        `get_segment_name` plus the start index.
+
+        :param segment_name: The segment name, for example seg_200.mp4.
+        :return: The segment number, or None if `segment_name` does not match the segment pattern.
+        """
+        match = self.__segment_regex.fullmatch(segment_name)
+        if match is None:
+            return None
+
+        groups = match.groupdict()
+        if "number" in groups:
+            return int(groups["number"])
+
+        # Patterns that only have the time need the timeline to find the number
+        time = int(groups["time"])
+        if self.segment_times is not None:
+            index = bisect.bisect_left(self.segment_times, time)
+            if index == len(self.segment_times) or self.segment_times[index] != time:
+                return None
+        else:
+            index = round(time / (self.segment_duration_sec * self.timescale))
+        return index + self.start_index
@@ -0,0 +1,212 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 #
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 #
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 #
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+from typing import List, Optional
+
+import rhombus_logging
+from rhombus_mpd_info import RhombusMPDInfo
+
+_logger = rhombus_logging.get_logger("rhombus.PathSelector")
+
+# How many segments are downloaded over every path before the selector trusts its throughput measurements
+PROBE_SEGMENTS = 2
+
+# Every this many segments one is downloaded over a path that is not in use, so that its measurement does not go stale.
+# A path whose request failed also sits out this many segments before it is tried again.
+REPROBE_INTERVAL = 30
+
+# A path is given up on after this many of its requests fail in a row
+MAX_CONSECUTIVE_FAILURES = 3
+
+# Another path has to be this many times faster than the current one before the selector switches to it
+SWITCH_RATIO = 1.5
+
+# How much the newest segment counts towards the moving average throughput of a path
+THROUGHPUT_WEIGHT = 0.3
+
+
+class MediaPath:
+    """One of the ways to reach the same media, for example the LAN or the WAN MPD URI of a camera.
+
+    :attribute mpd_uri: The MPD URI of this path
+    :attribute mpd_info: The parsed MPD document retrieved over this path
+    :attribute mpd_doc: The raw MPD document retrieved over this path, if it was kept
+    :attribute throughput: The moving average throughput in bytes per second of a single segment request, or None if
+                           nothing has been downloaded over this path yet
+    :attribute samples: The number of segments downloaded over this path
+    :attribute pending: The number of segment requests currently in flight over this path
+    :attribute failures: The number of requests over this path that failed in a row since the last one that succeeded
+    :attribute retry_after: The number of segments the selector has to have chosen a path for before this path is
+                            used again, after one of its requests failed
+    :attribute failed: Whether `MAX_CONSECUTIVE_FAILURES` requests over this path failed in a row, after which the path
+                       is not used again
+    """
+    mpd_uri: str
+    mpd_info: RhombusMPDInfo
+    mpd_doc: Optional[str]
+    throughput: Optional[float]
+    samples: int
+    pending: int
+    failures: int
+    retry_after: int
+    failed: bool
+
+    def __init__(self, mpd_uri: str, mpd_info: RhombusMPDInfo, mpd_doc: Optional[str] = None):
+        """Constructor for a media path
+
+        :param mpd_uri: The MPD URI of this path
+        :param mpd_info: The parsed MPD document retrieved over this path
+        :param mpd_doc: The raw MPD document retrieved over this path
+        """
+        self.mpd_uri = mpd_uri
+        self.mpd_info = mpd_info
+        self.mpd_doc = mpd_doc
+        self.throughput = None
+        self.samples = 0
+        self.pending = 0
+        self.failures = 0
+        self.retry_after = 0
+        self.failed = False
+
+
+class PathSelector:
+    """Spreads the segment requests of a download over several paths to the same media and keeps it on the fastest.
+
+    The selector starts out on the path whose MPD document arrived first. The first `PROBE_SEGMENTS` segments of every
+    path are used to measure its throughput, after which the download moves to the fastest path. The selector keeps
+    measuring as the download goes on, and switches again if the current path slows down enough that another one is
+    `SWITCH_RATIO` times faster, or if a request over it fails. A path whose request failed sits out the next
+    `REPROBE_INTERVAL` segments and is then tried again, and is only given up on once `MAX_CONSECUTIVE_FAILURES` of its
+    requests fail in a row, so a single dropped connection does not lose the fastest path for the rest of the download.
+
+    A selector is not thread safe, it is meant to be used from the event loop that runs the download.
+
+    :attribute paths: Every path that answered, in the order they answered
+    :attribute current: The path most segments are downloaded over
+    """
+    paths: List[MediaPath]
+    current: MediaPath
+
+    def __init__(self, path: MediaPath):
+        """Constructor for the path selector
+
+        :param path: The first path, usually the one that answered first
+        """
+        self.paths = [path]
+        self.current = path
+        self.__chosen = 0
+
+    def add_path(self, path: MediaPath) -> None:
+        """Adds another path, for example once a slower path has answered as well.
+
+        :param path: The path to add
+        """
+        self.paths.append(path)
+
+    def choose(self) -> MediaPath:
+        """Chooses the path to download the next segment over. Every call must be followed by a call to either
+        `record_success` or `record_failure` for the returned path.
+
+        :return: The path to use
+        """
+        usable = self.__usable()
+        self.__chosen += 1
+
+        # Measure every path over its first few segments
+        probing = [path for path in usable if path.samples + path.pending < PROBE_SEGMENTS]
+        if probing:
+            path = min(probing, key=lambda probe: probe.samples + probe.pending)
+        elif self.__chosen % REPROBE_INTERVAL == 0 and len(usable) > 1:
+            # Keep the measurement of the other paths fresh, starting with the least measured one
+            path = min((path for path in usable if path is not self.current), key=lambda other: other.samples)
+        else:
+            path = self.current
+
+        path.pending += 1
+        return path
+
+    def record_success(self, path: MediaPath, byte_count: int, elapsed_sec: float) -> None:
+        """Records a segment that was downloaded over a path, and switches paths if another one has become faster.
+
+        :param path: The path from `choose`
+        :param byte_count: The size of the segment
+        :param elapsed_sec: How long the segment took to download
+        """
+        path.pending -= 1
+        path.samples += 1
+        path.failures = 0
+
+        throughput = byte_count / max(elapsed_sec, 1e-6)
+        if path.throughput is None:
+            path.throughput = throughput
+        else:
+            path.throughput = THROUGHPUT_WEIGHT * throughput + (1 - THROUGHPUT_WEIGHT) * path.throughput
+
+        # Don't compare paths until every one of them has been measured
+        usable = self.__usable()
+        if any(path.samples < PROBE_SEGMENTS for path in usable):
+            return
+
+        fastest = max(usable, key=lambda other: other.throughput)
+        if fastest is not self.current and fastest.throughput > self.current.throughput * SWITCH_RATIO:
+            _logger.info("Switching from %s (%.0f KB/s) to %s (%.0f KB/s)", self.current.mpd_uri,
+                         self.current.throughput / 1024, fastest.mpd_uri, fastest.throughput / 1024)
+            self.current = fastest
+
+    def record_failure(self, path: MediaPath) -> bool:
+        """Records a segment request over a path that failed. The path sits out the next `REPROBE_INTERVAL` segments,
+        or is not used again once `MAX_CONSECUTIVE_FAILURES` of its requests have failed in a row. If it was the current
+        path the selector moves to the fastest other one.
+
+        :param path: The path from `choose`
+        :return: Whether there is a path left to retry the segment over, which can be the same path if it is the only
+                 one and has not been given up on yet
+        """
+        path.pending -= 1
+        path.failures += 1
+
+        if path.failures >= MAX_CONSECUTIVE_FAILURES:
+            path.failed = True
+            _logger.warning("%s failed %d times in a row, not using it again", path.mpd_uri, path.failures)
+        else:
+            path.retry_after = self.__chosen + REPROBE_INTERVAL
+
+        usable = self.__usable()
+        if not usable:
+            return False
+
+        if path is self.current and usable != [path]:
+            # Paths that have not been measured yet count as the slowest
+            self.current = max((other for other in usable if other is not path), key=lambda other: other.throughput or 0)
+            _logger.warning("%s stopped answering, switching to %s", path.mpd_uri, self.current.mpd_uri)
+
+        return True
+
+    def __usable(self) -> List[MediaPath]:
+        """Gets the paths that can be used for the next segment.
+
+        :return: The paths that have not been given up on and are not sitting out after a failure, or if every one of
+                 them is sitting out, the ones that have not been given up on
+        """
+        alive = [path for path in self.paths if not path.failed]
+        ready = [path for path in alive if path.retry_after <= self.__chosen]
+        return ready if ready else alive
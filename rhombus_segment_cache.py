@@ -0,0 +1,170 @@
+###################################################################################
+# Copyright (c) 2021 Rhombus Systems                                              #
+#                                                                                 #
+# Permission is hereby granted, free of charge, to any person obtaining a copy    #
+# of this software and associated documentation files (the "Software"), to deal   #
+# in the Software without restriction, including without limitation the rights    #
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell       #
+# copies of the Software, and to permit persons to whom the Software is           #
+# furnished to do so, subject to the following conditions:                        #
+#                                                                                 #
+# The above copyright notice and this permission notice shall be included in all  #
+# copies or substantial portions of the Software.                                 #
+#                                                                                 #
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR      #
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,        #
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE     #
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER          #
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,   #
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE   #
+# SOFTWARE.                                                                       #
+###################################################################################
+
+import contextlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Iterator, Optional
+
+import rhombus_logging
+
+_logger = rhombus_logging.get_logger("rhombus.SegmentCache")
+
+# Cached segments are stored as <directory>/<camera uuid>/<resolution>/<absolute start time>.m4v
+SEGMENT_FILE_ENDING = ".m4v"
+
+# Temporary files older than this are left over from a process that died while writing a segment. Younger ones may
+# still be being written by another process sharing the directory, so they are left alone.
+STALE_TEMP_FILE_SECONDS = 10 * 60
+
+
+class SegmentCache:
+    """On-disk cache of video segments, keyed by camera UUID, absolute segment start time and resolution.
+
+    Rhombus cameras cut footage into 2 second segments, so two downloads of overlapping windows of the same camera
+    share the segments that cover the overlap. The cache stores each segment once and evicts the least recently used
+    segments when it grows past its size cap.
+
+    Segments are written to a temporary file and renamed into place once complete, so several processes can share one
+    cache directory. Each process only learns about segments added by the others when it is created.
+
+    :attribute directory: The directory the segments are stored in
+    :attribute max_bytes: The size cap of the cache in bytes
+    """
+
+    directory: str
+    max_bytes: int
+
+    def __init__(self, directory: str, max_bytes: int):
+        """Constructor for the segment cache, which indexes any segments already in `directory`
+
+        :param directory: The directory to store the segments in. It is created if it does not exist.
+        :param max_bytes: The size cap of the cache in bytes
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__entries: 'OrderedDict[str, int]' = OrderedDict()
+        self.__total_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self.__load()
+
+    def __load(self) -> None:
+        # Segments are touched whenever they are read, so their modification time orders them from least to most
+        # recently used
+        found = []
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                with contextlib.suppress(OSError):
+                    stat = os.stat(path)
+                    if name.endswith(SEGMENT_FILE_ENDING):
+                        found.append((stat.st_mtime, path, stat.st_size))
+                    elif now - stat.st_mtime > STALE_TEMP_FILE_SECONDS:
+                        # Left over from a process that died while writing a segment
+                        os.remove(path)
+
+        for _, path, size in sorted(found):
+            self.__entries[path] = size
+            self.__total_bytes += size
+
+        _logger.debug("Loaded %d cached segments (%d bytes) from %s", len(self.__entries), self.__total_bytes,
+                      self.directory)
+        self.__evict()
+
+    def __path(self, camera_uuid: str, start_time: int, resolution: str) -> str:
+        return os.path.join(self.directory, camera_uuid, resolution, str(start_time) + SEGMENT_FILE_ENDING)
+
+    def open(self, camera_uuid: str, start_time: int, resolution: str) -> Optional[BinaryIO]:
+        """Opens a cached segment for reading.
+
+        :param camera_uuid: The UUID of the camera the segment is from
+        :param start_time: The absolute start time of the segment in seconds since epoch
+        :param resolution: The resolution of the footage the segment is from, for example "1920x1080"
+        :return: The open segment file, or None if the segment is not cached
+        """
+        path = self.__path(camera_uuid, start_time, resolution)
+
+        with self.__lock:
+            if path not in self.__entries:
+                return None
+            self.__entries.move_to_end(path)
+
+        try:
+            file = open(path, "rb")
+            os.utime(path)
+            return file
+        except FileNotFoundError:
+            # Evicted by another process sharing the directory
+            with self.__lock:
+                self.__total_bytes -= self.__entries.pop(path, 0)
+            return None
+
+    @contextlib.contextmanager
+    def writer(self, camera_uuid: str, start_time: int, resolution: str) -> Iterator[BinaryIO]:
+        """Adds a segment to the cache. The segment is written to the yielded file and only becomes visible in the cache
+        once the with block finishes without an error. If the segment can't be moved into place afterwards, for example
+        because another process removed the temporary file, it is simply not cached.
+
+        :param camera_uuid: See `open`
+        :param start_time: See `open`
+        :param resolution: See `open`
+        :return: A context manager yielding the file to write the segment to
+        """
+        path = self.__path(camera_uuid, start_time, resolution)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        file = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False)
+        try:
+            with file:
+                yield file
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(file.name)
+            raise
+
+        try:
+            os.replace(file.name, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            # The segment was still downloaded fine, it just won't be in the cache next time
+            _logger.debug("Could not add segment %s to the cache: %s", path, e)
+            with contextlib.suppress(OSError):
+                os.remove(file.name)
+            return
+
+        with self.__lock:
+            self.__total_bytes += size - self.__entries.pop(path, 0)
+            self.__entries[path] = size
+            self.__evict()
+
+    def __evict(self) -> None:
+        while self.__total_bytes > self.max_bytes and len(self.__entries) > 0:
+            path, size = self.__entries.popitem(last=False)
+            self.__total_bytes -= size
+            with contextlib.suppress(OSError):
+                os.remove(path)
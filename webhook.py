@@ -39,14 +39,14 @@ import argparse
 from threading import Timer
 
 import rhombus_logging
-from copy_footage_to_local_storage import get_segment_uri, get_segment_uri_index
-from rhombus_mpd_info import RhombusMPDInfo
+from rhombus_media_client import MediaClient
 
 app = Flask(__name__)
 
 API_URL = "https://api2.rhombussystems.com"
 tunnel_url: str | None
 sess: requests.session = requests.session()
+media_client: MediaClient = MediaClient(verify_ssl=False)
 output: str | None
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -151,34 +151,10 @@ def root():
 
     mpd_uri = "https://media.rhombussystems.com/media/metadata/" + device_uuid + "/" + location + "/" + alert_uuid + "/clip.mpd"
     LOGGER.debug("MPD URI %s", mpd_uri)
-    r = sess.get(mpd_uri)
-
-    rhombus_mpd_info = RhombusMPDInfo(str(r.content, 'utf-8'))
 
     out = Path(output, summary + "_" + alert_uuid + ".mp4")
 
-    with open(out, "wb") as output_fp:
-        init_seg_uri = get_segment_uri(mpd_uri, rhombus_mpd_info.init_string)
-        LOGGER.debug("Init segment uri: %s", init_seg_uri)
-
-        r = sess.get(init_seg_uri)
-        LOGGER.debug("seg_init_resp: %s", r)
-
-        output_fp.write(r.content)
-        output_fp.flush()
-
-        for cur_seg in range(int(duration_sec / 2)):
-            seg_uri = get_segment_uri_index(rhombus_mpd_info, mpd_uri,
-                                            cur_seg)
-            LOGGER.debug("Segment uri: %s", seg_uri)
-
-            seg_resp = sess.get(seg_uri)
-            LOGGER.debug("seg_resp: %s", seg_resp)
-
-            output_fp.write(seg_resp.content)
-            output_fp.flush()
-
-        output_fp.close()
+    media_client.download_vod(mpd_uri, str(out), duration_sec, dict(sess.headers))
 
     return "success"
 